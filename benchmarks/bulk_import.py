@@ -0,0 +1,90 @@
+"""Migrating a library: one create call per character vs. one NDJSON import.
+
+python benchmarks/bulk_import.py --characters 2000 --latency 0.002
+
+Both run in-process against the in-memory collections with a simulated
+round trip per operation. The export is read back and imported again to
+check that a backup restores without errors (every id already exists, so
+every line must be reported as a duplicate).
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORY_PROVIDER"] = "fake"
+os.environ["FAKE_PROVIDER_ENABLED"] = "true"
+
+import httpx  # noqa: E402
+
+from fakes import install_fake_collections  # noqa: E402
+
+mongodb = install_fake_collections()
+
+import main  # noqa: E402
+import serialization  # noqa: E402
+
+
+def character(index: int) -> dict:
+    return {
+        "name": f"Kind {index}",
+        "age": 3 + index % 8,
+        "gender": "weiblich" if index % 2 else "männlich",
+        "personality_traits": ["fröhlich", "neugierig"],
+        "interests": ["Turnen"],
+    }
+
+
+async def run(args):
+    mongodb.characters.latency = args.latency
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        mongodb.characters.calls.clear()
+        start = time.perf_counter()
+        for index in range(args.characters):
+            response = await client.post(
+                "/api/characters/create", json=character(index)
+            )
+            response.raise_for_status()
+        one_by_one = time.perf_counter() - start
+        one_by_one_calls = sum(mongodb.characters.calls.values())
+
+        mongodb.characters.documents.clear()
+        mongodb.characters.calls.clear()
+        body = b"\n".join(
+            serialization.dumps(character(index)) for index in range(args.characters)
+        )
+        start = time.perf_counter()
+        response = await client.post("/api/import/characters", content=body)
+        imported = time.perf_counter() - start
+        report = response.json()
+        assert report["inserted"] == args.characters, report
+        import_calls = sum(mongodb.characters.calls.values())
+
+        start = time.perf_counter()
+        export = await client.get("/api/export/characters")
+        exported = time.perf_counter() - start
+        restore = (
+            await client.post("/api/import/characters", content=export.content)
+        ).json()
+        assert restore["inserted"] == 0 and restore["failed"] == args.characters
+
+    print(
+        f"{args.characters} characters, {args.latency * 1000:.1f} ms per round trip\n"
+    )
+    print(f"{'path':<12} {'seconds':>8} {'round trips':>12}")
+    print(f"{'create':<12} {one_by_one:>8.2f} {one_by_one_calls:>12}")
+    print(f"{'import':<12} {imported:>8.2f} {import_calls:>12}")
+    print(f"{'export':<12} {exported:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--characters", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.002)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""Count MongoDB round trips per endpoint against in-memory collections.
+
+python benchmarks/db_calls.py
+"""
+
+import asyncio
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORY_PROVIDER"] = "fake"
+os.environ["FAKE_PROVIDER_ENABLED"] = "true"
+
+import httpx  # noqa: E402
+
+from fakes import install_fake_collections  # noqa: E402
+
+mongodb = install_fake_collections()
+
+import main  # noqa: E402
+
+CHARACTER = {
+    "name": "Vinca",
+    "age": 6,
+    "gender": "weiblich",
+    "personality_traits": ["fröhlich", "spontan"],
+    "interests": ["Turnen"],
+}
+CREATURE = {
+    "name": "Drago",
+    "gender": "männlich",
+    "looks_like": "Drache",
+    "interests": ["Feuer speien"],
+    "personality_traits": ["fröhlich", "positiv"],
+}
+
+
+def total_calls():
+    calls = Counter()
+    for name in ("characters", "creatures", "stories"):
+        calls.update(getattr(mongodb, name).calls)
+    return calls
+
+
+async def measure(label, request):
+    before = total_calls()
+    response = await request
+    calls = total_calls() - before
+    detail = ", ".join(f"{name}={count}" for name, count in sorted(calls.items()))
+    print(f"{label:<28} {sum(calls.values()):>2} calls  ({detail})")
+    return response
+
+
+async def run():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        new_character = (
+            await measure(
+                "create character", c.post("/api/characters/create", json=CHARACTER)
+            )
+        ).json()
+        new_creature = (
+            await measure(
+                "create creature", c.post("/api/creatures/create", json=CREATURE)
+            )
+        ).json()
+        story_request = {
+            "characters": [new_character],
+            "creatures": [new_creature],
+            "location": "Piratenschiff",
+            "educational_topic": "Mut",
+            "age_group": "Kinder",
+        }
+        new_story = (
+            await measure(
+                "generate story", c.post("/api/stories/generate", json=story_request)
+            )
+        ).json()
+        await measure("list characters", c.get("/api/characters"))
+        await measure("metadata", c.get("/api/metadata"))
+        await measure(
+            "delete story",
+            c.delete("/api/stories/delete", params={"story_id": new_story["id"]}),
+        )
+        await measure(
+            "delete creature",
+            c.delete(
+                "/api/creatures/delete", params={"creature_id": new_creature["id"]}
+            ),
+        )
+        await measure(
+            "delete character",
+            c.delete(
+                "/api/characters/delete", params={"character_id": new_character["id"]}
+            ),
+        )
+        await measure(
+            "delete unknown character",
+            c.delete("/api/characters/delete", params={"character_id": "unknown"}),
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
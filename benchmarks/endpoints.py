@@ -0,0 +1,376 @@
+"""Throughput and p50/p95/p99 latency for every endpoint, fully offline.
+
+The app runs in-process against the in-memory collections from fakes.py
+(with a simulated round trip per operation) and the fake LLM provider.
+Results can be written as JSON and compared against an earlier run:
+
+    python benchmarks/endpoints.py --requests 200 --concurrency 16 --output new.json
+    python benchmarks/endpoints.py --scenarios generate_story,metadata
+    python benchmarks/endpoints.py --compare old.json new.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORY_PROVIDER"] = "fake"
+os.environ["FAKE_PROVIDER_ENABLED"] = "true"
+# All requests come from one client, the per-client limit would reject them
+os.environ.setdefault("CLIENT_GENERATIONS_PER_MINUTE", "0")
+# The batch rate limit protects the real provider, not the fake one
+os.environ.setdefault("BATCH_RATE_PER_SECOND", "100000")
+
+import httpx  # noqa: E402
+
+from fakes import install_fake_collections  # noqa: E402
+
+mongodb = install_fake_collections()
+
+import character  # noqa: E402
+import creature  # noqa: E402
+import main  # noqa: E402
+import story  # noqa: E402
+
+CHARACTER = {
+    "name": "Vinca",
+    "age": 6,
+    "gender": "weiblich",
+    "personality_traits": ["fröhlich", "spontan"],
+    "interests": ["Turnen"],
+}
+CREATURE = {
+    "name": "Drago",
+    "gender": "männlich",
+    "looks_like": "Drache",
+    "interests": ["Feuer speien"],
+    "personality_traits": ["fröhlich", "positiv"],
+}
+
+
+def story_request(index: int) -> dict:
+    # A different location per request, so single-flight does not merge them
+    return {
+        "characters": [CHARACTER],
+        "creatures": [CREATURE],
+        "location": f"{random.choice(main.LOCATIONS)} {index}",
+        "educational_topic": random.choice(main.EDUCATIONAL_TOPICS),
+        "age_group": "Kinder",
+    }
+
+
+def story_text(index: int) -> str:
+    return (
+        f"Es war einmal Vinca, die mit Drago, dem Drachen, Geschichte {index} "
+        "erlebte. Sie lernten, dass Mut bedeutet, trotz Angst weiterzugehen. "
+    ) * 20
+
+
+@dataclass
+class Scenario:
+    name: str
+    call: Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+    # Prepares data for ``requests`` calls, e.g. documents to delete
+    setup: Optional[Callable[[int], Awaitable[None]]] = None
+
+
+_ids: Dict[str, List[str]] = {}
+
+
+def _deletes(model, path: str, parameter: str, make):
+    async def setup(requests: int):
+        documents = await model.create_many([make(i) for i in range(requests)])
+        _ids[path] = [document.id for document in documents]
+
+    def call(client, index):
+        return client.delete(path, params={parameter: _ids[path][index]})
+
+    return setup, call
+
+
+def _get_story():
+    # Reopening the same few stories, as a reader does
+    async def setup(requests: int):
+        documents = await story.Story.create_many(
+            [story.Story(text=story_text(i)) for i in range(10)]
+        )
+        _ids["get_story"] = [document.id for document in documents]
+
+    def call(client, index):
+        story_ids = _ids["get_story"]
+        return client.get(f"/api/stories/{story_ids[index % len(story_ids)]}")
+
+    return call, setup
+
+
+async def _job(client: httpx.AsyncClient, index: int) -> httpx.Response:
+    response = await client.post("/api/stories/jobs", json=story_request(index))
+    if response.status_code != 202:
+        return response
+    return await client.get(
+        f"/api/stories/jobs/{response.json()['id']}", params={"wait": 30}
+    )
+
+
+def scenarios() -> List[Scenario]:
+    delete_character = _deletes(
+        character.Character,
+        "/api/characters/delete",
+        "character_id",
+        lambda i: character.Character(**CHARACTER),
+    )
+    delete_creature = _deletes(
+        creature.Creature,
+        "/api/creatures/delete",
+        "creature_id",
+        lambda i: creature.Creature(**CREATURE),
+    )
+    delete_story = _deletes(
+        story.Story,
+        "/api/stories/delete",
+        "story_id",
+        lambda i: story.Story(text=story_text(i)),
+    )
+    return [
+        Scenario("healthz", lambda c, i: c.get("/healthz")),
+        Scenario(
+            "create_character",
+            lambda c, i: c.post("/api/characters/create", json=CHARACTER),
+        ),
+        Scenario("list_characters", lambda c, i: c.get("/api/characters")),
+        Scenario(
+            "list_characters_page",
+            lambda c, i: c.get("/api/characters", params={"limit": 20}),
+        ),
+        Scenario("delete_character", delete_character[1], delete_character[0]),
+        Scenario(
+            "create_creature",
+            lambda c, i: c.post("/api/creatures/create", json=CREATURE),
+        ),
+        Scenario("list_creatures", lambda c, i: c.get("/api/creatures")),
+        Scenario("delete_creature", delete_creature[1], delete_creature[0]),
+        Scenario(
+            "create_story",
+            lambda c, i: c.post("/api/stories/create", json={"text": story_text(i)}),
+        ),
+        Scenario("list_stories", lambda c, i: c.get("/api/stories")),
+        Scenario(
+            "list_stories_page",
+            lambda c, i: c.get("/api/stories", params={"limit": 30}),
+        ),
+        Scenario(
+            "list_stories_summary",
+            lambda c, i: c.get("/api/stories", params={"summary": True}),
+        ),
+        Scenario("list_stories_sorted", lambda c, i: c.get("/api/stories/sorted")),
+        Scenario(
+            "search_stories",
+            lambda c, i: c.get("/api/stories/search", params={"q": "Drache Mut"}),
+        ),
+        Scenario("get_story", *_get_story()),
+        Scenario("delete_story", delete_story[1], delete_story[0]),
+        Scenario("metadata", lambda c, i: c.get("/api/metadata")),
+        Scenario(
+            "generate_story",
+            lambda c, i: c.post("/api/stories/generate", json=story_request(i)),
+        ),
+        Scenario(
+            "generate_stream",
+            lambda c, i: c.post("/api/stories/generate/stream", json=story_request(i)),
+        ),
+        Scenario(
+            "generate_batch_10",
+            lambda c, i: c.post(
+                "/api/stories/generate/batch",
+                json=[story_request(i * 10 + j) for j in range(10)],
+            ),
+        ),
+        Scenario("story_job", _job),
+        Scenario("metrics", lambda c, i: c.get("/metrics")),
+    ]
+
+
+def percentile(samples: List[float], percent: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+async def run_scenario(client, scenario: Scenario, requests: int, concurrency: int):
+    if scenario.setup:
+        await scenario.setup(requests)
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            response = await scenario.call(client, index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    seconds = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(seconds, 4),
+        "throughput_rps": round(requests / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(max(latencies) * 1000, 3),
+    }
+
+
+async def seed(stories: int):
+    await character.Character.create_many(
+        [character.Character(**CHARACTER) for _ in range(20)]
+    )
+    await creature.Creature.create_many(
+        [creature.Creature(**CREATURE) for _ in range(20)]
+    )
+    await story.Story.create_many(
+        [
+            story.Story(
+                text=story_text(i),
+                request=story.StoryRequest(**story_request(i)),
+            )
+            for i in range(stories)
+        ]
+    )
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict):
+    print(
+        f"{'scenario':<22} {'req':>5} {'err':>4} {'rps':>9} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    )
+    for name, result in results.items():
+        print(
+            f"{name:<22} {result['requests']:>5} {result['errors']:>4} "
+            f"{result['throughput_rps']:>9.1f} {result['p50_ms']:>9.2f} "
+            f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+        )
+
+
+def compare(base_path: str, new_path: str):
+    with open(base_path) as base_file, open(new_path) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+    print(
+        f"{base['meta'].get('git_revision')} -> {new['meta'].get('git_revision')}\n"
+        f"{'scenario':<22} {'rps':>16} {'p95 ms':>22}"
+    )
+    for name, result in new["results"].items():
+        if name not in base["results"]:
+            continue
+        before = base["results"][name]
+
+        def change(key):
+            if not before[key]:
+                return "     n/a"
+            return f"{(result[key] - before[key]) / before[key] * 100:+7.1f}%"
+
+        print(
+            f"{name:<22} {result['throughput_rps']:>8.1f} {change('throughput_rps')} "
+            f"{result['p95_ms']:>13.2f} {change('p95_ms')}"
+        )
+
+
+async def run(args):
+    random.seed(args.seed)
+    for collection in (mongodb.characters, mongodb.creatures, mongodb.stories):
+        collection.latency = args.mongo_latency_ms / 1000
+    main.story_providers.get("fake").latency = args.generation_seconds
+    await seed(args.stories)
+
+    selected = [
+        scenario
+        for scenario in scenarios()
+        if not args.scenarios or scenario.name in args.scenarios.split(",")
+    ]
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=60
+    ) as client:
+        for scenario in selected:
+            results[scenario.name] = await run_scenario(
+                client, scenario, args.requests, args.concurrency
+            )
+    await main.story_jobs.stop()
+
+    print_results(results)
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "git_revision": git_revision(),
+                "python": platform.python_version(),
+                "parameters": vars(args),
+            },
+            "results": results,
+        }
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--generation-seconds",
+        type=float,
+        default=0.05,
+        help="latency of the fake LLM provider",
+    )
+    parser.add_argument(
+        "--mongo-latency-ms",
+        type=float,
+        default=0.5,
+        help="simulated round trip per database operation",
+    )
+    parser.add_argument("--stories", type=int, default=200, help="stories to seed")
+    parser.add_argument("--scenarios", help="comma separated subset to run")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument(
+        "--compare",
+        nargs=2,
+        metavar=("BASE", "NEW"),
+        help="compare two saved result files instead of running",
+    )
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        asyncio.run(run(args))
@@ -0,0 +1,318 @@
+"""In-memory stand-ins for Motor collections used by the benchmark scripts."""
+
+import asyncio
+import copy
+import os
+from collections import Counter
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+_OPERATORS = {
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$exists": lambda value, operand: (value is not None) == operand,
+}
+
+
+def _get(document, path):
+    for part in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+def matches(document, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(document, option) for option in condition):
+                return False
+            continue
+        value = _get(document, key)
+        if (
+            isinstance(condition, dict)
+            and condition
+            and all(operator in _OPERATORS for operator in condition)
+        ):
+            if not all(
+                _OPERATORS[operator](value, operand)
+                for operator, operand in condition.items()
+            ):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _include(document, path):
+    """Copy of ``document`` with only ``path``, descending into lists"""
+    head, _, rest = path.partition(".")
+    if isinstance(document, list):
+        return [_include(item, path) for item in document if isinstance(item, dict)]
+    if not isinstance(document, dict) or head not in document:
+        return None
+    if not rest:
+        return {head: document[head]}
+    included = _include(document[head], rest)
+    return None if included is None else {head: included}
+
+
+def _merge(target, source):
+    for key, value in source.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        elif isinstance(value, list) and isinstance(target.get(key), list):
+            for item, other in zip(target[key], value):
+                _merge(item, other)
+        else:
+            target[key] = value
+
+
+def project(document, projection):
+    """Apply inclusion/exclusion projections with dotted paths and $slice"""
+    if not projection:
+        return document
+    fields = {
+        key: value
+        for key, value in projection.items()
+        if key != "_id" and not isinstance(value, dict)
+    }
+    if fields and all(fields.values()):
+        projected = {"_id": document["_id"]} if projection.get("_id", 1) else {}
+        for path in fields:
+            if (included := _include(document, path)) is not None:
+                _merge(projected, included)
+    else:
+        projected = dict(document)
+        for key, value in projection.items():
+            if value == 0 and "." not in key:
+                projected.pop(key, None)
+    for key, value in projection.items():
+        if isinstance(value, dict) and "$slice" in value and key in projected:
+            projected[key] = projected[key][: value["$slice"]]
+    return projected
+
+
+class FakeCursor:
+    def __init__(self, documents, latency=0.0, projection=None):
+        self._documents = documents
+        self._latency = latency
+        self._projection = projection
+
+    def sort(self, key, direction=1):
+        self._documents.sort(key=lambda doc: _get(doc, key), reverse=direction < 0)
+        return self
+
+    def limit(self, count):
+        if count:
+            self._documents = self._documents[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        for document in self._documents:
+            yield copy.deepcopy(project(document, self._projection))
+
+    async def to_list(self, length=None):
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        return [
+            copy.deepcopy(project(doc, self._projection))
+            for doc in self._documents[:length]
+        ]
+
+
+class FakeCollection:
+    """Supports equality and simple comparison queries and plain projections"""
+
+    def __init__(self, name="collection", latency=0.0):
+        self.name = name
+        self.documents = []
+        # Number of calls per collection method, i.e. database round trips
+        self.calls = Counter()
+        # Simulated network round trip in seconds
+        self.latency = latency
+        # Fields with a unique index, see create_index
+        self.unique = set()
+
+    async def _round_trip(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _duplicate(self, document):
+        for field in self.unique:
+            value = document.get(field)
+            if any(existing.get(field) == value for existing in self.documents):
+                return f"E11000 duplicate key error {self.name} {field}: {value!r}"
+        return None
+
+    async def insert_one(self, document):
+        await self._round_trip("insert_one")
+        if error := self._duplicate(document):
+            raise DuplicateKeyError(error, 11000)
+        document.setdefault("_id", ObjectId())
+        self.documents.append(copy.deepcopy(document))
+        return SimpleNamespace(acknowledged=True, inserted_id=document["_id"])
+
+    async def insert_many(self, documents, ordered=True):
+        await self._round_trip("insert_many")
+        write_errors = []
+        for index, document in enumerate(documents):
+            if error := self._duplicate(document):
+                write_errors.append({"index": index, "code": 11000, "errmsg": error})
+                if ordered:
+                    break
+                continue
+            document.setdefault("_id", ObjectId())
+            self.documents.append(copy.deepcopy(document))
+        if write_errors:
+            raise BulkWriteError(
+                {
+                    "writeErrors": write_errors,
+                    "nInserted": len(documents) - len(write_errors),
+                }
+            )
+        return SimpleNamespace(
+            acknowledged=True, inserted_ids=[document["_id"] for document in documents]
+        )
+
+    async def find_one(self, query=None, projection=None):
+        await self._round_trip("find_one")
+        for document in self.documents:
+            if matches(document, query):
+                return copy.deepcopy(project(document, projection))
+        return None
+
+    def find(self, query=None, projection=None):
+        self.calls["find"] += 1
+        return FakeCursor(
+            [doc for doc in self.documents if matches(doc, query)],
+            self.latency,
+            projection,
+        )
+
+    async def update_one(self, query, update, upsert=False):
+        await self._round_trip("update_one")
+        return self._update(query, update, upsert)
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._round_trip("bulk_write")
+        results = [
+            self._update(request._filter, request._doc, request._upsert)
+            for request in requests
+        ]
+        return SimpleNamespace(
+            acknowledged=True,
+            matched_count=sum(result.matched_count for result in results),
+        )
+
+    def _update(self, query, update, upsert):
+        if not isinstance(update, dict) or not all(k.startswith("$") for k in update):
+            raise TypeError("update must be a dict of update operators")
+        for document in self.documents:
+            if matches(document, query):
+                document.update(copy.deepcopy(update.get("$set", {})))
+                for key in update.get("$unset", {}):
+                    document.pop(key, None)
+                return SimpleNamespace(acknowledged=True, matched_count=1)
+        if upsert:
+            document = {key: value for key, value in query.items() if "$" not in key}
+            document.update(copy.deepcopy(update.get("$set", {})))
+            document["_id"] = ObjectId()
+            self.documents.append(document)
+        return SimpleNamespace(acknowledged=True, matched_count=0)
+
+    async def delete_one(self, query):
+        await self._round_trip("delete_one")
+        for index, document in enumerate(self.documents):
+            if matches(document, query):
+                del self.documents[index]
+                return SimpleNamespace(acknowledged=True, deleted_count=1)
+        return SimpleNamespace(acknowledged=True, deleted_count=0)
+
+    async def find_one_and_delete(self, query, sort=None, projection=None):
+        await self._round_trip("find_one_and_delete")
+        candidates = [doc for doc in self.documents if matches(doc, query)]
+        for key, direction in reversed(sort or []):
+            candidates.sort(key=lambda doc: _get(doc, key), reverse=direction < 0)
+        if not candidates:
+            return None
+        self.documents.remove(candidates[0])
+        return project(candidates[0], projection)
+
+    async def find_one_and_update(
+        self, query, update, upsert=False, return_document=False, **kwargs
+    ):
+        await self._round_trip("find_one_and_update")
+        for document in self.documents:
+            if matches(document, query):
+                before = copy.deepcopy(document)
+                document.update(copy.deepcopy(update.get("$set", {})))
+                return copy.deepcopy(document) if return_document else before
+        if not upsert:
+            return None
+        document = {key: value for key, value in query.items() if "$" not in key}
+        if any(existing["_id"] == document.get("_id") for existing in self.documents):
+            raise DuplicateKeyError("E11000 duplicate key error _id", 11000)
+        document.update(copy.deepcopy(update.get("$set", {})))
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+        return copy.deepcopy(document) if return_document else None
+
+    async def count_documents(self, query):
+        await self._round_trip("count_documents")
+        return sum(1 for doc in self.documents if matches(doc, query))
+
+    async def drop_index(self, name):
+        await self._round_trip("drop_index")
+
+    async def create_index(self, keys, unique=False, **kwargs):
+        await self._round_trip("create_index")
+        if unique and isinstance(keys, str):
+            self.unique.add(keys)
+        return keys
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.collections = {}
+        self.latency = latency
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, self.latency)
+        return self.collections[name]
+
+    async def command(self, command):
+        return {"ok": 1.0}
+
+
+def install_fake_collections(latency=0.0):
+    """Replace the Motor database and collections in ``mongodb`` with fakes.
+
+    ``latency`` adds a simulated round trip (seconds) to every operation.
+    """
+    import mongodb
+
+    # The fakes know no $text queries, search uses the in-process index
+    os.environ.setdefault("STORY_SEARCH_BACKEND", "memory")
+    mongodb.db_async = FakeDatabase(latency)
+    for name in ("characters", "creatures", "stories"):
+        setattr(mongodb, name, mongodb.db_async[name])
+        # As created by mongodb.create_indexes, which only runs in the lifespan
+        getattr(mongodb, name).unique.add("id")
+    return mongodb
@@ -0,0 +1,113 @@
+"""Load test: CRUD latency while slow story generations are in flight.
+
+Uses the local fake provider, which takes ``--generation-seconds`` to
+answer and MongoDB with in-memory collections, then measures the latency
+of ``GET /api/characters`` with and without ``--generations`` concurrent
+``POST /api/stories/generate`` calls.
+
+    python benchmarks/generation_load.py --generations 8 --generation-seconds 2
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORY_PROVIDER"] = "fake"
+os.environ["FAKE_PROVIDER_ENABLED"] = "true"
+# All requests come from one client, the per-client limit would reject them
+os.environ.setdefault("CLIENT_GENERATIONS_PER_MINUTE", "0")
+
+import httpx  # noqa: E402
+
+from fakes import install_fake_collections  # noqa: E402
+
+install_fake_collections()
+
+import main  # noqa: E402
+
+STORY_REQUEST = {
+    "characters": [
+        {
+            "name": "Vinca",
+            "age": 6,
+            "gender": "weiblich",
+            "personality_traits": ["fröhlich", "spontan"],
+            "interests": ["Turnen"],
+        }
+    ],
+    "creatures": [],
+    "location": "Verzauberter Garten",
+    "educational_topic": "Achtsamkeit",
+    "age_group": "Kinder",
+}
+
+
+def story_request(index: int) -> dict:
+    # A different location per request, so single-flight does not merge them
+    return {**STORY_REQUEST, "location": f"{STORY_REQUEST['location']} {index}"}
+
+
+async def measure_crud(client, samples):
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        response = await client.get("/api/characters")
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+        await asyncio.sleep(0.01)
+    return latencies
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(
+        f"{label:<22} p50={statistics.median(latencies):7.2f} ms  "
+        f"p95={p95:7.2f} ms  max={latencies[-1]:7.2f} ms"
+    )
+    return p95
+
+
+async def run(args):
+    main.story_providers.get("fake").latency = args.generation_seconds
+    await main.mongodb.characters.insert_one(dict(STORY_REQUEST["characters"][0]))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        idle = await measure_crud(client, args.samples)
+
+        generations = [
+            asyncio.create_task(
+                client.post("/api/stories/generate", json=story_request(index))
+            )
+            for index in range(args.generations)
+        ]
+        await asyncio.sleep(0.05)
+        loaded = await measure_crud(client, args.samples)
+        responses = await asyncio.gather(*generations)
+
+    assert all(response.status_code == 200 for response in responses)
+    # Every request must reach the provider, not wait on another's result
+    assert main.story_generations.executions == args.generations
+    idle_p95 = summarize("idle", idle)
+    loaded_p95 = summarize(f"{args.generations} generations", loaded)
+    if loaded_p95 > max(idle_p95 * args.tolerance, idle_p95 + 5):
+        print("FAIL: CRUD latency degraded while generations were in flight")
+        return 1
+    print("OK: CRUD latency stays flat while generations are in flight")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--generations", type=int, default=8)
+    parser.add_argument("--generation-seconds", type=float, default=1.0)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--tolerance", type=float, default=3.0)
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,89 @@
+"""Prompts per second for large batches of StoryRequests.
+
+python benchmarks/prompt_throughput.py --requests 100000 --language de
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import character  # noqa: E402
+import creature  # noqa: E402
+import prompts  # noqa: E402
+import story  # noqa: E402
+
+TOPICS = [
+    "Achtsamkeit",
+    "Christlicher Glaube",
+    "Emotionale Intelligenz",
+    "Finanzielle Bildung",
+    "Freundlichkeit",
+    "Gesunde Ernährung",
+    "Musik",
+    "Mut",
+    "Persönlichkeitsentwicklung",
+    "Respekt",
+    "Teamarbeit",
+    "Umweltschutz",
+    "Vogelkunde",
+]
+
+
+def random_request(rng):
+    characters = [
+        character.Character(
+            name=f"Kind {index}",
+            age=rng.randint(3, 14),
+            gender=rng.choice(["weiblich", "männlich"]),
+            personality_traits=rng.sample(
+                ["fröhlich", "mutig", "ruhig", "neugierig"], 2
+            ),
+            interests=rng.sample(["Turnen", "Malen", "Lesen", "Fußball"], 2),
+        )
+        for index in range(rng.randint(1, 3))
+    ]
+    creatures = [
+        creature.Creature(
+            name=f"Wesen {index}",
+            gender=rng.choice(["weiblich", "männlich"]),
+            looks_like=rng.choice(["Drache", "Bär", "Einhorn"]),
+            personality_traits=["freundlich"],
+            interests=["Feuer speien"],
+        )
+        for index in range(rng.randint(0, 2))
+    ]
+    return story.StoryRequest(
+        characters=characters,
+        creatures=creatures,
+        location="Piratenschiff",
+        educational_topic=rng.choice(TOPICS),
+        age_group=rng.choice(["Kinder", "Jugendliche"]),
+    )
+
+
+def main(args):
+    rng = random.Random(args.seed)
+    requests = [random_request(rng) for _ in range(args.requests)]
+    template = prompts.get_template(args.language)
+
+    start = time.perf_counter()
+    total_length = sum(len(template.render(request)) for request in requests)
+    elapsed = time.perf_counter() - start
+
+    print(f"template         {template.version_id}")
+    print(f"prompts          {len(requests)}")
+    print(f"prompts/sec      {len(requests) / elapsed:,.0f}")
+    print(f"µs/prompt        {elapsed / len(requests) * 1e6:.2f}")
+    print(f"avg prompt size  {total_length / len(requests):.0f} chars")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--language", default=prompts.DEFAULT_LANGUAGE)
+    parser.add_argument("--seed", type=int, default=1)
+    main(parser.parse_args())
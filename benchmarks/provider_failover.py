@@ -0,0 +1,108 @@
+"""Offline check of provider failover, hedging and the circuit breaker.
+
+Routes generations over fake providers with injected failures and
+latency, no network or MongoDB needed, and fails if the router stops
+failing over, hedging or opening and closing its circuit breakers.
+
+    python benchmarks/provider_failover.py --requests 20
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import providers  # noqa: E402
+import routing  # noqa: E402
+
+PROMPT = "Schreibe eine Geschichte über Vinca."
+
+
+def router(*fakes: providers.FakeProvider, **kwargs) -> routing.ProviderRouter:
+    registry = providers.ProviderRegistry(default=fakes[0].name)
+    for fake in fakes:
+        registry.register(fake)
+    return routing.ProviderRouter(
+        registry, order=[fake.name for fake in fakes], timeouts={}, **kwargs
+    )
+
+
+async def check_failover(args) -> list:
+    """A failing primary: fail over until its breaker opens, then skip it;
+    once it recovers, the half-open trial closes the breaker again"""
+    failing = providers.FakeProvider(name="failing", failure_rate=1.0, seed=1)
+    backup = providers.FakeProvider(name="backup")
+    story_router = router(failing, backup)
+    breaker = story_router.breakers["failing"] = routing.CircuitBreaker(
+        failure_threshold=args.failure_threshold, reset_seconds=args.reset_seconds
+    )
+
+    for _ in range(args.requests):
+        await story_router.generate(PROMPT)
+    problems = []
+    if story_router.failovers != args.failure_threshold:
+        problems.append(
+            f"{story_router.failovers} failovers, expected {args.failure_threshold}"
+        )
+    if breaker.state != "open":
+        problems.append(f"breaker is {breaker.state} after repeated failures")
+
+    chunks = [chunk async for chunk in story_router.stream(PROMPT)]
+    if "".join(chunks) != backup.text:
+        problems.append("stream did not come from the backup provider")
+
+    failing.failure_rate = 0.0
+    await asyncio.sleep(args.reset_seconds)
+    await story_router.generate(PROMPT)
+    if breaker.state != "closed":
+        problems.append(f"breaker is {breaker.state} after a successful trial")
+
+    print(
+        f"failover   {args.requests} requests  failovers={story_router.failovers}  "
+        f"breaker={breaker.state}"
+    )
+    return problems
+
+
+async def check_hedging(args) -> list:
+    """A slow primary: every request is hedged to the fast provider"""
+    slow = providers.FakeProvider(name="slow", latency=args.slow_seconds)
+    fast = providers.FakeProvider(name="fast", latency=0.01)
+    story_router = router(slow, fast, hedge=True, hedge_default_delay=0.05)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[story_router.generate(PROMPT) for _ in range(args.requests)])
+    elapsed = time.perf_counter() - start
+
+    problems = []
+    if story_router.hedges != args.requests:
+        problems.append(f"{story_router.hedges} hedges, expected {args.requests}")
+    if elapsed >= args.slow_seconds:
+        problems.append(f"hedged requests took {elapsed:.2f} s")
+    print(
+        f"hedging    {args.requests} requests  hedges={story_router.hedges}  "
+        f"{elapsed * 1000:.0f} ms"
+    )
+    return problems
+
+
+async def run(args):
+    problems = await check_failover(args) + await check_hedging(args)
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems:
+        return 1
+    print("OK: failover, hedging and circuit breakers work")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--failure-threshold", type=int, default=3)
+    parser.add_argument("--reset-seconds", type=float, default=0.5)
+    parser.add_argument("--slow-seconds", type=float, default=1.0)
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,148 @@
+"""CPU time of turning a page of stored documents into a JSON response body.
+
+python benchmarks/serialization_profile.py --stories 1000
+python benchmarks/serialization_profile.py --stories 1000 --profile 15
+
+Compares the previous path (one model_validate per document, then
+jsonable_encoder and json.dumps) with the current one (one TypeAdapter call
+per page, summaries passed through as dicts, serialized by orjson or
+pydantic-core) for full stories, story summaries and characters. No database
+is involved; the documents are built the way ``to_document`` stores them.
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from story_compression import CREATURES, LOCATIONS, NAMES, realistic_text  # noqa: E402
+
+import character  # noqa: E402
+import creature  # noqa: E402
+import serialization  # noqa: E402
+import story  # noqa: E402
+
+
+def documents(count: int):
+    rng = random.Random(42)
+    characters, stories = [], []
+    for _ in range(count):
+        new_character = character.Character(
+            name=rng.choice(NAMES),
+            age=rng.randint(3, 10),
+            gender=rng.choice(["weiblich", "männlich"]),
+            personality_traits=["fröhlich", "neugierig"],
+            interests=["Turnen", "Malen"],
+        )
+        name, looks_like = rng.choice(CREATURES)
+        new_creature = creature.Creature(
+            name=name,
+            gender="männlich",
+            looks_like=looks_like,
+            interests=["Feuer speien"],
+            personality_traits=["mutig"],
+        )
+        new_story = story.Story(
+            text=realistic_text(rng),
+            request=story.StoryRequest(
+                characters=[new_character],
+                creatures=[new_creature],
+                location=rng.choice(LOCATIONS),
+                educational_topic="Mut",
+                age_group="Kinder",
+            ),
+        )
+        new_character._prepare_create()
+        new_story._prepare_create()
+        characters.append({"_id": ObjectId(), **new_character.to_document()})
+        stories.append({"_id": ObjectId(), **new_story.to_document()})
+    return characters, stories
+
+
+def legacy_dumps(items) -> bytes:
+    return json.dumps(
+        jsonable_encoder(items), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def paths(characters, stories):
+    """Each case with its previous and its current implementation"""
+    return {
+        "stories": (
+            lambda: legacy_dumps([story.Story.from_document(d) for d in stories]),
+            lambda: serialization.dumps(story.Story.from_documents(stories)),
+        ),
+        "story summaries": (
+            lambda: legacy_dumps(
+                [story.StorySummary.from_document(d) for d in stories]
+            ),
+            lambda: serialization.dumps([story.summarize(d) for d in stories]),
+        ),
+        "characters": (
+            lambda: legacy_dumps(
+                [character.Character.model_validate(d) for d in characters]
+            ),
+            lambda: serialization.dumps(character.Character.from_documents(characters)),
+        ),
+    }
+
+
+def best_of(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.process_time()
+        function()
+        timings.append(time.process_time() - start)
+    return min(timings)
+
+
+def profile(label: str, function, top: int):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    function()
+    profiler.disable()
+    print(f"\n--- {label}")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+
+
+def run(args):
+    characters, stories = documents(args.stories)
+    print(
+        f"{args.stories} documents per page, orjson "
+        f"{'installed' if serialization.orjson else 'not installed'}\n"
+    )
+    print(f"{'case':<16} {'previous':>10} {'current':>10} {'speedup':>8}")
+    for name, (previous, current) in paths(characters, stories).items():
+        # Both paths must produce the same data
+        assert json.loads(previous()) == json.loads(current())
+        before = best_of(previous, args.repeat)
+        after = best_of(current, args.repeat)
+        print(
+            f"{name:<16} {before * 1000:>8.1f}ms {after * 1000:>8.1f}ms "
+            f"{before / after:>7.1f}x"
+        )
+        if args.profile:
+            profile(f"{name}, previous", previous, args.profile)
+            profile(f"{name}, current", current, args.profile)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5, help="best of n runs")
+    parser.add_argument(
+        "--profile",
+        type=int,
+        metavar="N",
+        help="print the top N functions of a cProfile run per path",
+    )
+    run(parser.parse_args())
@@ -0,0 +1,115 @@
+"""Cold start: time to import the app and to get through the lifespan startup.
+
+Every run is a fresh interpreter without provider API keys, using the fake
+provider and the in-memory collections, so only our own startup path is
+measured. Fails if the median cold start exceeds --budget-ms.
+
+    python benchmarks/startup.py --runs 5 --budget-ms 1000
+    python benchmarks/startup.py --top 15
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS = os.path.join(ROOT, "benchmarks")
+
+CHILD = f"""
+import asyncio, json, sys, time
+start = time.perf_counter()
+sys.path[:0] = [{ROOT!r}, {BENCHMARKS!r}]
+from fakes import install_fake_collections
+install_fake_collections()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    async with main.app.router.lifespan_context(main.app):
+        return time.perf_counter()
+
+ready = asyncio.run(startup())
+print(json.dumps({{"import": imported - start, "lifespan": ready - imported}}))
+"""
+
+
+def child_environment() -> dict:
+    environment = {
+        name: value
+        for name, value in os.environ.items()
+        if name not in ("GOOGLE_GEMINI_API_KEY", "NVIDIA_NEMOTRON_API_KEY")
+    }
+    environment.update(
+        STORY_PROVIDER="fake", FAKE_PROVIDER_ENABLED="true", LOG_LEVEL="WARNING"
+    )
+    return environment
+
+
+def interpreter_seconds() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - start
+
+
+def cold_start() -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=child_environment(),
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int):
+    """The modules with the most own import time, from ``python -X importtime``"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+        env=child_environment(),
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, module = line[len("import time:") :].split("|")
+        rows.append((int(own), int(cumulative), module.strip()))
+    print(f"\n{'module':<48} {'self ms':>8} {'cumulative ms':>14}")
+    for own, cumulative, module in sorted(rows, reverse=True)[:top]:
+        print(f"{module:<48} {own / 1000:>8.1f} {cumulative / 1000:>14.1f}")
+
+
+def run(args) -> int:
+    interpreter = statistics.median(interpreter_seconds() for _ in range(args.runs))
+    runs = [cold_start() for _ in range(args.runs)]
+    imports = statistics.median(run["import"] for run in runs)
+    lifespan = statistics.median(run["lifespan"] for run in runs)
+    total = interpreter + imports + lifespan
+    print(f"{'interpreter':<12} {interpreter * 1000:>8.1f} ms")
+    print(f"{'import':<12} {imports * 1000:>8.1f} ms")
+    print(f"{'lifespan':<12} {lifespan * 1000:>8.1f} ms")
+    print(f"{'cold start':<12} {total * 1000:>8.1f} ms (median of {args.runs})")
+    if args.top:
+        slowest_imports(args.top)
+
+    if total * 1000 > args.budget_ms:
+        print(f"\nFAIL: cold start above the budget of {args.budget_ms:.0f} ms")
+        return 1
+    print(f"\nOK: cold start within the budget of {args.budget_ms:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000)
+    parser.add_argument("--top", type=int, default=0, help="list the N slowest imports")
+    sys.exit(run(parser.parse_args()))
@@ -0,0 +1,177 @@
+"""Stored size and response size/latency of story texts with compression.
+
+python benchmarks/story_compression.py --stories 300
+python benchmarks/story_compression.py --corpus stories.ndjson
+
+Without --corpus the texts are assembled from a fixed set of sentences, which
+compresses better than real stories; pass an export of the stories
+collection (one JSON document with a "text" field per line) for real numbers.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["STORY_PROVIDER"] = "fake"
+os.environ["FAKE_PROVIDER_ENABLED"] = "true"
+
+import httpx  # noqa: E402
+
+from fakes import install_fake_collections  # noqa: E402
+
+mongodb = install_fake_collections()
+
+import compression  # noqa: E402
+import main  # noqa: E402
+import story  # noqa: E402
+
+NAMES = ["Vinca", "Mila", "Jonas", "Lea", "Paul", "Emma", "Ben", "Sophie"]
+CREATURES = [("Drago", "Drache"), ("Balu", "Bär"), ("Fips", "Fuchs")]
+LOCATIONS = ["Piratenschiff", "Verzauberter Garten", "Mystischer Wald", "Raumstation"]
+
+# Bausteine im Stil der generierten Geschichten, damit die Kompressionsrate
+# der von echtem Fließtext nahekommt
+SENTENCES = [
+    "Es war einmal {name}, die mit großen Augen in die Welt hinausschaute.",
+    "Eines Abends, als die Sonne langsam hinter den Hügeln verschwand, hörte "
+    "{name} ein leises Rascheln.",
+    "Im {location} war es still, nur der Wind sang ein sanftes Lied.",
+    "{creature}, der {looks_like}, steckte vorsichtig den Kopf hervor und "
+    "lächelte freundlich.",
+    "„Hab keine Angst“, sagte {creature}, „ich möchte nur ein Freund sein.“",
+    "{name} atmete tief ein und spürte, wie ihr Herz ruhiger wurde.",
+    "Gemeinsam entdeckten sie einen Weg, der mit glitzernden Steinen "
+    "gepflastert war.",
+    "Am Wegesrand wuchsen Blumen in allen Farben des Regenbogens.",
+    "„Wenn wir zusammenhalten, schaffen wir alles“, flüsterte {name}.",
+    "Sie halfen einem kleinen Vogel, der sich im Gebüsch verfangen hatte.",
+    "Der Vogel bedankte sich mit einem fröhlichen Gesang, der durch den "
+    "ganzen {location} klang.",
+    "Später teilten sie ihr Abendbrot und erzählten sich Geschichten von "
+    "fernen Ländern.",
+    "{creature} erklärte, dass Mut nicht heißt, keine Angst zu haben, "
+    "sondern trotzdem weiterzugehen.",
+    "{name} dachte lange darüber nach und nickte dann zufrieden.",
+    "Als die Sterne am Himmel funkelten, wurden beide langsam müde.",
+    "Sie kuschelten sich in eine weiche Decke aus Moos und Blättern.",
+    "Und während der Mond über ihnen wachte, schliefen sie glücklich ein.",
+]
+
+
+def realistic_text(rng: random.Random, pages: int = 3) -> str:
+    name = rng.choice(NAMES)
+    creature_name, looks_like = rng.choice(CREATURES)
+    location = rng.choice(LOCATIONS)
+    paragraphs = []
+    # Etwa 2.500 Zeichen pro DIN-A4-Seite
+    while sum(map(len, paragraphs)) < pages * 2500:
+        sentences = rng.sample(SENTENCES, rng.randint(4, 7))
+        paragraphs.append(
+            " ".join(sentences).format(
+                name=name,
+                creature=creature_name,
+                looks_like=looks_like,
+                location=location,
+            )
+        )
+    return "\n\n".join(paragraphs)
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+def storage(texts):
+    raw = sum(len(text.encode("utf-8")) for text in texts)
+    print(f"{'codec':<6} {'stored':>10} {'ratio':>6} {'compress':>10} {'read':>8}")
+    print(f"{'none':<6} {raw:>10,} {1:>6.2f}")
+    codecs = ["zlib"]
+    try:
+        compression._zstd()
+        codecs.append("zstd")
+    except ImportError:
+        print("zstd   (zstandard not installed)")
+
+    for codec in codecs:
+        start = time.perf_counter()
+        stored = [compression.compress_text(text, codec) for text in texts]
+        compress_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        for value in stored:
+            compression.decompress_text(value)
+        read_seconds = time.perf_counter() - start
+        size = sum(len(value) for value in stored)
+        print(
+            f"{codec:<6} {size:>10,} {raw / size:>6.2f} "
+            f"{compress_seconds / len(texts) * 1e6:>8.0f}µs "
+            f"{read_seconds / len(texts) * 1e6:>6.0f}µs"
+        )
+
+
+async def responses(requests: int):
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        print(f"\n{'Accept-Encoding':<16} {'bytes':>10} {'p50':>8} {'p95':>8}")
+        for encoding in ("identity", "gzip", "br"):
+            if encoding == "br" and compression.brotli is None:
+                print("br               (brotli not installed)")
+                continue
+            durations = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = await c.get(
+                    "/api/stories", headers={"Accept-Encoding": encoding}
+                )
+                durations.append(time.perf_counter() - start)
+            size = int(response.headers.get("content-length", len(response.content)))
+            print(
+                f"{encoding:<16} {size:>10,} "
+                f"{percentile(durations, 50) * 1000:>6.1f}ms "
+                f"{percentile(durations, 95) * 1000:>6.1f}ms"
+            )
+
+
+async def run(args):
+    rng = random.Random(42)
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as corpus:
+            texts = [json.loads(line)["text"] for line in corpus if line.strip()]
+    else:
+        texts = [realistic_text(rng) for _ in range(args.stories)]
+    print(
+        f"{args.stories} stories, {statistics.mean(map(len, texts)):,.0f} chars each\n"
+    )
+    storage(texts)
+
+    # Half of the stories as written before compression, half through the model
+    half = len(texts) // 2
+    for text in texts[:half]:
+        await mongodb.stories.insert_one(
+            story.Story(id=str(rng.random()), text=text).model_dump()
+        )
+    await story.Story.create_many([story.Story(text=text) for text in texts[half:]])
+
+    def compressed():
+        return sum(
+            compression.is_compressed(d["text"]) for d in mongodb.stories.documents
+        )
+
+    print(f"\n{compressed()}/{len(texts)} texts stored compressed before reading")
+    await responses(args.requests)
+    await asyncio.sleep(0)
+    print(f"\n{compressed()}/{len(texts)} texts stored compressed after reading")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--corpus", help="NDJSON file with one story per line")
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,199 @@
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+import character
+import compression
+import creature
+import serialization
+import settings
+import story
+from persistence import MongoDocument
+
+_config = settings.get_settings()
+
+# Zeilen pro Validierung und insert_many beim Import
+BULK_IMPORT_CHUNK_SIZE = _config.bulk_import_chunk_size
+# Dokumente pro Cursor-Batch beim Export
+BULK_EXPORT_BATCH_SIZE = _config.bulk_export_batch_size
+# Höchstens so viele Fehler werden einzeln gemeldet, gezählt werden alle
+BULK_IMPORT_MAX_ERRORS = _config.bulk_import_max_errors
+
+MODELS: Dict[str, Type[MongoDocument]] = {
+    character.CHARACTER_MONGO_DB_COLLECTION: character.Character,
+    creature.CREATURE_MONGO_DB_COLLECTION: creature.Creature,
+    story.STORY_MONGO_DB_COLLECTION: story.Story,
+}
+
+# Duplicate key: the id is already taken
+_DUPLICATE_KEY = 11000
+
+logger = logging.getLogger(__name__)
+
+
+async def export_lines(
+    model: Type[MongoDocument], batch_size: int = BULK_EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """All documents of the model's collection as NDJSON, one chunk per batch.
+
+    The cursor is streamed straight to the response, so memory stays at one
+    batch however large the collection is. Documents are not validated;
+    story texts are decompressed and the search terms left out, which makes
+    every line importable again.
+    """
+    cursor = (
+        model.collection()
+        .find({}, {"_id": 0, "search_terms": 0, "search_indexed": 0})
+        .sort("_id", 1)
+        .batch_size(batch_size)
+    )
+    lines = []
+    async for document in cursor:
+        if "text" in document:
+            document["text"] = compression.decompress_text(document["text"])
+        lines.append(serialization.dumps(document))
+        if len(lines) >= batch_size:
+            yield b"\n".join(lines) + b"\n"
+            lines = []
+    if lines:
+        yield b"\n".join(lines) + b"\n"
+
+
+async def _numbered_lines(
+    body: AsyncIterator[bytes],
+) -> AsyncIterator[Tuple[int, bytes]]:
+    """Non-blank lines of a streamed body with their 1-based line numbers"""
+    number = 0
+    rest = b""
+    async for chunk in body:
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+    if rest.strip():
+        yield number + 1, rest
+
+
+class ImportReport:
+    def __init__(self, max_errors: int = BULK_IMPORT_MAX_ERRORS):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+
+    def error(self, line: int, message: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def to_dict(self) -> dict:
+        return {"inserted": self.inserted, "failed": self.failed, "errors": self.errors}
+
+
+def _validation_message(errors: List[dict]) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'][1:]) or 'Dokument'}: {error['msg']}"
+        for error in errors
+    )
+
+
+def _validate_chunk(
+    model: Type[MongoDocument], lines: List[Tuple[int, dict]], report: ImportReport
+) -> Tuple[List[int], List[MongoDocument]]:
+    """Validate a chunk with one TypeAdapter call; invalid lines are reported
+    and the rest validated again"""
+    adapter = serialization.list_adapter(model)
+    try:
+        return [number for number, _ in lines], adapter.validate_python(
+            [document for _, document in lines]
+        )
+    except ValidationError as e:
+        invalid: Dict[int, List[dict]] = {}
+        for error in e.errors():
+            invalid.setdefault(error["loc"][0], []).append(error)
+    for index in sorted(invalid):
+        report.error(lines[index][0], _validation_message(invalid[index]))
+    valid = [line for index, line in enumerate(lines) if index not in invalid]
+    if not valid:
+        return [], []
+    return [number for number, _ in valid], adapter.validate_python(
+        [document for _, document in valid]
+    )
+
+
+async def _insert_chunk(
+    model: Type[MongoDocument],
+    lines: List[Tuple[int, dict]],
+    report: ImportReport,
+    on_inserted: Optional[Callable[[List[MongoDocument]], None]],
+):
+    numbers, documents = _validate_chunk(model, lines, report)
+    if not documents:
+        return
+    documents = [document.without_server_fields() for document in documents]
+    for document in documents:
+        # Exported documents keep their id, so references in stories stay valid
+        if document.id is None:
+            document._prepare_create()
+    try:
+        await model.insert_many(documents)
+        inserted = documents
+    except BulkWriteError as e:
+        failed = {}
+        for error in e.details["writeErrors"]:
+            failed[error["index"]] = (
+                f"id '{documents[error['index']].id}' existiert bereits"
+                if error["code"] == _DUPLICATE_KEY
+                else error["errmsg"]
+            )
+        for index in sorted(failed):
+            report.error(numbers[index], failed[index])
+        inserted = [d for index, d in enumerate(documents) if index not in failed]
+    report.inserted += len(inserted)
+    if on_inserted is not None and inserted:
+        on_inserted(inserted)
+
+
+async def import_lines(
+    model: Type[MongoDocument],
+    body: AsyncIterator[bytes],
+    on_inserted: Optional[Callable[[List[MongoDocument]], None]] = None,
+    chunk_size: int = BULK_IMPORT_CHUNK_SIZE,
+) -> dict:
+    """Insert NDJSON documents from a streamed request body.
+
+    Lines are parsed as they arrive, validated ``chunk_size`` at a time and
+    written with one unordered ``insert_many`` per chunk, so a broken line
+    or a duplicate id only fails that line. ``on_inserted`` gets the models
+    of every chunk that was written.
+    """
+    report = ImportReport()
+    chunk: List[Tuple[int, dict]] = []
+    async for number, line in _numbered_lines(body):
+        try:
+            document = serialization.loads(line)
+        except ValueError as e:
+            report.error(number, f"Kein gültiges JSON: {e}")
+            continue
+        if not isinstance(document, dict):
+            report.error(number, "Jede Zeile muss ein JSON-Objekt sein")
+            continue
+        chunk.append((number, document))
+        if len(chunk) >= chunk_size:
+            await _insert_chunk(model, chunk, report, on_inserted)
+            chunk = []
+    if chunk:
+        await _insert_chunk(model, chunk, report, on_inserted)
+    logger.info(
+        "Bulk import finished",
+        extra={
+            "collection": model.mongo_db_collection,
+            "inserted": report.inserted,
+            "failed": report.failed,
+        },
+    )
+    return report.to_dict()
@@ -0,0 +1,152 @@
+import gzip
+import zlib
+from typing import Optional, Union
+
+from bson.binary import Binary
+from starlette.datastructures import Headers, MutableHeaders
+
+import settings
+
+try:
+    import brotli
+except ImportError:  # optional, without it responses fall back to gzip
+    brotli = None
+
+_config = settings.get_settings()
+
+# zlib ist immer verfügbar, zstd braucht das Paket zstandard, none schreibt Klartext
+STORY_TEXT_COMPRESSION = _config.story_text_compression
+# Kürzere Texte lohnen den Aufwand nicht und werden weiter als String gespeichert
+STORY_TEXT_COMPRESSION_MIN_BYTES = _config.story_text_compression_min_bytes
+RESPONSE_COMPRESSION_MIN_BYTES = _config.response_compression_min_bytes
+RESPONSE_GZIP_LEVEL = _config.response_gzip_level
+RESPONSE_BROTLI_QUALITY = _config.response_brotli_quality
+
+# Binary subtype for user defined data; the first byte names the codec
+TEXT_BINARY_SUBTYPE = 0x80
+_ZLIB_MARKER = b"z"
+_ZSTD_MARKER = b"s"
+
+
+def _zstd():
+    import zstandard
+
+    return zstandard
+
+
+def compress_text(text: str, codec: str = STORY_TEXT_COMPRESSION) -> Union[str, Binary]:
+    """Story text as it is stored in Mongo: compressed binary or plain string"""
+    data = text.encode("utf-8")
+    if codec == "none" or len(data) < STORY_TEXT_COMPRESSION_MIN_BYTES:
+        return text
+    if codec == "zstd":
+        payload = _ZSTD_MARKER + _zstd().ZstdCompressor(level=9).compress(data)
+    elif codec == "zlib":
+        payload = _ZLIB_MARKER + zlib.compress(data, 9)
+    else:
+        raise ValueError(f"Unknown story text compression '{codec}'")
+    return Binary(payload, TEXT_BINARY_SUBTYPE)
+
+
+def is_compressed(value) -> bool:
+    return isinstance(value, bytes)
+
+
+def decompress_text(value):
+    """Inverse of ``compress_text``; plain strings are returned unchanged"""
+    if not is_compressed(value):
+        return value
+    marker, payload = value[:1], value[1:]
+    if marker == _ZLIB_MARKER:
+        return zlib.decompress(payload).decode("utf-8")
+    if marker == _ZSTD_MARKER:
+        return _zstd().ZstdDecompressor().decompress(payload).decode("utf-8")
+    raise ValueError(f"Unknown story text compression marker {marker!r}")
+
+
+def needs_migration(value) -> bool:
+    """Plain text that ``compress_text`` would store compressed today"""
+    return (
+        isinstance(value, str)
+        and STORY_TEXT_COMPRESSION != "none"
+        and len(value.encode("utf-8")) >= STORY_TEXT_COMPRESSION_MIN_BYTES
+    )
+
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        accepted[name.strip()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress complete responses with brotli or gzip.
+
+    Only responses that are sent in a single body message are compressed;
+    streamed responses (SSE, NDJSON) pass through untouched so their chunks
+    still reach the client as soon as they are produced. Compressing changes
+    the bytes on the wire, so a strong ETag is sent as a weak one.
+    """
+
+    def __init__(self, app, minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or len(body) < self.minimum_size
+                or "content-encoding" in headers
+            ):
+                await send(start)
+                await send(message)
+                return
+
+            body = compress_body(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            if (etag := headers.get("etag")) and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,112 @@
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple, Type
+
+import character
+import creature
+import settings
+import story
+from persistence import MongoDocument
+
+_config = settings.get_settings()
+
+# Löschungen anderer Worker kommen nur über Change Streams mit
+# LIVE_FEED_PRE_IMAGES=true an; ohne das mit mehreren Workern 0 setzen
+ENTITY_CACHE_MAX_ENTRIES = _config.entity_cache_max_entries
+
+
+class EntityCache:
+    """LRU cache of characters and creatures by id.
+
+    Misses are loaded with one ``$in`` query per collection. The API writes
+    through on create and drops entries on delete, so the cache never serves
+    a document that no longer exists.
+    """
+
+    def __init__(self, max_entries: int = ENTITY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], MongoDocument]" = OrderedDict()
+
+    def put(self, document: MongoDocument):
+        key = (document.mongo_db_collection, document.id)
+        self._entries[key] = document
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, model: Type[MongoDocument], id: str):
+        self._entries.pop((model.mongo_db_collection, id), None)
+
+    async def get_many(
+        self, model: Type[MongoDocument], ids: Sequence[str]
+    ) -> Dict[str, MongoDocument]:
+        """Documents by id; ids that do not exist are missing from the result"""
+        found = {}
+        missing = []
+        for id in dict.fromkeys(ids):
+            key = (model.mongo_db_collection, id)
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                found[id] = self._entries[key]
+            else:
+                missing.append(id)
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            cursor = model.collection().find({"id": {"$in": missing}})
+            async for document in cursor:
+                document = model.model_validate(document)
+                found[document.id] = document
+                self.put(document)
+        return found
+
+    async def resolve(
+        self, model: Type[MongoDocument], ids: Sequence[str]
+    ) -> List[MongoDocument]:
+        found = await self.get_many(model, ids)
+        if unknown := [id for id in ids if id not in found]:
+            raise KeyError(
+                f"Unbekannte IDs in '{model.mongo_db_collection}': {', '.join(unknown)}"
+            )
+        return [found[id] for id in ids]
+
+    async def resolve_requests(
+        self, story_requests: Sequence[story.StoryRequest]
+    ) -> List[story.StoryRequest]:
+        """Fill in the characters and creatures referenced by id.
+
+        All requests share one lookup per collection, so a whole batch costs
+        at most two queries. Inline characters and creatures are kept and
+        the referenced ones are appended after them.
+        """
+        characters = await self.resolve(
+            character.Character,
+            [id for request in story_requests for id in request.character_ids],
+        )
+        creatures = await self.resolve(
+            creature.Creature,
+            [id for request in story_requests for id in request.creature_ids],
+        )
+
+        resolved = []
+        for story_request in story_requests:
+            my_characters = characters[: len(story_request.character_ids)]
+            characters = characters[len(story_request.character_ids) :]
+            my_creatures = creatures[: len(story_request.creature_ids)]
+            creatures = creatures[len(story_request.creature_ids) :]
+            resolved.append(
+                story_request.model_copy(
+                    update={
+                        "characters": story_request.characters + my_characters,
+                        "creatures": story_request.creatures + my_creatures,
+                    }
+                )
+            )
+        return resolved
+
+    async def resolve_request(
+        self, story_request: story.StoryRequest
+    ) -> story.StoryRequest:
+        return (await self.resolve_requests([story_request]))[0]
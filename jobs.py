@@ -0,0 +1,366 @@
+import asyncio
+import datetime
+import logging
+import random
+import uuid
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, Literal, Optional
+
+from pydantic import BaseModel, Field
+from pymongo import ReturnDocument
+
+import mongodb
+import providers
+import settings
+import story
+
+JOB_MONGO_DB_COLLECTION = "story_jobs"
+
+_config = settings.get_settings()
+
+JOB_QUEUE_BACKEND = _config.job_queue_backend
+JOB_WORKERS = _config.job_workers
+JOB_QUEUE_MAX_PENDING = _config.job_queue_max_pending
+JOB_MAX_ATTEMPTS = _config.job_max_attempts
+JOB_RETRY_BASE_SECONDS = _config.job_retry_base_seconds
+# z.B. "google=4,nvidia=2"; Anbieter ohne Eintrag teilen sich nur JOB_WORKERS
+JOB_PROVIDER_CONCURRENCY = _config.job_provider_concurrency
+# Laufende Aufträge, deren Worker sich so lange nicht gemeldet hat, werden
+# wieder eingeplant, z.B. nach einem Absturz (nur mit JOB_QUEUE_BACKEND=mongo)
+JOB_LEASE_SECONDS = _config.job_lease_seconds
+
+TERMINAL_JOB_STATES = ("succeeded", "failed")
+
+logger = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class StoryJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    status: Literal["queued", "running", "succeeded", "failed"] = "queued"
+    created: datetime.datetime = Field(default_factory=_now)
+    updated: datetime.datetime = Field(default_factory=_now)
+    request: story.StoryRequest
+    provider: Optional[str] = None
+    language: str = "de"
+    attempts: int = 0
+    story_id: Optional[str] = None
+    error: Optional[str] = None
+    # Client, dem der Verbrauch des Auftrags angerechnet wird (siehe quotas)
+    client: Optional[str] = None
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """Storage and hand-off of story jobs between the API and the workers"""
+
+    # How long a running job may go without a heartbeat before it is retried
+    lease_seconds: float = JOB_LEASE_SECONDS
+
+    async def put(self, job: StoryJob):
+        raise NotImplementedError
+
+    async def claim(self) -> StoryJob:
+        """Wait for the next queued job and mark it as running"""
+        raise NotImplementedError
+
+    async def save(self, job: StoryJob):
+        raise NotImplementedError
+
+    async def heartbeat(self, job: StoryJob):
+        """Extend the lease of a running job"""
+
+    async def get(self, job_id: str) -> Optional[StoryJob]:
+        raise NotImplementedError
+
+    def pending(self) -> Optional[int]:
+        """Number of queued jobs, if known without a database round trip"""
+        return None
+
+
+class MemoryJobQueue(JobQueue):
+    def __init__(
+        self, max_pending: int = JOB_QUEUE_MAX_PENDING, max_finished: int = 1000
+    ):
+        self._pending: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._jobs: "OrderedDict[str, StoryJob]" = OrderedDict()
+        self.max_finished = max_finished
+
+    async def put(self, job: StoryJob):
+        try:
+            self._pending.put_nowait(job.id)
+        except asyncio.QueueFull:
+            raise QueueFull()
+        self._jobs[job.id] = job
+
+    async def claim(self) -> StoryJob:
+        job = self._jobs[await self._pending.get()]
+        job.status = "running"
+        return job
+
+    async def save(self, job: StoryJob):
+        job.updated = _now()
+        self._jobs[job.id] = job
+        finished = [
+            job_id
+            for job_id, my_job in self._jobs.items()
+            if my_job.status in TERMINAL_JOB_STATES
+        ]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    async def get(self, job_id: str) -> Optional[StoryJob]:
+        return self._jobs.get(job_id)
+
+    def pending(self) -> Optional[int]:
+        return self._pending.qsize()
+
+
+class MongoJobQueue(JobQueue):
+    """Job queue in a Mongo collection, shared by all workers of a deployment.
+
+    A running job holds a lease that its worker renews with ``heartbeat``.
+    If the worker dies, the lease runs out after ``lease_seconds`` and the
+    next ``claim`` picks the job up again.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = JOB_QUEUE_MAX_PENDING,
+        poll_interval: float = 0.5,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+    ):
+        self.max_pending = max_pending
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+
+    @property
+    def collection(self):
+        return mongodb.db_async[JOB_MONGO_DB_COLLECTION]
+
+    async def put(self, job: StoryJob):
+        pending = await self.collection.count_documents(
+            {"status": "queued"}, limit=self.max_pending
+        )
+        if pending >= self.max_pending:
+            raise QueueFull()
+        await self.collection.insert_one(job.model_dump())
+
+    async def claim(self) -> StoryJob:
+        while True:
+            expired = _now() - datetime.timedelta(seconds=self.lease_seconds)
+            my_job = await self.collection.find_one_and_update(
+                {
+                    "$or": [
+                        {"status": "queued"},
+                        {"status": "running", "updated": {"$lt": expired}},
+                    ]
+                },
+                {"$set": {"status": "running", "updated": _now()}},
+                sort=[("created", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if my_job:
+                return StoryJob(**my_job)
+            await asyncio.sleep(self.poll_interval)
+
+    async def save(self, job: StoryJob):
+        job.updated = _now()
+        await self.collection.replace_one({"id": job.id}, job.model_dump())
+
+    async def heartbeat(self, job: StoryJob):
+        job.updated = _now()
+        await self.collection.update_one(
+            {"id": job.id, "status": "running"}, {"$set": {"updated": job.updated}}
+        )
+
+    async def get(self, job_id: str) -> Optional[StoryJob]:
+        if my_job := await self.collection.find_one({"id": job_id}):
+            return StoryJob(**my_job)
+        return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Provider rate limits (429) and server errors (5xx) are worth a retry"""
+    status_code = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if isinstance(status_code, int):
+        return status_code == 429 or status_code >= 500
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError))
+
+
+class JobWorkerPool:
+    """Bounded in-process worker pool that runs queued story jobs"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: Callable[[StoryJob], Awaitable[story.Story]],
+        resolve_provider: Callable[[Optional[str]], str] = lambda name: name or "",
+        workers: int = JOB_WORKERS,
+        provider_concurrency: Optional[Dict[str, int]] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retry_base_seconds: float = JOB_RETRY_BASE_SECONDS,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.resolve_provider = resolve_provider
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self._provider_semaphores = {
+            name: asyncio.Semaphore(limit)
+            for name, limit in (
+                provider_concurrency
+                if provider_concurrency is not None
+                else providers.parse_provider_settings(JOB_PROVIDER_CONCURRENCY, int)
+            ).items()
+        }
+        self._tasks = []
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._waiters: "Counter[str]" = Counter()
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._work()) for _ in range(self.workers)
+            ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, job: StoryJob) -> StoryJob:
+        self.start()
+        await self.queue.put(job)
+        return job
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[StoryJob]:
+        """Long-poll: return the job once it is finished or the timeout passes"""
+        job = await self.queue.get(job_id)
+        if job is None or job.status in TERMINAL_JOB_STATES or timeout <= 0:
+            return job
+
+        # Only jobs someone waits for get an event, and only while they wait:
+        # with the Mongo backend most jobs finish in another worker process
+        finished = self._finished.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] += 1
+        try:
+            deadline = asyncio.get_running_loop().time() + timeout
+            while job.status not in TERMINAL_JOB_STATES:
+                remaining = deadline - asyncio.get_running_loop().time()
+                if remaining <= 0:
+                    break
+                # Re-check at least every second, another worker process may
+                # run the job and never set the local event
+                try:
+                    await asyncio.wait_for(finished.wait(), timeout=min(remaining, 1.0))
+                except asyncio.TimeoutError:
+                    pass
+                job = await self.queue.get(job_id)
+        finally:
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                del self._waiters[job_id]
+                self._finished.pop(job_id, None)
+        return job
+
+    async def _work(self):
+        delay = self.retry_base_seconds
+        while True:
+            # A database error must not end the worker: log it and try again
+            try:
+                job = await self.queue.claim()
+            except Exception:
+                logger.exception("Could not claim story job")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, 30)
+                continue
+            delay = self.retry_base_seconds
+            try:
+                if job.attempts >= self.max_attempts:
+                    # Picked up again after its worker died while running it
+                    job.status = "failed"
+                    job.error = job.error or "Abgebrochen"
+                    self.failed += 1
+                    await self.queue.save(job)
+                else:
+                    heartbeat = asyncio.create_task(
+                        self._heartbeat(job, self.queue.lease_seconds / 3)
+                    )
+                    try:
+                        await self._run(job)
+                    finally:
+                        heartbeat.cancel()
+            except Exception:
+                # Not saved as finished; with the Mongo queue its lease runs
+                # out and another claim retries it
+                logger.exception("Could not update story job", extra={"id": job.id})
+            finally:
+                if finished := self._finished.pop(job.id, None):
+                    finished.set()
+
+    async def _heartbeat(self, job: StoryJob, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.heartbeat(job)
+            except Exception as e:
+                logger.warning(
+                    "Could not renew job lease", extra={"id": job.id, "error": str(e)}
+                )
+
+    async def _run(self, job: StoryJob):
+        semaphore = self._provider_semaphores.get(self.resolve_provider(job.provider))
+
+        while True:
+            job.status = "running"
+            job.attempts += 1
+            await self.queue.save(job)
+            try:
+                if semaphore:
+                    async with semaphore:
+                        new_story = await self.handler(job)
+                else:
+                    new_story = await self.handler(job)
+            except Exception as e:
+                job.error = str(e)
+                if is_retryable(e) and job.attempts < self.max_attempts:
+                    self.retries += 1
+                    delay = self.retry_base_seconds * 2 ** (job.attempts - 1)
+                    await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                    continue
+                job.status = "failed"
+                self.failed += 1
+                await self.queue.save(job)
+                return
+
+            job.status = "succeeded"
+            self.succeeded += 1
+            job.story_id = new_story.id
+            job.error = None
+            await self.queue.save(job)
+            return
+
+
+async def create_indexes():
+    if JOB_QUEUE_BACKEND == "mongo":
+        collection = mongodb.db_async[JOB_MONGO_DB_COLLECTION]
+        await collection.create_index("id", unique=True)
+        await collection.create_index([("status", 1), ("created", 1)])
+
+
+def queue_from_environment() -> JobQueue:
+    if JOB_QUEUE_BACKEND == "mongo":
+        return MongoJobQueue()
+    return MemoryJobQueue()
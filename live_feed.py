@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Callable, List, Optional, Set
+
+from pymongo.errors import OperationFailure
+
+import character
+import creature
+import mongodb
+import persistence
+import serialization
+import settings
+import story
+
+_config = settings.get_settings()
+
+# Ereignisse, die ein langsamer Client puffern darf, bevor er getrennt wird
+LIVE_FEED_QUEUE_SIZE = _config.live_feed_queue_size
+# Kommentarzeilen halten die Verbindung durch Proxies offen
+LIVE_FEED_HEARTBEAT_SECONDS = _config.live_feed_heartbeat_seconds
+# Mit Mongo 6+ und changeStreamPreAndPostImages auf den Collections enthalten
+# Lösch-Ereignisse die id statt nur der ObjectId. Ohne gehen nur die
+# Löschungen des eigenen Workers raus, die id der anderen ist unbekannt
+LIVE_FEED_PRE_IMAGES = _config.live_feed_pre_images
+
+WATCHED_COLLECTIONS = (
+    story.STORY_MONGO_DB_COLLECTION,
+    character.CHARACTER_MONGO_DB_COLLECTION,
+    creature.CREATURE_MONGO_DB_COLLECTION,
+)
+
+# Standalone servers have no change streams
+_CHANGE_STREAMS_NOT_SUPPORTED = 40573
+# Put into the queue of a subscriber that fell too far behind
+_DISCONNECT = object()
+
+logger = logging.getLogger(__name__)
+
+
+def compact_event(collection: str, operation: str, document: dict) -> dict:
+    """What clients need to update their lists: no story texts, no _id"""
+    event = {"collection": collection, "operation": operation}
+    if document.get("id") is not None:
+        event["id"] = document["id"]
+    elif document.get("_id") is not None:
+        event["object_id"] = str(document["_id"])
+    if operation == "insert":
+        if collection == story.STORY_MONGO_DB_COLLECTION:
+            event["document"] = story.summarize(document)
+        else:
+            event["document"] = {
+                key: value for key, value in document.items() if key != "_id"
+            }
+    return event
+
+
+class EventBus:
+    """In-process fan-out of change events to all connected clients.
+
+    Every event is serialized once, however many clients listen. A client
+    that falls ``queue_size`` events behind is disconnected instead of
+    buffering without bound; EventSource clients reconnect on their own.
+    """
+
+    def __init__(self, queue_size: int = LIVE_FEED_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self.published = 0
+        self.dropped = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: dict):
+        self.published += 1
+        if not self._subscribers:
+            return
+        data = serialization.dumps(event).decode()
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(data)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(_DISCONNECT)
+
+    async def subscribe(
+        self, heartbeat_seconds: float = LIVE_FEED_HEARTBEAT_SECONDS
+    ) -> AsyncIterator[Optional[str]]:
+        """JSON events until the subscriber lags behind; ``None`` after
+        ``heartbeat_seconds`` without an event"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(queue.get(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if data is _DISCONNECT:
+                    return
+                yield data
+        finally:
+            self._subscribers.discard(queue)
+
+
+class LiveFeed:
+    """Publishes inserts and deletes of stories, characters and creatures.
+
+    One watcher per worker tails a single database-level change stream, so
+    writes from every worker reach every client. Where change streams are
+    unavailable (standalone servers, the in-memory collections of the
+    benchmarks) it falls back to the writes of this worker, reported by
+    ``persistence.write_listeners``.
+
+    ``listeners`` get every event as well, e.g. so that in-process caches
+    of every worker drop deleted documents.
+    """
+
+    def __init__(self, bus: Optional[EventBus] = None):
+        self.bus = bus or EventBus()
+        self.listeners: List[Callable[[dict], None]] = []
+        self.mode = "local"
+        self._task: Optional[asyncio.Task] = None
+        persistence.write_listeners.append(self._local_write)
+
+    def _publish(self, event: dict):
+        for listener in self.listeners:
+            listener(event)
+        self.bus.publish(event)
+
+    def _local_write(self, collection: str, operation: str, document: dict):
+        if collection not in WATCHED_COLLECTIONS:
+            return
+        # Without pre-images the change stream only knows the ObjectId of a
+        # deleted document, which clients never see, so deletes of this
+        # worker always go out locally with their id
+        if self.mode == "local" or (operation == "delete" and not LIVE_FEED_PRE_IMAGES):
+            self._publish(compact_event(collection, operation, document))
+
+    def start(self):
+        if self._task is None and hasattr(mongodb.db_async, "watch"):
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.mode = "local"
+
+    async def _watch(self):
+        pipeline = [
+            {
+                "$match": {
+                    "ns.coll": {"$in": list(WATCHED_COLLECTIONS)},
+                    "operationType": {"$in": ["insert", "delete"]},
+                }
+            },
+            # Story texts are compressed and never sent, so not read either
+            {
+                "$project": {
+                    "fullDocument.text": 0,
+                    "fullDocument.search_terms": 0,
+                    "fullDocumentBeforeChange.text": 0,
+                    "fullDocumentBeforeChange.search_terms": 0,
+                }
+            },
+        ]
+        options = {}
+        if LIVE_FEED_PRE_IMAGES:
+            options["full_document_before_change"] = "whenAvailable"
+        resume_after = None
+        delay = 1.0
+        while True:
+            try:
+                async with mongodb.db_async.watch(
+                    pipeline, resume_after=resume_after, **options
+                ) as stream:
+                    self.mode = "change_stream"
+                    delay = 1.0
+                    async for change in stream:
+                        resume_after = stream.resume_token
+                        event = self._change_event(change)
+                        if "id" in event:
+                            self._publish(event)
+            except OperationFailure as e:
+                if e.code == _CHANGE_STREAMS_NOT_SUPPORTED:
+                    logger.info("Change streams unavailable, using local events")
+                    self.mode = "local"
+                    return
+                logger.warning("Change stream failed", extra={"error": str(e)})
+            except Exception as e:
+                logger.warning("Change stream failed", extra={"error": str(e)})
+            # Bis der Stream wieder läuft, gehen wenigstens die eigenen
+            # Schreibzugriffe raus
+            self.mode = "local"
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    @staticmethod
+    def _change_event(change: dict) -> dict:
+        operation = change["operationType"]
+        document = (
+            change.get("fullDocument")
+            or change.get("fullDocumentBeforeChange")
+            or change.get("documentKey")
+            or {}
+        )
+        return compact_event(change["ns"]["coll"], operation, document)
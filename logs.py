@@ -0,0 +1,100 @@
+import datetime
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+import settings
+
+_config = settings.get_settings()
+
+LOG_LEVEL = _config.log_level.upper()
+# json für die Auswertung im Log-System, text zum Lesen in der Konsole
+LOG_FORMAT = _config.log_format
+
+# Attributes every LogRecord has; everything else was passed via ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "taskName"}
+
+_listener: Optional[QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra`` fields become top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(
+                record.created, datetime.timezone.utc
+            ).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        fields = {
+            key: value
+            for key, value in vars(record).items()
+            if key not in _RECORD_ATTRIBUTES
+        }
+        if fields:
+            message += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return message
+
+
+class _EnqueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve the message here; formatting, including tracebacks,
+        # happens on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT):
+    """Send all log records through a queue; a background thread writes them.
+
+    Logging on the event loop then only costs an enqueue, never a blocking
+    write to stdout.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(
+        JsonFormatter()
+        if log_format == "json"
+        else _TextFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    )
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, handler)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers = [_EnqueueHandler(log_queue)]
+    root.setLevel(level)
+
+
+def shutdown():
+    """Write out everything that is still queued"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
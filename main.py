@@ -1,7 +1,15 @@
-import os
-from fastapi import FastAPI, HTTPException, status
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Literal, Optional, Set
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo.errors import BulkWriteError
 import uvicorn
 
 import mongodb
@@ -10,17 +18,89 @@ import character
 import creature
 import story
 
-# from openai import OpenAI
-import google.generativeai as genai
+import bulk
+import compression
+import entity_cache
+import jobs
+import live_feed
+import logs
+import metrics
+import pregeneration
+import prompts
+import providers
+import quotas
+import rate_limit
+import response_cache
+import routing
+import search
+import serialization
+import settings
+import single_flight
+import story_cache
+
+logger = logging.getLogger(__name__)
 
+# from openai import OpenAI
 # client = OpenAI(api_key="")  # os.environ["OPENAI_API_KEY"])
 
-genai.configure(api_key=os.environ["GOOGLE_GEMINI_API_KEY"])
-nvidia_nemotron_70b_api_key = ""  # os.environ["NVIDIA_NEMOTROON_API_KEY"]
+# Obergrenze für den limit-Parameter der Listen-Endpunkte
+MAX_PAGE_SIZE = 200
+
+_config = settings.get_settings()
+
+# Wie lange /api/metadata ohne Schreibzugriff aus dem Cache geliefert wird
+METADATA_CACHE_TTL_SECONDS = _config.metadata_cache_ttl_seconds
+
+# Anzahl einzelner Geschichten, die fertig serialisiert im Speicher bleiben.
+# Löschungen anderer Worker kommen nur über Change Streams mit
+# LIVE_FEED_PRE_IMAGES=true an; ohne das mit mehreren Workern 0 setzen
+STORY_BODY_CACHE_MAX_ENTRIES = _config.story_body_cache_max_entries
+# Geschichten ändern sich nach dem Speichern nicht mehr. private, weil sie die
+# Namen der Kinder enthalten und nicht in geteilten Proxy-Caches landen sollen
+STORY_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# Stapel-Generierung: Größe, Parallelität und Starts pro Sekunde
+BATCH_MAX_SIZE = _config.batch_max_size
+BATCH_CONCURRENCY = _config.batch_concurrency
+BATCH_RATE_PER_SECOND = _config.batch_rate_per_second
+
+# Maximale Anzahl gleichzeitiger LLM-Aufrufe pro Worker
+MAX_CONCURRENT_GENERATIONS = _config.max_concurrent_generations
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Verbindungen aufbauen und aufwärmen, bevor der Worker Anfragen annimmt"""
+    logs.configure()
+    app.state.ready = False
+    mongodb.connect()
+    await mongodb.create_indexes()
+    await jobs.create_indexes()
+    await quotas.create_indexes()
+    await pregeneration.create_indexes()
+    await asyncio.gather(mongodb.warm_up(), story_providers.warm_up())
+    story_jobs.start()
+    live_story_feed.start()
+    story_pregeneration.start()
+    story_migration.start()
+    app.state.ready = True
+
+    yield
+
+    app.state.ready = False
+    await story_migration.stop()
+    await story_pregeneration.stop()
+    await live_story_feed.stop()
+    await story_jobs.stop()
+    await story_providers.aclose()
+    mongodb.close()
+    logs.shutdown()
+
 
 # Create FastAPI app with prefix
 app = FastAPI(
     title="Personalisierte Gute-Nacht-Geschichten",
+    lifespan=lifespan,
     docs_url="/api/docs",  # Update Swagger UI path
     openapi_url="/api/openapi.json",  # Update OpenAPI path
 )
@@ -32,7 +112,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Ohne diese Angabe kann das Frontend den Cursor nicht lesen
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
+# Große JSON-Antworten (Geschichtenlisten, Metadaten) komprimiert ausliefern
+app.add_middleware(compression.CompressionMiddleware)
+# Zuletzt hinzugefügt und damit außen: misst die Zeit inklusive Komprimierung
+app.add_middleware(metrics.MetricsMiddleware)
 
 
 # Character and Story Models
@@ -88,6 +174,17 @@ EDUCATIONAL_TOPICS = [
 
 
 class StoryGenerator:
+    def __init__(
+        self,
+        story_router: routing.ProviderRouter,
+        max_concurrent_generations: int = MAX_CONCURRENT_GENERATIONS,
+    ):
+        self.router = story_router
+        # Limits in-flight LLM calls so a burst of generations cannot exhaust
+        # provider quotas or worker memory; waiting callers only await, they
+        # never block the event loop.
+        self._generation_semaphore = asyncio.Semaphore(max_concurrent_generations)
+
     # def generate_bedtime_story_openai(self, story_request: StoryRequest, language="de"):
     #     """Generate a personalized bedtime story in German"""
     #     # Construct a prompt based on input parameters
@@ -105,151 +202,164 @@ class StoryGenerator:
     #     story = response.choices[0].message.content
     #     return story
 
+    async def generate_bedtime_story(
+        self,
+        story_request: story.StoryRequest,
+        provider=None,
+        language="de",
+        prompt: Optional[str] = None,
+    ) -> str:
+        """Generate a personalized bedtime story in German"""
+        prompt = prompt or self._construct_story_prompt(story_request, language)
+
+        async with self._generation_semaphore:
+            text = await self.router.generate(prompt, provider=provider)
+
+        logger.debug(
+            "Generated story",
+            extra={
+                "provider": provider,
+                "prompt_chars": len(prompt),
+                "chars": len(text),
+            },
+        )
+        return text
+
+    async def stream_bedtime_story(
+        self,
+        story_request: story.StoryRequest,
+        provider=None,
+        language="de",
+        prompt: Optional[str] = None,
+    ) -> AsyncIterator[str]:
+        """Stream a personalized bedtime story in German chunk by chunk"""
+        prompt = prompt or self._construct_story_prompt(story_request, language)
+
+        async with self._generation_semaphore:
+            async for chunk in self.router.stream(prompt, provider=provider):
+                yield chunk
+
     async def generate_bedtime_story_nvidia(
         self, story_request: story.StoryRequest, language="de"
     ):
-        from openai import AsyncOpenAI
-
-        # Construct a prompt based on input parameters
-        prompt = self._construct_story_prompt(story_request)
-
-        client = AsyncOpenAI(
-            base_url="https://integrate.api.nvidia.com/v1",
-            api_key=nvidia_nemotron_70b_api_key,
-        )
-
-        response = await client.chat.completions.create(
-            model="nvidia/llama-3.1-nemotron-70b-instruct",
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
-            temperature=0.9,
-            top_p=1,
-            # max_tokens=1024,
-            # stream=True,
+        return await self.generate_bedtime_story(
+            story_request, provider="nvidia", language=language
         )
 
-        print(f"response: {response.choices[0].message.content}")
-        return response.choices[0].message.content
-
-        # for chunk in completion:
-        # if chunk.choices[0].delta.content is not None:
-        # print(chunk.choices[0].delta.content)
-
     async def generate_bedtime_story_google(
         self, story_request: story.StoryRequest, language="de"
     ):
-        """Generate a personalized bedtime story in German"""
-        # Construct a prompt based on input parameters
-        prompt = self._construct_story_prompt(story_request)
-
-        # Create the model
-        generation_config = {
-            "temperature": 0.9,
-            "top_p": 0.95,
-            "top_k": 40,
-            # "max_output_tokens": 8192,
-            "response_mime_type": "text/plain",
-        }
-
-        model = genai.GenerativeModel(
-            model_name="gemini-1.5-flash-002",
-            generation_config=generation_config,
+        return await self.generate_bedtime_story(
+            story_request, provider="google", language=language
         )
 
-        chat_session = model.start_chat(history=[])
-
-        response = chat_session.send_message(prompt)
-
-        print(f"response: {response.text}")
-        return response.text
-
-    def _construct_story_prompt(self, story_request: story.StoryRequest) -> str:
-        """Create a structured prompt for story generation in German"""
-
-        def get_gender_specific_article(gender: str) -> str:
-            return "eine" if gender == "weiblich" else "einen"
-
-        def get_gender_specific_ending(gender: str) -> str:
-            return "e" if gender == "weiblich" else "en"
-
-        def get_gender_specific_pronoun(gender: str) -> str:
-            return "die" if gender == "weiblich" else "der"
-
-        character_descriptions = " und ".join(
-            [
-                f"{char.name}, {get_gender_specific_article(char.gender)} "
-                f"{char.age}-jährig{get_gender_specific_ending(char.gender)}, "
-                f"{get_gender_specific_pronoun(char.gender)} diese Persönlichkeit hat: {', '.join(char.personality_traits)} und "
-                f"{get_gender_specific_pronoun(char.gender)} gerne {', '.join(char.interests)} mag und macht"
-                for char in story_request.characters
-            ]
+    def _construct_story_prompt(
+        self, story_request: story.StoryRequest, language="de"
+    ) -> str:
+        """Create a structured prompt for story generation"""
+        return prompts.get_template(language).render(story_request)
+
+
+# Provider werden einmal pro Worker erstellt und behalten ihre Verbindungen
+story_providers = providers.ProviderRegistry.from_environment()
+# Ausfallsicherung zwischen den Anbietern, siehe ROUTING_ORDER
+story_router = routing.ProviderRouter(story_providers)
+story_generator = StoryGenerator(story_router)
+generated_story_cache = story_cache.StoryCache()
+story_generations = single_flight.SingleFlight()
+story_entities = entity_cache.EntityCache()
+story_search = search.backend_from_environment()
+metadata_cache = response_cache.ResponseCache(METADATA_CACHE_TTL_SECONDS)
+story_bodies = response_cache.BodyCache(STORY_BODY_CACHE_MAX_ENTRIES)
+# Bringt nach dem Start alle alten Geschichten in die Suche
+story_migration = story.StoryMigration()
+# Ein Change-Stream-Watcher pro Worker für alle verbundenen Clients
+live_story_feed = live_feed.LiveFeed()
+
+
+def _evict_deleted(event: dict):
+    """Drop documents deleted by any worker from this worker's caches"""
+    if event["operation"] != "delete" or "id" not in event:
+        return
+    if event["collection"] == story.STORY_MONGO_DB_COLLECTION:
+        story_bodies.discard(event["id"])
+    elif event["collection"] == character.CHARACTER_MONGO_DB_COLLECTION:
+        story_entities.discard(character.Character, event["id"])
+    elif event["collection"] == creature.CREATURE_MONGO_DB_COLLECTION:
+        story_entities.discard(creature.Creature, event["id"])
+
+
+live_story_feed.listeners.append(_evict_deleted)
+# Gilt für alle Stapel eines Workers zusammen
+batch_rate_limiter = rate_limit.AsyncRateLimiter(BATCH_RATE_PER_SECOND)
+# Generierungen und Tagesbudget pro API-Key bzw. IP
+client_quotas = quotas.ClientQuotas(quotas.store_from_environment())
+
+
+async def _find_page(
+    collection,
+    parse,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    newest_first: bool = False,
+    projection: Optional[dict] = None,
+):
+    """Lade eine Seite per Keyset-Pagination über _id.
+
+    ``parse`` bekommt alle Dokumente der Seite auf einmal, damit sie in einem
+    Aufruf validiert werden können. Die ObjectIds steigen mit dem Einfügezeitpunkt, die Sortierung nach _id
+    entspricht also der Erstellungsreihenfolge, auch für alte Dokumente ohne
+    ``created``. Liefert die Einträge und den Cursor für die nächste Seite.
+    """
+    query = {}
+    if after:
+        try:
+            query["_id"] = {"$lt" if newest_first else "$gt": ObjectId(after)}
+        except InvalidId:
+            raise HTTPException(status_code=400, detail=f"Ungültiger Cursor '{after}'.")
+
+    cursor = collection.find(query, projection).sort("_id", -1 if newest_first else 1)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    documents = [document async for document in cursor]
+    items = parse(documents)
+
+    next_cursor = (
+        str(documents[-1]["_id"]) if limit and len(documents) == limit else None
+    )
+    return items, next_cursor
+
+
+def _find_stories_page(
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    newest_first: bool = False,
+    summary: bool = False,
+):
+    if summary:
+        return _find_page(
+            mongodb.stories,
+            lambda documents: [story.summarize(document) for document in documents],
+            limit=limit,
+            after=after,
+            newest_first=newest_first,
+            projection=story.STORY_SUMMARY_PROJECTION,
         )
+    return _find_page(
+        mongodb.stories,
+        story.Story.from_documents,
+        limit=limit,
+        after=after,
+        newest_first=newest_first,
+        projection=story.STORY_PROJECTION,
+    )
 
-        if story_request.creatures:
-            creature_descriptions = " und ".join(
-                [
-                    f"{creature.name}, {get_gender_specific_article(creature.gender)} "
-                    f"{creature.looks_like}, "
-                    f"{get_gender_specific_pronoun(creature.gender)} diese Persönlichkeit hat: {', '.join(creature.personality_traits)} und "
-                    f"{get_gender_specific_pronoun(creature.gender)} sich besonders gut mit {', '.join(creature.interests)} auskennt"
-                    for creature in story_request.creatures
-                ]
-            )
-
-            creature_introduction = f"In der Geschichte soll zusätzlich dieses Wesen mitspielen und mit den anderen Charakteren interagieren: {creature_descriptions}"
-        else:
-            creature_introduction = ""
 
-        def age_appropriate_choice_of_words():
-            age_appropriate_choice_of_words_beginning = (
-                "Der Stil und die Wörter der Geschichte müssen ausschliesslich in"
-            )
-            age_appropriate_choice_of_words_ending = "-gerechter Sprache geschrieben sein und es dürfen keinerlei sexuelle Inhalte in der Geschichte vorkommen!"
-            if story_request.age_group == "Kinder":
-                return f"{age_appropriate_choice_of_words_beginning} {story_request.age_group.lower()}{age_appropriate_choice_of_words_ending}"
-
-            elif story_request.age_group == "Jugendliche":
-                return f"{age_appropriate_choice_of_words_beginning} {story_request.age_group.lower()}n{age_appropriate_choice_of_words_ending}"
-            else:
-                return ""
-
-        educational_context = {
-            "finanzielle bildung": "Lerne über Sparen und kluges Ausgeben",
-            "achtsamkeit": "Entdecke die Kraft des Gegenwärtig-Seins",
-            "christlicher glaube": "Lerne über Gott, Jesus und die Bibel",
-            "gesunde ernährung": "Erkunde nahrhaftes und leckeres Essen",
-            "persönlichkeitsentwicklung": "Baue Selbstvertrauen und Freundlichkeit auf",
-            "emotionale intelligenz": "Verstehe und teile Gefühle",
-            "teamarbeit": "Lerne die Kraft der Zusammenarbeit",
-            "freundlichkeit": "Entdecke die Bedeutung von Mitgefühl und Güte",
-            "umweltschutz": "Lerne, unseren Planeten zu schützen und zu respektieren",
-            "vogelkunde": "Entdecke Vögel und ihre Besonderheiten und Lebensweise",
-            "respekt": "Verstehe die Wichtigkeit, andere zu achten und zu behandeln",
-            "musik": "Entdecke Instrumente und Gesang",
-            "mut": "Finde Kraft und Selbstvertrauen in herausfordernden Situationen",
-        }.get(story_request.educational_topic.lower(), "Ein magisches Lern-Abenteuer")
-
-        prompt = f"""Schreibe eine Geschichte für {story_request.age_group} über {character_descriptions}. 
-        Die Geschichte spielt in dieser Umgebung: {story_request.location}.
-        {creature_introduction} 
-        Die Geschichte soll auf eine subtile Art und Weise über das folgende Thema lehren: {educational_context}. 
-        Die Geschichte soll fesselnd, lehrreich und mit einer positiven moralischen Lektion versehen sein.
-        Die Geschichte soll mindestens 3 DIN A4 Seiten lang sein.
-        Die Geschichte soll in einfachen Worten und kurzen Sätzen erzählt werden.
-        {age_appropriate_choice_of_words()}
-        Gib keinerlei Seitenzahlen und keine anderen Marker und keine Überschriften aus.
-        """
-
-        print(f"Prompt: {prompt}")
-
-        return prompt
-
-
-story_generator = StoryGenerator()
+def _page_response(items, next_cursor: Optional[str]) -> Response:
+    """Serialisiere eine Seite direkt, ohne den Umweg über jsonable_encoder"""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return serialization.FastJSONResponse(items, headers=headers)
 
 
 # {"name":"Vinca","age":6,"gender":"weiblich","interests":["Turnen"],"personality_traits":["fröhlich","spontan"]}
@@ -268,6 +378,8 @@ async def create_character(character: character.Character):
         # all_characters.append(character)
         # save_characters_to_json(all_characters)
         new_character = await character.create()
+        metadata_cache.invalidate()
+        story_entities.put(new_character)
 
         return new_character
     except Exception as e:
@@ -282,19 +394,15 @@ async def create_character(character: character.Character):
     description="Zeige alle verfügbaren Charaktere",
     tags=["Charaktere"],
 )
-async def list_characters():
+async def list_characters(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
     """Liste alle verfügbaren Charaktere auf"""
-    db_characters = mongodb.characters.find()
-    all_characters = []
-    if db_characters:
-        async for my_character in db_characters:
-            try:
-                all_characters.append(character.Character(**my_character))
-            except Exception as e:
-                print(str(e))
-        return all_characters
-    else:
-        return []
+    all_characters, next_cursor = await _find_page(
+        mongodb.characters, character.Character.from_documents, limit=limit, after=after
+    )
+    return _page_response(all_characters, next_cursor)
 
 
 @app.delete(
@@ -306,26 +414,25 @@ async def list_characters():
 async def delete_character(character_id: str):
     """Lösche den Charaktere mit der ID"""
     try:
-        my_character = await mongodb.characters.find_one({"id": character_id})
-        if my_character:
-            result = await mongodb.characters.delete_one({"id": character_id})
-
-            if result.deleted_count > 0:
-                return JSONResponse(
-                    status_code=status.HTTP_200_OK,
-                    content=f"Charakter mit id '{character_id}' erfolgreich gelöscht.",
-                )
-
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"{status.HTTP_404_NOT_FOUND}: Charakter mit id '{character_id}' nicht gefunden.",
-        )
+        deleted = await character.Character.delete(character_id)
+        metadata_cache.invalidate()
+        story_entities.discard(character.Character, character_id)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"{status.HTTP_500_INTERNAL_SERVER_ERROR}: Charakter mit id '{character_id}' konnte nicht gelöscht werden. Exception:\n{str(e)}",
         )
 
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{status.HTTP_404_NOT_FOUND}: Charakter mit id '{character_id}' nicht gefunden.",
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=f"Charakter mit id '{character_id}' erfolgreich gelöscht.",
+    )
+
 
 # {"name":"Drago","gender":"männlich","looks_like": "Drache", "interests":["Feuer speien"],"personality_traits":["fröhlich","positiv"]}
 @app.post(
@@ -338,6 +445,8 @@ async def create_creature(creature: creature.Creature):
     """Erstelle ein neues Fabelwesen"""
     try:
         new_creature = await creature.create()
+        metadata_cache.invalidate()
+        story_entities.put(new_creature)
 
         return new_creature
     except Exception as e:
@@ -352,19 +461,15 @@ async def create_creature(creature: creature.Creature):
     description="Zeige alle verfügbaren Fabelwesen",
     tags=["Fabelwesen"],
 )
-async def list_creatures():
+async def list_creatures(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
     """Liste alle verfügbaren Fabelwesen auf"""
-    db_creatures = mongodb.creatures.find()
-    all_creatures = []
-    if db_creatures:
-        async for my_creature in db_creatures:
-            try:
-                all_creatures.append(creature.Creature(**my_creature))
-            except Exception as e:
-                print(str(e))
-        return all_creatures
-    else:
-        return []
+    all_creatures, next_cursor = await _find_page(
+        mongodb.creatures, creature.Creature.from_documents, limit=limit, after=after
+    )
+    return _page_response(all_creatures, next_cursor)
 
 
 @app.delete(
@@ -376,26 +481,25 @@ async def list_creatures():
 async def delete_creature(creature_id: str):
     """Lösche das Fabelwesen mit der ID"""
     try:
-        my_creature = await mongodb.creatures.find_one({"id": creature_id})
-        if my_creature:
-            result = await mongodb.creatures.delete_one({"id": creature_id})
-
-            if result.deleted_count > 0:
-                return JSONResponse(
-                    status_code=status.HTTP_200_OK,
-                    content=f"Fabelwesen mit id '{creature_id}' erfolgreich gelöscht.",
-                )
-
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"{status.HTTP_404_NOT_FOUND}: Fabelwesen mit id '{creature_id}' nicht gefunden.",
-        )
+        deleted = await creature.Creature.delete(creature_id)
+        metadata_cache.invalidate()
+        story_entities.discard(creature.Creature, creature_id)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"{status.HTTP_500_INTERNAL_SERVER_ERROR}: Fabelwesen mit id '{creature_id}' konnte nicht gelöscht werden. Exception:\n{str(e)}",
         )
 
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{status.HTTP_404_NOT_FOUND}: Fabelwesen mit id '{creature_id}' nicht gefunden.",
+        )
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=f"Fabelwesen mit id '{creature_id}' erfolgreich gelöscht.",
+    )
+
 
 # {"characters":["Vinca"],"location":"Verzauberter Garten","educational_topic":"Achtsamkeit","age_group":"Kinder"}
 @app.post(
@@ -406,8 +510,15 @@ async def delete_creature(creature_id: str):
 )
 async def create_story(story: story.Story):
     """Erstelle ein neue Geschichte"""
+    return await _store_story(story.without_server_fields())
+
+
+async def _store_story(new_story: story.Story):
+    """Save a story, including the server-owned fields it already has"""
     try:
-        new_story = await story.create()
+        new_story = await new_story.create()
+        metadata_cache.invalidate()
+        story_search.add(new_story)
 
         return new_story
     except Exception as e:
@@ -422,19 +533,17 @@ async def create_story(story: story.Story):
     description="Zeige alle verfügbaren Geschichten",
     tags=["Geschichten"],
 )
-async def list_stories():
+async def list_stories(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    newest_first: bool = False,
+    summary: bool = False,
+):
     """Liste alle verfügbaren Geschichten auf"""
-    db_stories = mongodb.stories.find()
-    all_stories = []
-    if db_stories:
-        async for my_story in db_stories:
-            try:
-                all_stories.append(story.Story(**my_story))
-            except Exception as e:
-                print(str(e))
-        return all_stories
-    else:
-        return []
+    all_stories, next_cursor = await _find_stories_page(
+        limit=limit, after=after, newest_first=newest_first, summary=summary
+    )
+    return _page_response(all_stories, next_cursor)
 
 
 @app.get(
@@ -443,19 +552,77 @@ async def list_stories():
     description="Zeige alle verfügbaren Geschichten sortiert nach der letzten und auf 30 begrenzt",
     tags=["Geschichten"],
 )
-async def list_stories_sorted():
+async def list_stories_sorted(summary: bool = False):
     """Liste alle verfügbaren Geschichten auf"""
-    db_stories = mongodb.stories.find().sort("_id", -1).limit(30)
-    all_stories = []
-    if db_stories:
-        async for my_story in db_stories:
-            try:
-                all_stories.append(story.Story(**my_story))
-            except Exception as e:
-                print(str(e))
-        return all_stories
+    all_stories, _ = await _find_stories_page(
+        limit=30, newest_first=True, summary=summary
+    )
+    return _page_response(all_stories, None)
+
+
+@app.get(
+    "/api/stories/search",
+    name="Geschichten durchsuchen",
+    description="Durchsuche Geschichten nach Text und filtere nach Ort, Thema, Altersgruppe und Charakter. Liefert Textausschnitte statt ganzer Geschichten, sortiert nach Relevanz.",
+    tags=["Geschichten"],
+)
+async def search_stories(
+    q: Optional[str] = None,
+    location: Optional[str] = None,
+    educational_topic: Optional[str] = None,
+    age_group: Optional[str] = None,
+    character: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    """Durchsuche alle Geschichten"""
+    # Nach Relevanz sortierte Treffer haben keine stabile _id-Reihenfolge, der
+    # Cursor ist hier deshalb die Anzahl bereits gelieferter Treffer
+    try:
+        offset = int(after) if after else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Ungültiger Cursor '{after}'.")
+
+    hits, more = await story_search.search(
+        q,
+        {
+            "location": location,
+            "educational_topic": educational_topic,
+            "age_group": age_group,
+            "character": character,
+        },
+        limit=limit,
+        offset=max(offset, 0),
+    )
+    return _page_response(hits, str(offset + len(hits)) if more else None)
+
+
+# Erst nach /api/stories/sorted und /api/stories/search registrieren, sonst
+# würden "sorted" und "search" als id gelesen
+@app.get(
+    "/api/stories/{story_id}",
+    name="Geschichte abrufen",
+    description="Liefere eine einzelne Geschichte. Gespeicherte Geschichten ändern sich nicht mehr, die Antwort darf deshalb dauerhaft zwischengespeichert werden.",
+    tags=["Geschichten"],
+)
+async def get_story(request: Request, story_id: str):
+    """Liefere die Geschichte mit der ID"""
+    if cached := story_bodies.get(story_id):
+        body, etag = cached
     else:
-        return []
+        document = await mongodb.stories.find_one(
+            {"id": story_id}, story.STORY_PROJECTION
+        )
+        if document is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{status.HTTP_404_NOT_FOUND}: Geschichte mit id '{story_id}' nicht gefunden.",
+            )
+        body, etag = response_cache.serialize(story.Story.from_document(document))
+        story_bodies.put(story_id, body, etag)
+    return response_cache.json_response(
+        request, body, etag, cache_control=STORY_CACHE_CONTROL
+    )
 
 
 @app.delete(
@@ -467,25 +634,122 @@ async def list_stories_sorted():
 async def delete_story(story_id: str):
     """Lösche die Geschichte mit der ID"""
     try:
-        my_story = await mongodb.stories.find_one({"id": story_id})
-        if my_story:
-            result = await mongodb.stories.delete_one({"id": story_id})
-
-            if result.deleted_count > 0:
-                return JSONResponse(
-                    status_code=status.HTTP_200_OK,
-                    content=f"Geschichte mit id '{story_id}' erfolgreich gelöscht.",
-                )
+        deleted = await story.Story.delete(story_id)
+        metadata_cache.invalidate()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"{status.HTTP_500_INTERNAL_SERVER_ERROR}: Geschichte mit id '{story_id}' konnte nicht gelöscht werden. Exception:\n{str(e)}",
+        )
+    generated_story_cache.discard(story_id)
+    story_bodies.discard(story_id)
+    story_search.remove(story_id)
 
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"{status.HTTP_404_NOT_FOUND}: Geschichte mit id '{story_id}' nicht gefunden.",
         )
-    except Exception as e:
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=f"Geschichte mit id '{story_id}' erfolgreich gelöscht.",
+    )
+
+
+async def _check_quota(request: Request, generations: int = 1):
+    """Weise Clients über ihrem Limit sofort mit 429 ab, statt sie hinter
+    teuren Generierungen warten zu lassen. Erst nach der Prüfung der Anfrage
+    aufrufen, damit ungültige Anfragen kein Kontingent verbrauchen"""
+    try:
+        await client_quotas.check(quotas.client_key(request), generations)
+    except quotas.QuotaExceeded as e:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"{status.HTTP_500_INTERNAL_SERVER_ERROR}: Geschichte mit id '{story_id}' konnte nicht gelöscht werden. Exception:\n{str(e)}",
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+
+def _check_provider(provider: Optional[str]):
+    """Prüfe, ob der angefragte LLM-Anbieter konfiguriert ist"""
+    if provider in (None, story_providers.default) and not (
+        story_providers.default_available
+    ):
+        # Fehlende Konfiguration auf dem Server, nicht die Schuld des Clients
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Die Geschichtenerzeugung ist derzeit nicht verfügbar.",
         )
+    try:
+        story_providers.get(provider)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+
+
+def _check_language(language: str):
+    """Prüfe, ob es für die Sprache eine Prompt-Vorlage gibt"""
+    try:
+        prompts.get_template(language)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+
+
+async def _resolve_story_requests(
+    story_requests: List[story.StoryRequest],
+) -> List[story.StoryRequest]:
+    """Lade die per id referenzierten Charaktere und Fabelwesen"""
+    try:
+        return await story_entities.resolve_requests(story_requests)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+
+
+async def _resolve_story_request(story_request: story.StoryRequest):
+    return (await _resolve_story_requests([story_request]))[0]
+
+
+def _prompt_hash(prompt: str, provider: Optional[str] = None) -> str:
+    """Schlüssel für Story-Cache, Single-Flight und Vorrat, je Anbieter"""
+    return generated_story_cache.key(prompt, story_providers.get(provider).name)
+
+
+async def _generate_story(
+    new_story_request: story.StoryRequest,
+    provider: Optional[str] = None,
+    fresh: bool = False,
+    language: str = prompts.DEFAULT_LANGUAGE,
+) -> story.Story:
+    """Generiere und speichere eine Geschichte (mit Cache und Single-Flight)"""
+    prompt = story_generator._construct_story_prompt(new_story_request, language)
+    prompt_hash = _prompt_hash(prompt, provider)
+    if not fresh and (cached_story := await generated_story_cache.get(prompt_hash)):
+        return cached_story
+    if not fresh and (claimed := await story_pregeneration.claim(prompt_hash)):
+        # Vorab generiert: wird erst jetzt mit der eigentlichen Anfrage gespeichert
+        new_story = await _store_story(
+            claimed.model_copy(update={"request": new_story_request.for_storage()})
+        )
+        generated_story_cache.put(prompt_hash, new_story)
+        return new_story
+
+    async def generate_and_store():
+        generated_story = await story_generator.generate_bedtime_story(
+            new_story_request, provider=provider, prompt=prompt
+        )
+
+        new_story = await _store_story(
+            story.Story(
+                text=generated_story,
+                request=new_story_request.for_storage(),
+                prompt_hash=prompt_hash,
+                prompt_version=prompts.get_template(language).version_id,
+            )
+        )
+        generated_story_cache.put(prompt_hash, new_story)
+        return new_story
+
+    # Identische, gleichzeitige Anfragen teilen sich eine Generierung
+    return await story_generations.do(prompt_hash, generate_and_store)
 
 
 # {"characters":[{"id":"6d0d8f31-8e1c-4d75-8934-b588dd5ba36e","name":"Vinca","age":29,"gender":"weiblich","personality_traits":["fröhlich","spontan"],"interests":["Turnen"]}],"creatures":[{"id":"edbaf694-d7c5-42be-aedc-4dd125c378ee","name":"Balu","age":0,"gender":"männlich","personality_traits":["ruhig, gelassen"],"interests":["Achtsamkeit"],"looks_like":"Bär"}],"location":"Garten hinter dem Haus","educational_topic":"Gesunde Ernährung","age_group":"Kinder"}
@@ -494,44 +758,426 @@ async def delete_story(story_id: str):
     name="Geschichte generieren",
     description="Generiere eine personalisierte Gute-Nacht-Geschichte",
 )
-async def generate_story(story_request: story.StoryRequest):
+async def generate_story(
+    request: Request,
+    story_request: story.StoryRequest,
+    provider: Optional[str] = None,
+    fresh: bool = False,
+    language: str = prompts.DEFAULT_LANGUAGE,
+):
     """Generiere eine personalisierte Gute-Nacht-Geschichte"""
+    _check_provider(provider)
+    _check_language(language)
+    new_story_request = await _resolve_story_request(story_request)
+    await _check_quota(request)
     try:
-        print(f"story_request: {story_request}")
-
-        new_story_request = story.StoryRequest(
-            characters=story_request.characters,
-            creatures=story_request.creatures,
-            location=story_request.location,
-            educational_topic=story_request.educational_topic,
-            age_group=story_request.age_group,
+        logger.debug(
+            "Generating story",
+            extra={
+                "provider": provider,
+                "language": language,
+                "characters": len(new_story_request.characters),
+                "creatures": len(new_story_request.creatures),
+            },
         )
-        generated_story = await story_generator.generate_bedtime_story_google(
-            new_story_request
+        return await _generate_story(
+            new_story_request, provider=provider, fresh=fresh, language=language
         )
 
-        new_story = await create_story(
-            story.Story(text=generated_story, request=new_story_request)
+    except routing.NoProviderAvailable as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": str(int(routing.CIRCUIT_RESET_SECONDS))},
         )
-        return new_story
-
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Fehler bei der Geschichtsgenerierung: {str(e)}"
         )
 
 
+async def _run_story_job(job: jobs.StoryJob) -> story.Story:
+    quotas.current_client.set(job.client)
+    return await _generate_story(
+        job.request, provider=job.provider, language=job.language
+    )
+
+
+def _pregeneration_key(story_request: story.StoryRequest) -> str:
+    prompt = story_generator._construct_story_prompt(
+        story_request, prompts.DEFAULT_LANGUAGE
+    )
+    return _prompt_hash(prompt)
+
+
+async def _pregenerate(
+    story_request: story.StoryRequest, prompt_hash: str
+) -> story.Story:
+    """Generiere eine Geschichte für den Vorrat, ohne sie zu speichern"""
+    text = await story_generator.generate_bedtime_story(
+        story_request, language=prompts.DEFAULT_LANGUAGE
+    )
+    return story.Story(
+        text=text,
+        request=story_request,
+        prompt_hash=prompt_hash,
+        prompt_version=prompts.get_template(prompts.DEFAULT_LANGUAGE).version_id,
+    )
+
+
+# Füllt außerhalb der Abendspitze einen Vorrat an Geschichten für gespeicherte
+# Charaktere und Fabelwesen, den /api/stories/generate zuerst abfragt
+story_pregeneration = pregeneration.PregenerationScheduler(
+    pregeneration.StoryPool(),
+    casts=lambda: pregeneration.saved_casts(story_entities),
+    prompt_hash=_pregeneration_key,
+    generate=_pregenerate,
+    locations=LOCATIONS,
+    educational_topics=EDUCATIONAL_TOPICS,
+)
+
+
+story_jobs = jobs.JobWorkerPool(
+    jobs.queue_from_environment(),
+    handler=_run_story_job,
+    resolve_provider=lambda provider: story_providers.get(provider).name,
+)
+
+
+@app.post(
+    "/api/stories/jobs",
+    name="Generierungsauftrag anlegen",
+    description="Starte die Generierung einer Geschichte im Hintergrund und liefere sofort die Auftrags-ID",
+    status_code=status.HTTP_202_ACCEPTED,
+    tags=["Geschichten"],
+)
+async def create_story_job(
+    request: Request,
+    story_request: story.StoryRequest,
+    provider: Optional[str] = None,
+    language: str = prompts.DEFAULT_LANGUAGE,
+):
+    """Lege einen Generierungsauftrag an"""
+    _check_provider(provider)
+    _check_language(language)
+    story_request = await _resolve_story_request(story_request)
+    await _check_quota(request)
+    try:
+        job = await story_jobs.submit(
+            jobs.StoryJob(
+                request=story_request,
+                provider=provider,
+                language=language,
+                client=quotas.current_client.get(),
+            )
+        )
+    except jobs.QueueFull:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Zu viele offene Generierungsaufträge.",
+            headers={"Retry-After": "30"},
+        )
+    return job.model_dump(exclude={"client"})
+
+
+@app.get(
+    "/api/stories/jobs/{job_id}",
+    name="Generierungsauftrag abfragen",
+    description="Frage den Status eines Generierungsauftrags ab. Mit wait (Sekunden) wird gewartet, bis der Auftrag fertig ist.",
+    tags=["Geschichten"],
+)
+async def get_story_job(job_id: str, wait: float = 0):
+    """Liefere den Status eines Generierungsauftrags"""
+    job = await story_jobs.wait(job_id, timeout=min(max(wait, 0), 30))
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{status.HTTP_404_NOT_FOUND}: Auftrag mit id '{job_id}' nicht gefunden.",
+        )
+
+    result = job.model_dump(exclude={"client"})
+    result["story"] = None
+    if job.story_id:
+        if my_story := await mongodb.stories.find_one(
+            {"id": job.story_id}, story.STORY_PROJECTION
+        ):
+            result["story"] = story.Story.from_document(my_story)
+    return result
+
+
+@app.post(
+    "/api/stories/generate/batch",
+    name="Geschichten im Stapel generieren",
+    description="Generiere viele Geschichten auf einmal. Die Ergebnisse werden als NDJSON gestreamt, sobald sie fertig sind.",
+    tags=["Geschichten"],
+)
+async def generate_story_batch(
+    request: Request,
+    story_requests: List[story.StoryRequest],
+    provider: Optional[str] = None,
+    language: str = prompts.DEFAULT_LANGUAGE,
+):
+    """Generiere einen Stapel personalisierter Gute-Nacht-Geschichten"""
+    _check_provider(provider)
+    _check_language(language)
+    if len(story_requests) > BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Höchstens {BATCH_MAX_SIZE} Geschichten pro Stapel.",
+        )
+    story_requests = await _resolve_story_requests(story_requests)
+    await _check_quota(request, generations=len(story_requests))
+
+    template = prompts.get_template(language)
+    concurrency = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def generate(index: int, story_request: story.StoryRequest):
+        prompt = template.render(story_request)
+        prompt_hash = _prompt_hash(prompt, provider)
+        try:
+            # Vorab generierte Geschichten brauchen keinen LLM-Aufruf
+            if claimed := await story_pregeneration.claim(prompt_hash):
+                text = claimed.text
+            else:
+                async with concurrency:
+                    await batch_rate_limiter.acquire()
+                    text = await story_generator.generate_bedtime_story(
+                        story_request,
+                        provider=provider,
+                        language=language,
+                        prompt=prompt,
+                    )
+        except Exception as e:
+            return index, None, str(e)
+
+        new_story = story.Story(
+            text=text,
+            request=story_request.for_storage(),
+            prompt_hash=prompt_hash,
+            prompt_version=template.version_id,
+        )
+        # id und created werden schon jetzt vergeben, gespeichert wird in results
+        new_story._prepare_create()
+        return index, new_story, None
+
+    async def save(new_stories: List[story.Story]) -> Set[int]:
+        """Store one chunk with a single insert_many; returns the positions
+        in ``new_stories`` that could not be stored"""
+        try:
+            await story.Story.insert_many(new_stories)
+            failed = set()
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details["writeErrors"]}
+        metadata_cache.invalidate()
+        for position, new_story in enumerate(new_stories):
+            if position not in failed:
+                generated_story_cache.put(new_story.prompt_hash, new_story)
+                story_search.add(new_story)
+        return failed
+
+    async def results():
+        tasks = [
+            asyncio.create_task(generate(index, story_request))
+            for index, story_request in enumerate(story_requests)
+        ]
+        pending = set(tasks)
+        stored = 0
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                completed = []
+                for task in done:
+                    index, new_story, error = task.result()
+                    if error:
+                        yield _ndjson(
+                            {"index": index, "status": "error", "detail": error}
+                        )
+                    else:
+                        completed.append((index, new_story))
+                if not completed:
+                    continue
+
+                # Was gleichzeitig fertig wird, wird gemeinsam gespeichert, bevor
+                # der Client die ids sieht. Trennt er die Verbindung, läuft das
+                # Speichern trotzdem zu Ende
+                new_stories = [new_story for _, new_story in completed]
+                try:
+                    failed = await asyncio.shield(save(new_stories))
+                except Exception as e:
+                    logger.exception("Could not store batch stories")
+                    failed, detail = set(range(len(completed))), str(e)
+                else:
+                    detail = "Die Geschichte konnte nicht gespeichert werden."
+                for position, (index, new_story) in enumerate(completed):
+                    if position in failed:
+                        yield _ndjson(
+                            {
+                                "index": index,
+                                "status": "error",
+                                "detail": f"Fehler beim Speichern: {detail}",
+                            }
+                        )
+                        continue
+                    stored += 1
+                    yield _ndjson(
+                        {
+                            "index": index,
+                            "status": "generated",
+                            "story": new_story.model_dump(mode="json"),
+                        }
+                    )
+            yield _ndjson({"status": "done", "stored": stored})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+def _ndjson(item: dict) -> str:
+    return json.dumps(item, ensure_ascii=False, default=str) + "\n"
+
+
+def _server_sent_event(event: str, data: str) -> str:
+    """Formatiere ein Server-Sent Event, mehrzeilige Daten bleiben erhalten"""
+    data_lines = "\n".join(f"data: {line}" for line in data.split("\n"))
+    return f"event: {event}\n{data_lines}\n\n"
+
+
+@app.post(
+    "/api/stories/generate/stream",
+    name="Geschichte streamen",
+    description="Generiere eine Gute-Nacht-Geschichte und sende den Text als Server-Sent Events, sobald er entsteht",
+)
+async def generate_story_stream(
+    request: Request,
+    story_request: story.StoryRequest,
+    provider: Optional[str] = None,
+    language: str = prompts.DEFAULT_LANGUAGE,
+):
+    """Streame eine personalisierte Gute-Nacht-Geschichte"""
+    _check_provider(provider)
+    _check_language(language)
+    new_story_request = await _resolve_story_request(story_request)
+    await _check_quota(request)
+    prompt = story_generator._construct_story_prompt(new_story_request, language)
+    prompt_hash = _prompt_hash(prompt, provider)
+
+    async def events():
+        chunks = []
+        try:
+            async for chunk in story_generator.stream_bedtime_story(
+                new_story_request, provider=provider, language=language, prompt=prompt
+            ):
+                chunks.append(chunk)
+                yield _server_sent_event("chunk", json.dumps({"text": chunk}))
+
+            new_story = await _store_story(
+                story.Story(
+                    text="".join(chunks),
+                    request=new_story_request.for_storage(),
+                    prompt_hash=prompt_hash,
+                    prompt_version=prompts.get_template(language).version_id,
+                )
+            )
+            generated_story_cache.put(prompt_hash, new_story)
+            yield _server_sent_event("story", new_story.model_dump_json())
+        except Exception as e:
+            yield _server_sent_event(
+                "error",
+                json.dumps(
+                    {"detail": f"Fehler bei der Geschichtsgenerierung: {str(e)}"}
+                ),
+            )
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get(
+    "/api/feed",
+    name="Änderungen abonnieren",
+    description="Server-Sent Events für neue und gelöschte Geschichten, Charaktere und Fabelwesen, statt /api/stories/sorted und /api/metadata abzufragen. Geschichten kommen als Zusammenfassung ohne Text.",
+)
+async def story_feed():
+    """Sende Änderungen, sobald sie gespeichert sind"""
+
+    async def events():
+        async for data in live_story_feed.bus.subscribe():
+            if data is None:
+                yield ": keepalive\n\n"
+            else:
+                yield _server_sent_event("change", data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+BulkCollection = Literal["characters", "creatures", "stories"]
+
+
+@app.get(
+    "/api/export/{collection}",
+    name="Sammlung exportieren",
+    description="Exportiere alle Charaktere, Fabelwesen oder Geschichten als NDJSON, ein Dokument pro Zeile",
+    tags=["Import/Export"],
+)
+async def export_collection(collection: BulkCollection):
+    """Streame alle Dokumente einer Sammlung"""
+    return StreamingResponse(
+        bulk.export_lines(bulk.MODELS[collection]),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{collection}.ndjson"'},
+    )
+
+
+def _imported(documents: list):
+    metadata_cache.invalidate()
+    for document in documents:
+        if isinstance(document, story.Story):
+            story_search.add(document)
+        else:
+            story_entities.put(document)
+
+
+@app.post(
+    "/api/import/{collection}",
+    name="Sammlung importieren",
+    description="Importiere Charaktere, Fabelwesen oder Geschichten aus NDJSON, z.B. aus /api/export. Vorhandene ids bleiben erhalten; fehlerhafte Zeilen und doppelte ids werden mit Zeilennummer gemeldet, alle anderen gespeichert.",
+    tags=["Import/Export"],
+)
+async def import_collection(request: Request, collection: BulkCollection):
+    """Importiere Dokumente zeilenweise aus dem Request-Body"""
+    return await bulk.import_lines(
+        bulk.MODELS[collection], request.stream(), on_inserted=_imported
+    )
+
+
 @app.get(
     "/api/metadata",
     name="Metadaten abrufen",
     description="Rufe vordefinierte Standorte und Themen ab",
 )
-async def get_story_metadata():
+async def get_story_metadata(request: Request):
     """Liefere alle Charakter, vordefinierte Standorte und Themen"""
+    body, etag = await metadata_cache.get(_build_story_metadata)
+    return response_cache.json_response(request, body, etag)
+
 
-    characters = await list_characters()
-    creatures = await list_creatures()
-    stories = await list_stories_sorted()
+async def _build_story_metadata():
+    (characters, _), (creatures, _), (stories, _) = await asyncio.gather(
+        _find_page(mongodb.characters, character.Character.from_documents),
+        _find_page(mongodb.creatures, creature.Creature.from_documents),
+        _find_stories_page(limit=30, newest_first=True),
+    )
 
     return {
         "characters": characters,
@@ -542,6 +1188,131 @@ async def get_story_metadata():
     }
 
 
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Liveness: der Prozess läuft und beantwortet Anfragen"""
+    return {"status": "ok"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus-Metriken dieses Workers"""
+    return metrics.metrics_response()
+
+
+def _collect_app_metrics():
+    """Zähler, die Caches, Single-Flight, Router, Auftragsverarbeitung,
+    Live-Feed, Client-Limits und Vorab-Generierung selbst führen, beim Abruf
+    von /metrics auslesen"""
+    caches = CounterMetricFamily(
+        "cache_lookups", "Cache lookups by result", labels=["cache", "result"]
+    )
+    for name, cache in (
+        ("story", generated_story_cache),
+        ("entity", story_entities),
+        ("metadata", metadata_cache),
+        ("story_body", story_bodies),
+    ):
+        caches.add_metric([name, "hit"], cache.hits)
+        caches.add_metric([name, "miss"], cache.misses)
+    yield caches
+
+    generations = CounterMetricFamily(
+        "story_generations",
+        "Generations started vs. requests that joined one already running",
+        labels=["result"],
+    )
+    generations.add_metric(["executed"], story_generations.executions)
+    generations.add_metric(["coalesced"], story_generations.coalesced)
+    yield generations
+    yield GaugeMetricFamily(
+        "story_generations_in_flight",
+        "Generations currently running",
+        value=story_generations.in_flight,
+    )
+
+    routing_events = CounterMetricFamily(
+        "provider_routing_events", "Failovers and hedged calls", labels=["event"]
+    )
+    routing_events.add_metric(["failover"], story_router.failovers)
+    routing_events.add_metric(["hedge"], story_router.hedges)
+    yield routing_events
+    breakers = GaugeMetricFamily(
+        "provider_circuit_open",
+        "1 while the circuit breaker of a provider is open or half-open",
+        labels=["provider"],
+    )
+    for name, breaker in story_router.breakers.items():
+        breakers.add_metric([name], breaker.state != "closed")
+    yield breakers
+
+    job_results = CounterMetricFamily(
+        "story_jobs", "Finished story jobs and retries", labels=["result"]
+    )
+    job_results.add_metric(["succeeded"], story_jobs.succeeded)
+    job_results.add_metric(["failed"], story_jobs.failed)
+    job_results.add_metric(["retried"], story_jobs.retries)
+    yield job_results
+    yield GaugeMetricFamily(
+        "live_feed_subscribers",
+        "Clients connected to /api/feed",
+        value=live_story_feed.bus.subscribers,
+    )
+    feed_events = CounterMetricFamily(
+        "live_feed_events",
+        "Change events published, and clients dropped for lagging behind",
+        labels=["event"],
+    )
+    feed_events.add_metric(["published"], live_story_feed.bus.published)
+    feed_events.add_metric(["dropped"], live_story_feed.bus.dropped)
+    yield feed_events
+    quota_rejections = CounterMetricFamily(
+        "quota_rejections",
+        "Generation requests rejected with 429, by exceeded limit",
+        labels=["limit"],
+    )
+    for limit, count in client_quotas.rejected.items():
+        quota_rejections.add_metric([limit], count)
+    yield quota_rejections
+    pregenerated = CounterMetricFamily(
+        "pregenerated_stories",
+        "Stories generated ahead of the peak, and generate requests that "
+        "claimed one or found none",
+        labels=["result"],
+    )
+    pregenerated.add_metric(["generated"], story_pregeneration.generated)
+    pregenerated.add_metric(["failed"], story_pregeneration.failed)
+    pregenerated.add_metric(["claimed"], story_pregeneration.claimed)
+    pregenerated.add_metric(["missed"], story_pregeneration.missed)
+    yield pregenerated
+    if (pending := story_jobs.queue.pending()) is not None:
+        yield GaugeMetricFamily(
+            "story_jobs_pending", "Queued story jobs", value=pending
+        )
+
+
+metrics.register_collector(_collect_app_metrics)
+providers.usage_listeners.append(metrics.record_tokens)
+providers.usage_listeners.append(client_quotas.record_usage)
+
+
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    """Readiness: Datenbank und Indizes sind bereit, Verbindungen aufgewärmt,
+    der Standard-Anbieter ist konfiguriert"""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "starting"},
+        )
+    if not story_providers.default_available:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"status": "default provider not configured"},
+        )
+    return {"status": "ready"}
+
+
 # Zusätzliche Konfiguration
 # Erweiterter Fehlerbehandlungskontext
 @app.exception_handler(HTTPException)
@@ -552,10 +1323,14 @@ async def http_exception_handler(request, exc):
         404: "Die angeforderte Ressource wurde nicht gefunden.",
         500: "Ein interner Serverfehler ist aufgetreten. Bitte versuchen Sie es später wieder.",
     }
-    return {
-        "status_code": exc.status_code,
-        "message": error_messages.get(exc.status_code, str(exc.detail)),
-    }
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "status_code": exc.status_code,
+            "message": error_messages.get(exc.status_code, str(exc.detail)),
+        },
+        headers=exc.headers,
+    )
 
 
 if __name__ == "__main__":
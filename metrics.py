@@ -0,0 +1,124 @@
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.registry import Collector
+from pymongo import monitoring
+from starlette.responses import Response
+
+# LLM-Aufrufe dauern Sekunden bis Minuten, HTTP- und Mongo-Zugriffe Millisekunden
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+_LLM_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 90, 120, 180)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency per endpoint, until the last byte is sent",
+    ["method", "route", "status"],
+    buckets=_FAST_BUCKETS + (10, 30, 60, 120),
+)
+MONGO_LATENCY = Histogram(
+    "mongo_operation_duration_seconds",
+    "MongoDB command latency",
+    ["collection", "command", "outcome"],
+    buckets=_FAST_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time until a streaming provider sends the first chunk",
+    ["provider"],
+    buckets=_LLM_BUCKETS,
+)
+LLM_DURATION = Histogram(
+    "llm_generation_duration_seconds",
+    "Total duration of a generation",
+    ["provider", "outcome"],
+    buckets=_LLM_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens reported by the providers",
+    ["provider", "kind"],
+)
+
+
+def record_tokens(provider: str, prompt_tokens: int, response_tokens: int):
+    LLM_TOKENS.labels(provider, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(provider, "response").inc(response_tokens)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds MONGO_LATENCY; pass it to the client as an event listener"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[event.request_id] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def _observe(self, event, outcome):
+        collection = self._collections.pop(event.request_id, "")
+        MONGO_LATENCY.labels(collection, event.command_name, outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+
+class CallbackCollector(Collector):
+    """Exports counters that other objects keep themselves, read on scrape"""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def collect(self):
+        yield from self.callback()
+
+
+def register_collector(callback):
+    REGISTRY.register(CallbackCollector(callback))
+
+
+class MetricsMiddleware:
+    """Observe REQUEST_LATENCY, labelled with the route template, not the path"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status_code),
+            ).observe(time.perf_counter() - start)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
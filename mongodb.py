@@ -1,27 +1,107 @@
 # import standard
-import os
+import asyncio
+import logging
+from typing import Optional
 
-# import pymongo
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
+
+import metrics
+import settings
 
-CONNECTION_STRING = os.environ.get("MONGO_DB_URL")
 DB_NAME = "kids-bedtime-stories"
 
-# DEV DB
-client_async = AsyncIOMotorClient(CONNECTION_STRING)
-db_async = client_async[DB_NAME]
+logger = logging.getLogger(__name__)
+
+# Set by connect() during application startup
+client_async = None
+db_async = None
+characters = None
+creatures = None
+stories = None
+
+
+def connect(config: Optional[settings.Settings] = None):
+    """Create the client and collection handles; does not do any I/O yet"""
+    global client_async, db_async, characters, creatures, stories
 
+    if db_async is not None:
+        # Already connected, or replaced by an in-memory stand-in
+        return
 
-# Send a ping to confirm a successful connection
-try:
-    client_async.admin.command("ping")
-    print("Pinged your deployment. You successfully connected to MongoDB!")
+    # Motor itself (about 20 ms on top of pymongo) is only needed once a real
+    # database is connected, the benchmarks replace it with in-memory fakes
+    from motor.motor_asyncio import AsyncIOMotorClient
 
+    config = config or settings.get_settings()
+    client_async = AsyncIOMotorClient(
+        config.mongo_db_url,
+        maxPoolSize=config.mongo_max_pool_size,
+        minPoolSize=config.mongo_min_pool_size,
+        serverSelectionTimeoutMS=config.mongo_server_selection_timeout_ms,
+        connectTimeoutMS=config.mongo_connect_timeout_ms,
+        socketTimeoutMS=config.mongo_socket_timeout_ms,
+        compressors=config.mongo_compressors,
+        event_listeners=[metrics.MongoCommandListener()],
+    )
+    db_async = client_async[DB_NAME]
     characters = db_async["characters"]
-    characters.create_index("id", unique=True, background=True)
     creatures = db_async["creatures"]
-    creatures.create_index("id", unique=True, background=True)
     stories = db_async["stories"]
-    stories.create_index("id", unique=True, background=True)
-except Exception as e:
-    print(e)
+
+
+async def ping():
+    await db_async.command("ping")
+
+
+async def _drop_index(collection, name: str):
+    try:
+        await collection.drop_index(name)
+    except OperationFailure:
+        pass  # Schon entfernt
+
+
+async def create_indexes():
+    # Die Suchbegriffe stehen in einer eigenen Collection (story.search_document)
+    search = db_async["story_search"]
+    await asyncio.gather(
+        characters.create_index("id", unique=True),
+        creatures.create_index("id", unique=True),
+        stories.create_index("id", unique=True),
+        stories.create_index("prompt_hash"),
+        stories.create_index("created"),
+        _drop_index(stories, "story_search"),
+        # Volltextsuche, siehe search.MongoStorySearch
+        search.create_index("id", unique=True),
+        search.create_index(
+            [("terms", "text"), ("location", "text"), ("names", "text")],
+            name="story_search",
+            default_language="german",
+            weights={"names": 5},
+        ),
+        stories.create_index(
+            [
+                ("request.location", 1),
+                ("request.educational_topic", 1),
+                ("request.age_group", 1),
+                ("_id", -1),
+            ]
+        ),
+        stories.create_index([("request.characters.name", 1), ("_id", -1)]),
+        stories.create_index([("request.creatures.name", 1), ("_id", -1)]),
+    )
+
+
+async def warm_up(connections: Optional[int] = None):
+    """Ping over several connections at once so the pool is already open"""
+    if connections is None:
+        connections = settings.get_settings().mongo_min_pool_size
+    await asyncio.gather(*(ping() for _ in range(max(1, connections))))
+    logger.info("Pinged your deployment. You successfully connected to MongoDB!")
+
+
+def close():
+    global client_async, db_async, characters, creatures, stories
+
+    if client_async is not None:
+        client_async.close()
+    client_async = db_async = characters = creatures = stories = None
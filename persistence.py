@@ -0,0 +1,128 @@
+import logging
+import uuid
+from typing import Callable, ClassVar, List, Optional, Tuple
+
+from pydantic import BaseModel
+from pymongo.errors import BulkWriteError
+
+import mongodb
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Called with (collection, operation, document) after every insert or delete
+# through these models; a delete only passes {"id": ...}
+write_listeners: List[Callable[[str, str, dict], None]] = []
+
+
+def _notify(collection: str, operation: str, documents: List[dict]):
+    for listener in write_listeners:
+        for document in documents:
+            listener(collection, operation, document)
+
+
+class MongoDocument(BaseModel):
+    """Base class for models stored in one of the collections in ``mongodb``.
+
+    Writes use a single round trip: ``create`` returns the validated
+    in-memory object once the insert is acknowledged instead of reading the
+    document back, and ``delete`` relies on ``deleted_count``.
+    """
+
+    # Attribute name of the collection in the mongodb module
+    mongo_db_collection: ClassVar[str]
+    # Fields only the server sets; cleared on documents sent by clients
+    server_fields: ClassVar[Tuple[str, ...]] = ()
+
+    id: Optional[str] = None
+
+    @classmethod
+    def collection(cls):
+        return getattr(mongodb, cls.mongo_db_collection)
+
+    def _label(self):
+        return self.__class__.__name__.lower()
+
+    def _prepare_create(self):
+        self.id = str(uuid.uuid4())
+
+    def without_server_fields(self):
+        """A copy of a client-supplied document without ``server_fields``"""
+        return self.model_copy(update={field: None for field in self.server_fields})
+
+    def to_document(self) -> dict:
+        """The document as it is written to Mongo"""
+        return self.model_dump()
+
+    @classmethod
+    def from_documents(cls, documents: List[dict]) -> list:
+        """Validate stored documents in bulk; invalid ones are skipped"""
+        return serialization.validate_many(cls, documents)
+
+    async def create(self):
+        try:
+            self._prepare_create()
+            document = self.to_document()
+            result = await self.collection().insert_one(document)
+            if not result.acknowledged:
+                raise Exception(
+                    f"Could not create new {self._label()} in collection '{self.mongo_db_collection}'."
+                )
+            _notify(self.mongo_db_collection, "insert", [document])
+            return self
+        except Exception:
+            logger.exception(
+                f"Could not create new {self._label()}",
+                extra={"collection": self.mongo_db_collection},
+            )
+            raise
+
+    @classmethod
+    async def create_many(cls, documents: List["MongoDocument"]):
+        """Create several new documents with one unordered insert_many"""
+        for document in documents:
+            document._prepare_create()
+        return await cls.insert_many(documents)
+
+    @classmethod
+    async def insert_many(cls, documents: List["MongoDocument"]):
+        """Insert documents that already went through ``_prepare_create``"""
+        if documents:
+            stored = [document.to_document() for document in documents]
+            try:
+                result = await cls.collection().insert_many(stored, ordered=False)
+            except BulkWriteError as e:
+                # Unordered: everything without a write error was inserted
+                failed = {error["index"] for error in e.details["writeErrors"]}
+                _notify(
+                    cls.mongo_db_collection,
+                    "insert",
+                    [d for index, d in enumerate(stored) if index not in failed],
+                )
+                raise
+            if not result.acknowledged:
+                raise Exception(
+                    f"Could not create new documents in collection '{cls.mongo_db_collection}'."
+                )
+            _notify(cls.mongo_db_collection, "insert", stored)
+        return documents
+
+    async def save(self):
+        try:
+            result = await self.collection().update_one(
+                {"id": self.id}, {"$set": self.to_document()}
+            )
+            return self if result.matched_count else None
+        except Exception:
+            logger.exception(
+                f"Could not update {self._label()}",
+                extra={"collection": self.mongo_db_collection, "id": self.id},
+            )
+            raise
+
+    @classmethod
+    async def delete(cls, id: str) -> bool:
+        result = await cls.collection().delete_one({"id": id})
+        if result.deleted_count:
+            _notify(cls.mongo_db_collection, "delete", [{"id": id}])
+        return result.deleted_count > 0
@@ -0,0 +1,408 @@
+import asyncio
+import datetime
+import itertools
+import logging
+import random
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+import character
+import creature
+import entity_cache
+import mongodb
+import settings
+import story
+
+PREGENERATED_MONGO_DB_COLLECTION = "pregenerated_stories"
+SCHEDULER_LOCK_MONGO_DB_COLLECTION = "scheduler_locks"
+
+_config = settings.get_settings()
+
+# Geschichten außerhalb der Abendspitze im Voraus generieren
+PREGENERATION_ENABLED = _config.pregeneration_enabled
+# So viele unbeanspruchte Geschichten werden höchstens vorgehalten. Es
+# generiert immer nur ein Worker, die Grenze gilt also für alle gemeinsam
+PREGENERATION_QUOTA = _config.pregeneration_quota
+# Gleichzeitige Generierungen des Schedulers, zusätzlich begrenzt durch
+# MAX_CONCURRENT_GENERATIONS
+PREGENERATION_CONCURRENCY = _config.pregeneration_concurrency
+# Abstand zwischen zwei Läufen des Schedulers
+PREGENERATION_INTERVAL_SECONDS = _config.pregeneration_interval_seconds
+# Stoßzeit in Ortszeit, in der nichts vorab generiert wird
+PREGENERATION_PEAK = _config.pregeneration_peak
+# z.B. "Europe/Berlin"; leer bedeutet die Zeitzone des Servers
+PREGENERATION_TIMEZONE = _config.pregeneration_timezone
+# Meldet sich der generierende Worker so lange nicht, übernimmt ein anderer
+PREGENERATION_LEASE_SECONDS = _config.pregeneration_lease_seconds
+# Nicht beanspruchte Geschichten werden danach gelöscht (TTL-Index)
+PREGENERATION_MAX_AGE_HOURS = _config.pregeneration_max_age_hours
+# Aus so vielen neuesten Geschichten werden die Besetzungen übernommen
+PREGENERATION_RECENT_STORIES = _config.pregeneration_recent_stories
+# Altersgruppe für gespeicherte Charaktere, die noch in keiner Geschichte waren
+PREGENERATION_AGE_GROUP = _config.pregeneration_age_group
+
+logger = logging.getLogger(__name__)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def parse_window(window: str) -> Tuple[datetime.time, datetime.time]:
+    """``"18:30-20:30"`` as start and end time"""
+    start, end = (
+        datetime.time.fromisoformat(part.strip()) for part in window.split("-")
+    )
+    return start, end
+
+
+def _timezone(name: str) -> Optional[datetime.tzinfo]:
+    if not name:
+        return None
+    from zoneinfo import ZoneInfo
+
+    return ZoneInfo(name)
+
+
+class Cast:
+    """Characters and creatures that appear together in stories"""
+
+    def __init__(
+        self,
+        characters: List[character.Character],
+        creatures: List[creature.Creature],
+        age_group: str,
+    ):
+        self.characters = characters
+        self.creatures = creatures
+        self.age_group = age_group
+
+    @property
+    def key(self) -> tuple:
+        return (
+            tuple(c.id for c in self.characters),
+            tuple(c.id for c in self.creatures),
+            self.age_group,
+        )
+
+    def request(self, location: str, educational_topic: str) -> story.StoryRequest:
+        return story.StoryRequest(
+            characters=self.characters,
+            creatures=self.creatures,
+            location=location,
+            educational_topic=educational_topic,
+            age_group=self.age_group,
+        )
+
+
+async def saved_casts(
+    entities: entity_cache.EntityCache,
+    recent_stories: int = PREGENERATION_RECENT_STORIES,
+    age_group: str = PREGENERATION_AGE_GROUP,
+) -> List[Cast]:
+    """Casts worth pre-generating for, most likely first.
+
+    Families tend to ask for the same children and creatures again, so the
+    casts of the newest stories come first, with the current version of
+    every saved character and creature; casts with a deleted member are
+    dropped. Every saved character on its own follows.
+    """
+    cursor = (
+        mongodb.stories.find(
+            {},
+            {
+                "request.characters.id": 1,
+                "request.creatures.id": 1,
+                "request.age_group": 1,
+            },
+        )
+        .sort("_id", -1)
+        .limit(recent_stories)
+    )
+    recent = []
+    async for document in cursor:
+        request = document.get("request") or {}
+        character_ids = [c.get("id") for c in request.get("characters", [])]
+        creature_ids = [c.get("id") for c in request.get("creatures", [])]
+        if character_ids and all(character_ids + creature_ids):
+            recent.append((character_ids, creature_ids, request.get("age_group")))
+
+    characters, creatures = await asyncio.gather(
+        entities.get_many(
+            character.Character, [id for ids, _, _ in recent for id in ids]
+        ),
+        entities.get_many(
+            creature.Creature, [id for _, ids, _ in recent for id in ids]
+        ),
+    )
+    casts: Dict[tuple, Cast] = {}
+    for character_ids, creature_ids, group in recent:
+        if (
+            character_ids
+            and all(id in characters for id in character_ids)
+            and all(id in creatures for id in creature_ids)
+        ):
+            cast = Cast(
+                [characters[id] for id in character_ids],
+                [creatures[id] for id in creature_ids],
+                group or age_group,
+            )
+            casts.setdefault(cast.key, cast)
+
+    cursor = mongodb.characters.find({}).sort("_id", -1).limit(recent_stories)
+    for saved in character.Character.from_documents(
+        [document async for document in cursor]
+    ):
+        cast = Cast([saved], [], age_group)
+        casts.setdefault(cast.key, cast)
+    return list(casts.values())
+
+
+class StoryPool:
+    """Pre-generated stories that no request has claimed yet.
+
+    They live in their own collection, so lists, search, the story cache and
+    the live feed only ever see them once claimed. Claiming is a single
+    ``find_one_and_delete``: of two workers asking for the same prompt, only
+    one gets the story.
+    """
+
+    def __init__(self, max_age_hours: float = PREGENERATION_MAX_AGE_HOURS):
+        self.max_age_hours = max_age_hours
+
+    @property
+    def collection(self):
+        return mongodb.db_async[PREGENERATED_MONGO_DB_COLLECTION]
+
+    async def add(self, new_story: story.Story):
+        document = new_story.to_document()
+        document["expires"] = _now() + datetime.timedelta(hours=self.max_age_hours)
+        await self.collection.insert_one(document)
+
+    async def claim(self, prompt_hash: str) -> Optional[story.Story]:
+        """Take the oldest unclaimed story for the prompt out of the pool"""
+        document = await self.collection.find_one_and_delete(
+            {"prompt_hash": prompt_hash},
+            sort=[("_id", 1)],
+            projection={"search_terms": 0, "expires": 0},
+        )
+        if document is None:
+            return None
+        return story.Story.model_validate(document)
+
+    async def size(self) -> int:
+        return await self.collection.count_documents({})
+
+    async def prompt_hashes(self) -> Set[str]:
+        cursor = self.collection.find({}, {"prompt_hash": 1})
+        return {document["prompt_hash"] async for document in cursor}
+
+
+class SchedulerLease:
+    """Lets only one worker of a deployment run a scheduler at a time.
+
+    The lease is one document per scheduler. ``acquire`` takes it over if it
+    is free, expired or already ours, and renews it in the same atomic
+    ``find_one_and_update``; a worker that dies simply stops renewing.
+    """
+
+    def __init__(self, name: str, seconds: float = PREGENERATION_LEASE_SECONDS):
+        self.name = name
+        self.seconds = seconds
+        self.owner = str(uuid.uuid4())
+
+    @property
+    def collection(self):
+        return mongodb.db_async[SCHEDULER_LOCK_MONGO_DB_COLLECTION]
+
+    async def acquire(self) -> bool:
+        now = _now()
+        try:
+            await self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"owner": self.owner}, {"expires": {"$lt": now}}],
+                },
+                {
+                    "$set": {
+                        "owner": self.owner,
+                        "expires": now + datetime.timedelta(seconds=self.seconds),
+                    }
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease: the upsert found no match and
+            # the insert collided with its document
+            return False
+        return True
+
+    async def release(self):
+        await self.collection.delete_one({"_id": self.name, "owner": self.owner})
+
+
+async def create_indexes():
+    if PREGENERATION_ENABLED:
+        collection = StoryPool().collection
+        await asyncio.gather(
+            collection.create_index("prompt_hash"),
+            collection.create_index("expires", expireAfterSeconds=0),
+        )
+
+
+class PregenerationScheduler:
+    """Fills the story pool outside the evening peak.
+
+    Every ``interval_seconds`` outside the ``peak`` window it tops the pool
+    up to ``quota`` stories, at most ``concurrency`` generations at a time.
+    Each cast from ``casts`` walks through all location × topic combinations
+    in turn, starting where its last run stopped, so the pool covers many
+    different evenings instead of the same story twice. Requests then claim
+    a story from the pool instead of waiting for the provider; the pool
+    refills with the next off-peak run.
+    """
+
+    def __init__(
+        self,
+        pool: StoryPool,
+        casts: Callable[[], Awaitable[List[Cast]]],
+        prompt_hash: Callable[[story.StoryRequest], str],
+        generate: Callable[[story.StoryRequest, str], Awaitable[story.Story]],
+        locations: Sequence[str],
+        educational_topics: Sequence[str],
+        enabled: bool = PREGENERATION_ENABLED,
+        quota: int = PREGENERATION_QUOTA,
+        concurrency: int = PREGENERATION_CONCURRENCY,
+        interval_seconds: float = PREGENERATION_INTERVAL_SECONDS,
+        peak: str = PREGENERATION_PEAK,
+        timezone: str = PREGENERATION_TIMEZONE,
+        lease: Optional[SchedulerLease] = None,
+    ):
+        self.pool = pool
+        self.lease = lease or SchedulerLease("pregeneration")
+        self.casts = casts
+        self.prompt_hash = prompt_hash
+        self.generate = generate
+        self.combinations = list(itertools.product(locations, educational_topics))
+        # Fest gemischt, damit aufeinanderfolgende Geschichten Ort und Thema wechseln
+        random.Random(0).shuffle(self.combinations)
+        self.enabled = enabled
+        self.quota = quota
+        self.concurrency = max(1, concurrency)
+        self.interval_seconds = interval_seconds
+        self.peak = parse_window(peak)
+        self.timezone = _timezone(timezone)
+        # Nächste Kombination aus Ort und Thema je Besetzung
+        self._positions: Dict[tuple, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.generated = 0
+        self.failed = 0
+        self.claimed = 0
+        self.missed = 0
+
+    def in_peak(self, now: Optional[datetime.datetime] = None) -> bool:
+        local = (now or datetime.datetime.now(self.timezone)).astimezone(self.timezone)
+        start, end = self.peak
+        if start <= end:
+            return start <= local.time() < end
+        # Über Mitternacht, z.B. "22:00-02:00"
+        return local.time() >= start or local.time() < end
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            try:
+                await self.lease.release()
+            except Exception:
+                pass  # Läuft ohnehin ab
+
+    async def claim(self, prompt_hash: str) -> Optional[story.Story]:
+        if not self.enabled:
+            return None
+        claimed = await self.pool.claim(prompt_hash)
+        if claimed is None:
+            self.missed += 1
+        else:
+            self.claimed += 1
+        return claimed
+
+    async def _loop(self):
+        while True:
+            if not self.in_peak():
+                try:
+                    await self.run_once()
+                except Exception:
+                    logger.exception("Story pre-generation failed")
+            await asyncio.sleep(self.interval_seconds)
+
+    def _plan(
+        self, casts: List[Cast], taken: Set[str], count: int
+    ) -> List[Tuple[story.StoryRequest, str]]:
+        """The next ``count`` requests, one cast after the other, skipping
+        prompts that already have a story in the pool"""
+        planned = []
+        remaining = {cast.key: len(self.combinations) for cast in casts}
+        while len(planned) < count and any(remaining.values()):
+            for cast in casts:
+                if len(planned) >= count:
+                    break
+                while remaining[cast.key]:
+                    remaining[cast.key] -= 1
+                    position = self._positions.get(cast.key, 0)
+                    self._positions[cast.key] = (position + 1) % len(self.combinations)
+                    request = cast.request(*self.combinations[position])
+                    prompt_hash = self.prompt_hash(request)
+                    if prompt_hash not in taken:
+                        taken.add(prompt_hash)
+                        planned.append((request, prompt_hash))
+                        break
+        return planned
+
+    async def run_once(self) -> int:
+        """Top the pool up to the quota; returns the number of new stories.
+
+        Only the worker holding the lease generates, so the pool size read
+        here is not raced by other workers filling it at the same time.
+        """
+        if not await self.lease.acquire():
+            return 0
+        missing = self.quota - await self.pool.size()
+        if missing <= 0 or not self.combinations:
+            return 0
+        casts = await self.casts()
+        planned = self._plan(casts, await self.pool.prompt_hashes(), missing)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def pregenerate(request: story.StoryRequest, prompt_hash: str) -> bool:
+            async with semaphore:
+                # Läuft die Stoßzeit schon, bleibt die Kapazität den Anfragen;
+                # das Erneuern hält den Lease auch über lange Läufe
+                if self.in_peak() or not await self.lease.acquire():
+                    return False
+                try:
+                    await self.pool.add(await self.generate(request, prompt_hash))
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(
+                        "Could not pre-generate story", extra={"error": str(e)}
+                    )
+                    return False
+                self.generated += 1
+                return True
+
+        results = await asyncio.gather(
+            *(pregenerate(request, prompt_hash) for request, prompt_hash in planned)
+        )
+        logger.info(
+            "Pre-generated stories",
+            extra={"planned": len(planned), "generated": sum(results)},
+        )
+        return sum(results)
@@ -0,0 +1,311 @@
+import hashlib
+import json
+from operator import itemgetter
+from string import Formatter
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+import story
+
+DEFAULT_LANGUAGE = "de"
+
+# Platzhalter, die erst beim Rendern einer Anfrage gefüllt werden
+_CHARACTER_FIELDS = {
+    "name": "{name}",
+    "age": "{age}",
+    "looks_like": "{looks_like}",
+    "traits": "{traits}",
+    "interests": "{interests}",
+}
+
+
+def compile_template(template: str, fields: Sequence[str]) -> Callable[..., str]:
+    """Compile a str.format template into a function filling in its fields.
+
+    Parsing the template happens once here instead of on every call: it is
+    turned into a %-format with one ``%s`` per field, so rendering is a
+    single C-level ``%`` with the values in template order.
+    """
+    parts = list(Formatter().parse(template))
+    used = {field for _, field, _, _ in parts if field is not None}
+    if not used <= set(fields):
+        raise ValueError(f"Unknown template fields: {sorted(used - set(fields))}")
+    if any(spec or conversion for _, _, spec, conversion in parts):
+        raise ValueError("Template fields must not use format specs or conversions")
+
+    text = "".join(
+        literal.replace("%", "%%") + ("" if field is None else "%s")
+        for literal, field, _, _ in parts
+    )
+    order = [field for _, field, _, _ in parts if field is not None]
+    # itemgetter returns a tuple for two or more fields only
+    values_of = (
+        itemgetter(*order)
+        if len(order) > 1
+        else lambda values: tuple(values[field] for field in order)
+    )
+
+    def render(**values) -> str:
+        return text % values_of(values)
+
+    return render
+
+
+class PromptTemplate:
+    """A versioned, language-specific story prompt.
+
+    Everything that does not depend on the individual request is resolved
+    once in ``__init__``: the gender specific words are baked into one
+    character and one creature template per gender, all templates are
+    compiled with ``compile_template`` and all lookups are plain dicts.
+    ``render`` then only fills in the request fields.
+    """
+
+    def __init__(
+        self,
+        language: str,
+        version: str,
+        lines: Sequence[str],
+        character: str,
+        creature: str,
+        creature_introduction: str,
+        genders: Dict[str, Dict[str, str]],
+        default_gender: str,
+        age_group_wording: Dict[str, str],
+        educational_context: Dict[str, str],
+        default_educational_context: str,
+        conjunction: str,
+        age_group_labels: Optional[Dict[str, str]] = None,
+    ):
+        self.language = language
+        self.version = version
+        self._template = compile_template(
+            "\n        ".join(lines),
+            (
+                "age_group",
+                "characters",
+                "location",
+                "creature_introduction",
+                "educational_context",
+                "age_appropriate_choice_of_words",
+            ),
+        )
+        self._character_formats = {
+            gender: compile_template(
+                character.format(**words, **_CHARACTER_FIELDS),
+                ("name", "age", "traits", "interests"),
+            )
+            for gender, words in genders.items()
+        }
+        self._creature_formats = {
+            gender: compile_template(
+                creature.format(**words, **_CHARACTER_FIELDS),
+                ("name", "looks_like", "traits", "interests"),
+            )
+            for gender, words in genders.items()
+        }
+        self._conjunction = conjunction
+        self._default_gender = default_gender
+        self._creature_introduction = compile_template(
+            creature_introduction, ("creatures",)
+        )
+        self._age_group_wording = age_group_wording
+        self._age_group_labels = age_group_labels or {}
+        self._educational_context = {
+            topic.lower(): context for topic, context in educational_context.items()
+        }
+        self._default_educational_context = default_educational_context
+
+        fingerprint = json.dumps(
+            [lines, character, creature, creature_introduction, genders, conjunction]
+            + [age_group_wording, educational_context, default_educational_context]
+            + [self._age_group_labels],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:8]
+        # Stable as long as the template content does not change
+        self.version_id = f"{language}-{version}-{digest}"
+
+    def _describe_character(self, char) -> str:
+        template = self._character_formats.get(char.gender) or (
+            self._character_formats[self._default_gender]
+        )
+        return template(
+            name=char.name,
+            age=char.age,
+            traits=", ".join(char.personality_traits),
+            interests=", ".join(char.interests),
+        )
+
+    def _describe_creature(self, creature) -> str:
+        template = self._creature_formats.get(creature.gender) or (
+            self._creature_formats[self._default_gender]
+        )
+        return template(
+            name=creature.name,
+            looks_like=creature.looks_like,
+            traits=", ".join(creature.personality_traits),
+            interests=", ".join(creature.interests),
+        )
+
+    def render(self, story_request: story.StoryRequest) -> str:
+        character_descriptions = self._conjunction.join(
+            self._describe_character(char) for char in story_request.characters
+        )
+
+        if story_request.creatures:
+            creature_introduction = self._creature_introduction(
+                creatures=self._conjunction.join(
+                    self._describe_creature(creature)
+                    for creature in story_request.creatures
+                )
+            )
+        else:
+            creature_introduction = ""
+
+        return self._template(
+            age_group=self._age_group_labels.get(
+                story_request.age_group, story_request.age_group
+            ),
+            characters=character_descriptions,
+            location=story_request.location,
+            creature_introduction=creature_introduction,
+            educational_context=self._educational_context.get(
+                story_request.educational_topic.lower(),
+                self._default_educational_context,
+            ),
+            age_appropriate_choice_of_words=self._age_group_wording.get(
+                story_request.age_group, ""
+            ),
+        )
+
+
+_DE_AGE_WORDING = (
+    "Der Stil und die Wörter der Geschichte müssen ausschliesslich in {label}"
+    "-gerechter Sprache geschrieben sein und es dürfen keinerlei sexuelle "
+    "Inhalte in der Geschichte vorkommen!"
+)
+
+DE_V1 = PromptTemplate(
+    language="de",
+    version="v1",
+    lines=(
+        "Schreibe eine Geschichte für {age_group} über {characters}. ",
+        "Die Geschichte spielt in dieser Umgebung: {location}.",
+        "{creature_introduction} ",
+        "Die Geschichte soll auf eine subtile Art und Weise über das folgende "
+        "Thema lehren: {educational_context}. ",
+        "Die Geschichte soll fesselnd, lehrreich und mit einer positiven "
+        "moralischen Lektion versehen sein.",
+        "Die Geschichte soll mindestens 3 DIN A4 Seiten lang sein.",
+        "Die Geschichte soll in einfachen Worten und kurzen Sätzen erzählt werden.",
+        "{age_appropriate_choice_of_words}",
+        "Gib keinerlei Seitenzahlen und keine anderen Marker und keine "
+        "Überschriften aus.",
+        "",
+    ),
+    character="{name}, {article} {age}-jährig{ending}, {pronoun} diese "
+    "Persönlichkeit hat: {traits} und {pronoun} gerne {interests} mag und macht",
+    creature="{name}, {article} {looks_like}, {pronoun} diese Persönlichkeit "
+    "hat: {traits} und {pronoun} sich besonders gut mit {interests} auskennt",
+    creature_introduction="In der Geschichte soll zusätzlich dieses Wesen "
+    "mitspielen und mit den anderen Charakteren interagieren: {creatures}",
+    genders={
+        "weiblich": {"article": "eine", "ending": "e", "pronoun": "die"},
+        "männlich": {"article": "einen", "ending": "en", "pronoun": "der"},
+    },
+    default_gender="männlich",
+    conjunction=" und ",
+    age_group_wording={
+        "Kinder": _DE_AGE_WORDING.format(label="kinder"),
+        "Jugendliche": _DE_AGE_WORDING.format(label="jugendlichen"),
+    },
+    educational_context={
+        "Finanzielle Bildung": "Lerne über Sparen und kluges Ausgeben",
+        "Achtsamkeit": "Entdecke die Kraft des Gegenwärtig-Seins",
+        "Christlicher Glaube": "Lerne über Gott, Jesus und die Bibel",
+        "Gesunde Ernährung": "Erkunde nahrhaftes und leckeres Essen",
+        "Persönlichkeitsentwicklung": "Baue Selbstvertrauen und Freundlichkeit auf",
+        "Emotionale Intelligenz": "Verstehe und teile Gefühle",
+        "Teamarbeit": "Lerne die Kraft der Zusammenarbeit",
+        "Freundlichkeit": "Entdecke die Bedeutung von Mitgefühl und Güte",
+        "Umweltschutz": "Lerne, unseren Planeten zu schützen und zu respektieren",
+        "Vogelkunde": "Entdecke Vögel und ihre Besonderheiten und Lebensweise",
+        "Respekt": "Verstehe die Wichtigkeit, andere zu achten und zu behandeln",
+        "Musik": "Entdecke Instrumente und Gesang",
+        "Mut": "Finde Kraft und Selbstvertrauen in herausfordernden Situationen",
+    },
+    default_educational_context="Ein magisches Lern-Abenteuer",
+)
+
+_EN_AGE_WORDING = (
+    "The style and words of the story must be written exclusively in language "
+    "suitable for {label} and the story must not contain any sexual content!"
+)
+
+EN_V1 = PromptTemplate(
+    language="en",
+    version="v1",
+    lines=(
+        "Write a story for {age_group} about {characters}. ",
+        "The story takes place in this setting: {location}.",
+        "{creature_introduction} ",
+        "The story should subtly teach about the following topic: "
+        "{educational_context}. ",
+        "The story should be captivating, educational and carry a positive "
+        "moral lesson.",
+        "The story should be at least 3 letter-sized pages long.",
+        "The story should be told in simple words and short sentences.",
+        "{age_appropriate_choice_of_words}",
+        "Do not output any page numbers, other markers or headings.",
+        "",
+    ),
+    character="{name}, a {age}-year-old {noun} whose personality is: {traits} "
+    "and who likes to do {interests}",
+    creature="{name}, a {looks_like} whose personality is: {traits} and "
+    "{pronoun} knows a lot about {interests}",
+    creature_introduction="This creature should also appear in the story and "
+    "interact with the other characters: {creatures}",
+    genders={
+        "weiblich": {"noun": "girl", "pronoun": "who"},
+        "männlich": {"noun": "boy", "pronoun": "who"},
+    },
+    default_gender="männlich",
+    conjunction=" and ",
+    age_group_wording={
+        "Kinder": _EN_AGE_WORDING.format(label="children"),
+        "Jugendliche": _EN_AGE_WORDING.format(label="teenagers"),
+    },
+    age_group_labels={"Kinder": "children", "Jugendliche": "teenagers"},
+    educational_context={
+        "Finanzielle Bildung": "Learn about saving and spending wisely",
+        "Achtsamkeit": "Discover the power of being present",
+        "Christlicher Glaube": "Learn about God, Jesus and the Bible",
+        "Gesunde Ernährung": "Explore nutritious and tasty food",
+        "Persönlichkeitsentwicklung": "Build self-confidence and kindness",
+        "Emotionale Intelligenz": "Understand and share feelings",
+        "Teamarbeit": "Learn the power of working together",
+        "Freundlichkeit": "Discover the meaning of compassion and kindness",
+        "Umweltschutz": "Learn to protect and respect our planet",
+        "Vogelkunde": "Discover birds, their special features and way of life",
+        "Respekt": "Understand the importance of treating others with respect",
+        "Musik": "Discover instruments and singing",
+        "Mut": "Find strength and confidence in challenging situations",
+    },
+    default_educational_context="A magical learning adventure",
+)
+
+TEMPLATES: Dict[Tuple[str, str], PromptTemplate] = {
+    (template.language, template.version): template for template in (DE_V1, EN_V1)
+}
+# Version, die für neue Geschichten je Sprache verwendet wird
+CURRENT_VERSIONS = {"de": "v1", "en": "v1"}
+
+
+def get_template(
+    language: str = DEFAULT_LANGUAGE, version: Optional[str] = None
+) -> PromptTemplate:
+    version = version or CURRENT_VERSIONS.get(language)
+    if (language, version) not in TEMPLATES:
+        raise KeyError(f"Keine Prompt-Vorlage für Sprache '{language}' ({version}).")
+    return TEMPLATES[(language, version)]
@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import random
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Called with (provider name, prompt tokens, response tokens) per generation
+usage_listeners: List[Callable[[str, int, int], None]] = []
+
+
+class StoryProvider:
+    """Base class for LLM backends that turn a prompt into a story.
+
+    Providers are created once per worker and reused for every request, so
+    implementations keep their SDK clients and connection pools on the
+    instance instead of building them per call.
+    """
+
+    name = "base"
+
+    async def generate(self, prompt: str) -> str:
+        chunks = [chunk async for chunk in self.stream(prompt)]
+        return "".join(chunks)
+
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def warm_up(self):
+        """Open the connection to the backend before the first story request"""
+
+    async def aclose(self):
+        pass
+
+    def _report_usage(self, prompt_tokens: int, response_tokens: int):
+        for listener in usage_listeners:
+            listener(self.name, prompt_tokens or 0, response_tokens or 0)
+
+
+class GeminiProvider(StoryProvider):
+    name = "google"
+
+    def __init__(self, api_key: str, model_name: str = "gemini-1.5-flash-002"):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._model = None
+
+    @property
+    def model(self):
+        # The SDK takes over half a second to import, so it is only loaded
+        # on first use, normally during warm_up in the lifespan
+        if self._model is None:
+            import google.generativeai as genai
+
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(
+                model_name=self.model_name,
+                generation_config={
+                    "temperature": 0.9,
+                    "top_p": 0.95,
+                    "top_k": 40,
+                    # "max_output_tokens": 8192,
+                    "response_mime_type": "text/plain",
+                },
+            )
+        return self._model
+
+    def _report_response_usage(self, response):
+        if usage := getattr(response, "usage_metadata", None):
+            self._report_usage(usage.prompt_token_count, usage.candidates_token_count)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        self._report_response_usage(response)
+        return response.text
+
+    async def warm_up(self):
+        # Import the SDK off the event loop, Mongo warms up meanwhile
+        model = await asyncio.to_thread(lambda: self.model)
+        await model.count_tokens_async("Gute Nacht")
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        last_chunk = None
+        async for chunk in response:
+            last_chunk = chunk
+            if chunk.text:
+                yield chunk.text
+        # Every chunk carries the usage so far, the last one the total
+        self._report_response_usage(last_chunk)
+
+
+class OpenAICompatibleProvider(StoryProvider):
+    """Any OpenAI-compatible chat completions API, e.g. NVIDIA NIM"""
+
+    name = "nvidia"
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://integrate.api.nvidia.com/v1",
+        model_name: str = "nvidia/llama-3.1-nemotron-70b-instruct",
+        max_connections: int = 20,
+    ):
+        self.model_name = model_name
+        self.api_key = api_key
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self._client = None
+
+    @property
+    def client(self):
+        # Created on first use, for the same reason as GeminiProvider.model
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            self._client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                        keepalive_expiry=120,
+                    ),
+                ),
+            )
+        return self._client
+
+    def _create(self, prompt: str, stream: bool):
+        return self.client.chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            temperature=0.9,
+            top_p=1,
+            # max_tokens=1024,
+            stream=stream,
+            **({"stream_options": {"include_usage": True}} if stream else {}),
+        )
+
+    def _report_response_usage(self, response):
+        if usage := getattr(response, "usage", None):
+            self._report_usage(usage.prompt_tokens, usage.completion_tokens)
+
+    async def generate(self, prompt: str) -> str:
+        response = await self._create(prompt, stream=False)
+        self._report_response_usage(response)
+        return response.choices[0].message.content
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        completion = await self._create(prompt, stream=True)
+        async for chunk in completion:
+            if chunk.choices and chunk.choices[0].delta.content is not None:
+                yield chunk.choices[0].delta.content
+            # Only the final chunk has usage, and no choices
+            self._report_response_usage(chunk)
+
+    async def warm_up(self):
+        client = await asyncio.to_thread(lambda: self.client)
+        await client.models.list()
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+
+
+class ProviderError(Exception):
+    """Error with an HTTP-like status code, raised by the fake provider"""
+
+    def __init__(self, message: str, status_code: int = 503):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeProvider(StoryProvider):
+    """Local provider without network access for development and benchmarks.
+
+    Latency, jitter and failures can be injected to exercise timeouts,
+    failover and hedging offline.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        text: Optional[str] = None,
+        name: Optional[str] = None,
+        jitter: float = 0.0,
+        failure_rate: float = 0.0,
+        failure_status_code: int = 503,
+        seed: Optional[int] = None,
+    ):
+        if name:
+            self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status_code = failure_status_code
+        self._random = random.Random(seed)
+        self.text = text or (
+            "Es war einmal ein kleines Abenteuer, das ganz leise begann. "
+            "Am Ende schliefen alle glücklich und zufrieden ein."
+        )
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        latency = self.latency + self._random.uniform(0, self.jitter)
+        if self._random.random() < self.failure_rate:
+            await asyncio.sleep(latency / 2)
+            raise ProviderError(
+                f"Fake provider '{self.name}' failed", self.failure_status_code
+            )
+
+        words = self.text.split(" ")
+        for index, word in enumerate(words):
+            await asyncio.sleep(latency / len(words))
+            yield word if index == len(words) - 1 else f"{word} "
+        # Roughly one token per word
+        self._report_usage(len(prompt.split()), len(words))
+
+
+def parse_provider_settings(spec: str, convert=float) -> Dict[str, float]:
+    """Parse settings like ``"google=4,nvidia=2"`` into a dict"""
+    settings = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = entry.partition("=")
+        settings[name.strip()] = convert(value)
+    return settings
+
+
+class ProviderRegistry:
+    """Holds one long-lived instance per configured provider"""
+
+    def __init__(self, default: str = "google", warm_up_timeout: float = 10):
+        self.default = default
+        self.warm_up_timeout = warm_up_timeout
+        self._providers: Dict[str, StoryProvider] = {}
+
+    def register(self, provider: StoryProvider):
+        self._providers[provider.name] = provider
+        return provider
+
+    def get(self, name: Optional[str] = None) -> StoryProvider:
+        name = name or self.default
+        if name not in self._providers:
+            raise KeyError(
+                f"Unbekannter Anbieter '{name}'. Verfügbar: {', '.join(self.names())}"
+            )
+        return self._providers[name]
+
+    def names(self):
+        return list(self._providers)
+
+    @property
+    def default_available(self) -> bool:
+        """False if the default provider has no credentials: a deployment
+        problem, not something a client can fix"""
+        return self.default in self._providers
+
+    async def warm_up(self, timeout: Optional[float] = None):
+        """Warm up all providers; a failing backend does not block startup"""
+        timeout = self.warm_up_timeout if timeout is None else timeout
+        results = await asyncio.gather(
+            *(
+                asyncio.wait_for(provider.warm_up(), timeout=timeout)
+                for provider in self._providers.values()
+            ),
+            return_exceptions=True,
+        )
+        for name, result in zip(self._providers, results):
+            if isinstance(result, Exception):
+                logger.warning(
+                    "Could not warm up provider",
+                    extra={"provider": name, "error": repr(result)},
+                )
+
+    async def aclose(self):
+        for provider in self._providers.values():
+            await provider.aclose()
+
+    @classmethod
+    def from_environment(cls, config: Optional[settings.Settings] = None):
+        """Register every provider that has credentials in the settings, and
+        the fake provider only if ``fake_provider_enabled`` is set.
+
+        No SDK is imported here; each provider loads its own on first use.
+        """
+        config = config or settings.get_settings()
+        registry = cls(
+            default=config.story_provider,
+            warm_up_timeout=config.provider_warm_up_timeout,
+        )
+        if config.google_gemini_api_key:
+            registry.register(GeminiProvider(api_key=config.google_gemini_api_key))
+        if config.nvidia_nemotron_api_key:
+            registry.register(
+                OpenAICompatibleProvider(
+                    api_key=config.nvidia_nemotron_api_key,
+                    base_url=config.nvidia_base_url,
+                )
+            )
+        if config.fake_provider_enabled:
+            registry.register(
+                FakeProvider(
+                    latency=config.fake_provider_latency,
+                    jitter=config.fake_provider_jitter,
+                    failure_rate=config.fake_provider_failure_rate,
+                )
+            )
+        if not registry.default_available:
+            logger.error(
+                "Default provider is not configured",
+                extra={"provider": config.story_provider},
+            )
+        return registry
@@ -0,0 +1,307 @@
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+from fastapi import Request
+from pymongo import ReturnDocument
+
+import mongodb
+import providers
+import rate_limit
+import settings
+
+RATE_LIMIT_MONGO_DB_COLLECTION = "rate_limits"
+LLM_USAGE_MONGO_DB_COLLECTION = "llm_usage"
+
+_config = settings.get_settings()
+
+# memory zählt pro Worker, mongo teilt die Limits zwischen allen Workern
+QUOTA_BACKEND = _config.quota_backend
+# Generierungen pro Minute und Client (API-Key oder IP), 0 schaltet das Limit ab
+CLIENT_GENERATIONS_PER_MINUTE = _config.client_generations_per_minute
+# So viele Generierungen darf ein Client direkt hintereinander starten
+CLIENT_GENERATION_BURST = _config.client_generation_burst
+# Tagesbudgets pro Client (UTC-Tag), 0 bedeutet unbegrenzt
+CLIENT_DAILY_TOKEN_BUDGET = _config.client_daily_token_budget
+CLIENT_DAILY_COST_BUDGET = _config.client_daily_cost_budget
+# Preis pro 1.000 Tokens je Anbieter, z.B. "google=0.0004,nvidia=0.0002"
+PROVIDER_PRICE_PER_1K_TOKENS = _config.provider_price_per_1k_tokens
+# Nur hinter einem eigenen Proxy aktivieren, sonst kann jeder seine IP wählen
+TRUST_FORWARDED_FOR = _config.trust_forwarded_for
+
+logger = logging.getLogger(__name__)
+
+# The client whose generation is running, for attributing provider usage
+current_client: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "current_client", default=None
+)
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, message: str, retry_after: float, reason: str):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+def client_key(request: Request) -> str:
+    """Identify the client by API key, or by IP address without one.
+
+    API keys are hashed, so they never end up in the database or the logs.
+    """
+    if api_key := request.headers.get("x-api-key"):
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:24]
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if TRUST_FORWARDED_FOR and forwarded_for:
+        return "ip:" + forwarded_for.split(",")[0].strip()
+    return "ip:" + (request.client.host if request.client else "unknown")
+
+
+def _today() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).date().isoformat()
+
+
+def _seconds_until_midnight() -> float:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    midnight = datetime.datetime.combine(
+        now.date() + datetime.timedelta(days=1),
+        datetime.time(),
+        tzinfo=datetime.timezone.utc,
+    )
+    return (midnight - now).total_seconds()
+
+
+class QuotaStore:
+    """Token buckets and daily usage per client"""
+
+    async def take(self, key: str, rate: float, capacity: float, cost: float) -> float:
+        """Take ``cost`` tokens from the client's bucket; if there are not
+        enough, take nothing and return the seconds to wait.
+
+        A cost above ``capacity`` only needs a full bucket and leaves it in
+        debt, so large batches are possible but slow the client down after.
+        """
+        raise NotImplementedError
+
+    async def usage(self, day: str, key: str) -> Tuple[int, float]:
+        """Tokens and cost the client used on ``day``"""
+        raise NotImplementedError
+
+    async def add_usage(self, day: str, key: str, tokens: int, cost: float):
+        raise NotImplementedError
+
+
+class MemoryQuotaStore(QuotaStore):
+    """Limits per worker process; clients beyond ``max_clients`` are forgotten,
+    least recently seen first"""
+
+    def __init__(self, max_clients: int = 10000):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, rate_limit.TokenBucket]" = OrderedDict()
+        self._usage: Dict[Tuple[str, str], Tuple[int, float]] = {}
+
+    async def take(self, key, rate, capacity, cost):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = rate_limit.TokenBucket(rate, capacity)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key)
+        return bucket.try_take(cost, required=min(cost, capacity))
+
+    async def usage(self, day, key):
+        return self._usage.get((day, key), (0, 0.0))
+
+    async def add_usage(self, day, key, tokens, cost):
+        used_tokens, used_cost = self._usage.get((day, key), (0, 0.0))
+        if (day, key) not in self._usage:
+            # Ein neuer Tag: die Zähler der Vortage werden nicht mehr gebraucht
+            for old in [entry for entry in self._usage if entry[0] != day]:
+                del self._usage[old]
+        self._usage[(day, key)] = (used_tokens + tokens, used_cost + cost)
+
+
+class MongoQuotaStore(QuotaStore):
+    """Limits shared by all workers of a deployment.
+
+    Each bucket is one document that is refilled and debited in a single
+    atomic ``find_one_and_update`` with an update pipeline, so concurrent
+    workers never both spend the last token.
+    """
+
+    @property
+    def buckets(self):
+        return mongodb.db_async[RATE_LIMIT_MONGO_DB_COLLECTION]
+
+    @property
+    def usage_collection(self):
+        return mongodb.db_async[LLM_USAGE_MONGO_DB_COLLECTION]
+
+    async def take(self, key, rate, capacity, cost):
+        now = time.time()
+        elapsed = {"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated", now]}]}]}
+        refilled = {
+            "$min": [
+                capacity,
+                {
+                    "$add": [
+                        {"$ifNull": ["$tokens", capacity]},
+                        {"$multiply": [elapsed, rate]},
+                    ]
+                },
+            ]
+        }
+        bucket = await self.buckets.find_one_and_update(
+            {"_id": key},
+            [
+                {"$set": {"tokens": refilled, "updated": now}},
+                {"$set": {"allowed": {"$gte": ["$tokens", min(cost, capacity)]}}},
+                {
+                    "$set": {
+                        "tokens": {
+                            "$cond": [
+                                "$allowed",
+                                {"$subtract": ["$tokens", cost]},
+                                "$tokens",
+                            ]
+                        },
+                        # Für den TTL-Index: ein wieder voller Bucket kann weg
+                        "expires": datetime.datetime.fromtimestamp(
+                            now + (capacity + cost) / rate, datetime.timezone.utc
+                        ),
+                    }
+                },
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return 0.0
+        return (min(cost, capacity) - bucket["tokens"]) / rate
+
+    async def usage(self, day, key):
+        entry = await self.usage_collection.find_one({"_id": f"{day}:{key}"})
+        if entry is None:
+            return 0, 0.0
+        return entry.get("tokens", 0), entry.get("cost", 0.0)
+
+    async def add_usage(self, day, key, tokens, cost):
+        await self.usage_collection.update_one(
+            {"_id": f"{day}:{key}"},
+            {
+                "$inc": {"tokens": tokens, "cost": cost},
+                "$setOnInsert": {
+                    "client": key,
+                    "day": day,
+                    "expires": datetime.datetime.now(datetime.timezone.utc)
+                    + datetime.timedelta(days=2),
+                },
+            },
+            upsert=True,
+        )
+
+
+async def create_indexes():
+    if QUOTA_BACKEND == "mongo":
+        store = MongoQuotaStore()
+        await asyncio.gather(
+            store.buckets.create_index("expires", expireAfterSeconds=0),
+            store.usage_collection.create_index("expires", expireAfterSeconds=0),
+        )
+
+
+def store_from_environment() -> QuotaStore:
+    if QUOTA_BACKEND == "mongo":
+        return MongoQuotaStore()
+    return MemoryQuotaStore()
+
+
+class ClientQuotas:
+    """Per-client generation rate limit and daily token/cost budgets.
+
+    ``check`` runs before a generation starts and raises ``QuotaExceeded``
+    right away instead of letting the request wait. The budgets are charged
+    afterwards with the usage the providers report, see ``record_usage``.
+    """
+
+    def __init__(
+        self,
+        store: QuotaStore,
+        generations_per_minute: float = CLIENT_GENERATIONS_PER_MINUTE,
+        burst: float = CLIENT_GENERATION_BURST,
+        daily_token_budget: int = CLIENT_DAILY_TOKEN_BUDGET,
+        daily_cost_budget: float = CLIENT_DAILY_COST_BUDGET,
+        prices_per_1k_tokens: Optional[Dict[str, float]] = None,
+    ):
+        self.store = store
+        self.generations_per_minute = generations_per_minute
+        self.burst = burst
+        self.daily_token_budget = daily_token_budget
+        self.daily_cost_budget = daily_cost_budget
+        self.prices_per_1k_tokens = (
+            prices_per_1k_tokens
+            if prices_per_1k_tokens is not None
+            else providers.parse_provider_settings(PROVIDER_PRICE_PER_1K_TOKENS)
+        )
+        self._recordings: Set[asyncio.Task] = set()
+        self.rejected = {"rate": 0, "budget": 0}
+
+    async def check(self, client: str, generations: int = 1):
+        """Admit ``generations`` for the client or raise ``QuotaExceeded``.
+
+        The client is remembered for the rest of the request, so the tokens
+        of the generations it starts are charged to it.
+        """
+        if self.daily_token_budget or self.daily_cost_budget:
+            tokens, cost = await self.store.usage(_today(), client)
+            if (self.daily_token_budget and tokens >= self.daily_token_budget) or (
+                self.daily_cost_budget and cost >= self.daily_cost_budget
+            ):
+                self.rejected["budget"] += 1
+                raise QuotaExceeded(
+                    "Das Tagesbudget für Geschichten ist aufgebraucht.",
+                    _seconds_until_midnight(),
+                    "budget",
+                )
+
+        if self.generations_per_minute > 0:
+            wait = await self.store.take(
+                client, self.generations_per_minute / 60, self.burst, generations
+            )
+            if wait:
+                self.rejected["rate"] += 1
+                raise QuotaExceeded(
+                    "Zu viele Generierungen. Bitte später erneut versuchen.",
+                    wait,
+                    "rate",
+                )
+
+        current_client.set(client)
+
+    def cost(self, provider: str, tokens: int) -> float:
+        return tokens / 1000 * self.prices_per_1k_tokens.get(provider, 0.0)
+
+    def record_usage(self, provider: str, prompt_tokens: int, response_tokens: int):
+        """Usage listener for ``providers.usage_listeners``"""
+        client = current_client.get()
+        if client is None or not (self.daily_token_budget or self.daily_cost_budget):
+            return
+        tokens = prompt_tokens + response_tokens
+
+        async def record():
+            try:
+                await self.store.add_usage(
+                    _today(), client, tokens, self.cost(provider, tokens)
+                )
+            except Exception:
+                logger.exception("Could not record LLM usage", extra={"client": client})
+
+        task = asyncio.get_running_loop().create_task(record())
+        self._recordings.add(task)
+        task.add_done_callback(self._recordings.discard)
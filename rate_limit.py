@@ -0,0 +1,44 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """Token bucket refilled at ``rate`` tokens per second up to ``capacity``"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, tokens: float = 1, required: Optional[float] = None) -> float:
+        """Take tokens if available; otherwise return the seconds to wait.
+
+        With ``required`` below ``tokens``, that many are enough to proceed and
+        the bucket goes into debt, e.g. for requests larger than the capacity.
+        """
+        required = tokens if required is None else required
+        self._refill()
+        if self.tokens >= required:
+            self.tokens -= tokens
+            return 0.0
+        return (required - self.tokens) / self.rate
+
+
+class AsyncRateLimiter:
+    """Waits until a call may start so that at most ``rate`` start per second"""
+
+    def __init__(self, rate: float, burst: float = 1):
+        self._bucket = TokenBucket(rate, burst)
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while wait := self._bucket.try_take():
+                await asyncio.sleep(wait)
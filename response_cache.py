@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from fastapi import Request, Response
+
+import serialization
+
+
+def serialize(payload: Any) -> Tuple[bytes, str]:
+    """Serialize a payload to a JSON body and its strong ETag"""
+    body = serialization.dumps(payload)
+    return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def json_response(
+    request: Request, body: bytes, etag: str, cache_control: str = "no-cache"
+) -> Response:
+    """JSON response with ETag; a matching If-None-Match gets a bodyless 304"""
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+class ResponseCache:
+    """Short-lived cache for one pre-serialized JSON response.
+
+    ``get`` rebuilds at most once at a time. ``invalidate`` bumps a generation
+    counter, so a rebuild that started before a write does not store its
+    possibly outdated result.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entry: Optional[Tuple[float, bytes, str]] = None
+        self._generation = 0
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        self._generation += 1
+        self._entry = None
+
+    def _fresh_entry(self):
+        if self._entry and self._entry[0] > time.monotonic():
+            return self._entry[1], self._entry[2]
+        return None
+
+    async def get(self, build: Callable[[], Awaitable[Any]]) -> Tuple[bytes, str]:
+        if entry := self._fresh_entry():
+            self.hits += 1
+            return entry
+
+        async with self._lock:
+            if entry := self._fresh_entry():
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            generation = self._generation
+            body, etag = serialize(await build())
+            if generation == self._generation:
+                self._entry = (time.monotonic() + self.ttl_seconds, body, etag)
+            return body, etag
+
+
+class BodyCache:
+    """LRU of pre-serialized JSON bodies and their ETags, by key.
+
+    Only for documents that never change once written; ``discard`` removes
+    an entry when the document is deleted.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[bytes, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, body: bytes, etag: str):
+        self._entries[key] = (body, etag)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+
+import metrics
+import providers
+import settings
+
+_config = settings.get_settings()
+
+ROUTING_ORDER = _config.routing_order
+PROVIDER_TIMEOUT_SECONDS = _config.provider_timeout_seconds
+# z.B. "google=60,nvidia=90"; überschreibt PROVIDER_TIMEOUT_SECONDS je Anbieter
+PROVIDER_TIMEOUTS = _config.provider_timeouts
+CIRCUIT_FAILURE_THRESHOLD = _config.circuit_failure_threshold
+CIRCUIT_RESET_SECONDS = _config.circuit_reset_seconds
+HEDGE_ENABLED = _config.hedge_enabled
+# Ohne genug Messwerte für ein p95 wird nach dieser Zeit abgesichert
+HEDGE_DEFAULT_DELAY_SECONDS = _config.hedge_default_delay_seconds
+HEDGE_MIN_SAMPLES = _config.hedge_min_samples
+
+logger = logging.getLogger(__name__)
+
+
+class NoProviderAvailable(Exception):
+    status_code = 503
+
+
+class LatencyTracker:
+    """Latencies of the last ``size`` successful calls of one provider"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * percentile / 100))
+        return samples[index]
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures.
+
+    While open, calls are skipped. After ``reset_seconds`` a single trial
+    call is let through (half-open); its outcome closes or re-opens it.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = CIRCUIT_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def cancel_trial(self):
+        """The trial call was cancelled without an outcome"""
+        self._trial_running = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_running = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+
+class ProviderRouter:
+    """Routes generations across providers with failover and hedging.
+
+    The requested (or default) provider is tried first, then the remaining
+    providers of ``order``. Providers whose circuit breaker is open are
+    skipped. With hedging enabled, a second provider is started once the
+    first has been running longer than its p95 latency, and whichever
+    finishes first wins.
+    """
+
+    def __init__(
+        self,
+        registry: providers.ProviderRegistry,
+        order: Optional[List[str]] = None,
+        timeouts: Optional[Dict[str, float]] = None,
+        default_timeout: float = PROVIDER_TIMEOUT_SECONDS,
+        hedge: bool = HEDGE_ENABLED,
+        hedge_default_delay: float = HEDGE_DEFAULT_DELAY_SECONDS,
+        hedge_min_samples: int = HEDGE_MIN_SAMPLES,
+    ):
+        self.registry = registry
+        self.order = (
+            order
+            if order is not None
+            else [name for name in ROUTING_ORDER.split(",") if name.strip()]
+        )
+        self.timeouts = (
+            timeouts
+            if timeouts is not None
+            else providers.parse_provider_settings(PROVIDER_TIMEOUTS)
+        )
+        self.default_timeout = default_timeout
+        self.hedge = hedge
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.failovers = 0
+        self.hedges = 0
+
+    def latency(self, name: str) -> LatencyTracker:
+        return self.latencies.setdefault(name, LatencyTracker())
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        return self.breakers.setdefault(name, CircuitBreaker())
+
+    def candidates(self, provider: Optional[str] = None) -> List[str]:
+        """Providers to try, in order. Providers outside ``order`` (e.g. the
+        fake provider) never fail over to real backends."""
+        first = self.registry.get(provider).name
+        if first not in self.order:
+            return [first]
+        names = self.registry.names()
+        return [first] + [
+            name for name in self.order if name != first and name in names
+        ]
+
+    def _timeout(self, name: str) -> float:
+        return self.timeouts.get(name, self.default_timeout)
+
+    def _hedge_delay(self, name: str) -> float:
+        latency = self.latency(name)
+        if len(latency) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return latency.percentile(95)
+
+    async def _call(self, name: str, prompt: str) -> str:
+        breaker = self.breaker(name)
+        if not breaker.allow():
+            raise NoProviderAvailable(f"Circuit Breaker für '{name}' ist offen.")
+        start = time.monotonic()
+        try:
+            text = await asyncio.wait_for(
+                self.registry.get(name).generate(prompt), timeout=self._timeout(name)
+            )
+        except asyncio.CancelledError:
+            # Lost a hedge race: neither a success nor a failure
+            breaker.cancel_trial()
+            metrics.LLM_DURATION.labels(name, "cancelled").observe(
+                time.monotonic() - start
+            )
+            raise
+        except Exception:
+            breaker.record_failure()
+            metrics.LLM_DURATION.labels(name, "error").observe(time.monotonic() - start)
+            raise
+        breaker.record_success()
+        duration = time.monotonic() - start
+        self.latency(name).record(duration)
+        metrics.LLM_DURATION.labels(name, "ok").observe(duration)
+        return text
+
+    def _available(self, provider: Optional[str]) -> List[str]:
+        names = [
+            name
+            for name in self.candidates(provider)
+            if self.breaker(name).state != "open"
+        ]
+        if not names:
+            raise NoProviderAvailable(
+                "Kein LLM-Anbieter verfügbar, alle Circuit Breaker sind offen."
+            )
+        return names
+
+    async def generate(self, prompt: str, provider: Optional[str] = None) -> str:
+        names = self._available(provider)
+        if self.hedge and len(names) > 1:
+            return await self._generate_hedged(prompt, names)
+
+        last_error = None
+        for index, name in enumerate(names):
+            if index > 0:
+                self.failovers += 1
+            try:
+                return await self._call(name, prompt)
+            except Exception as e:
+                logger.warning(
+                    "Provider failed", extra={"provider": name, "error": repr(e)}
+                )
+                last_error = e
+        raise last_error
+
+    async def _generate_hedged(self, prompt: str, names: List[str]) -> str:
+        pending = {asyncio.create_task(self._call(names[0], prompt))}
+        remaining = list(names[1:])
+        last_error = None
+        try:
+            delay = self._hedge_delay(names[0])
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=delay if remaining else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning("Provider failed", extra={"error": repr(last_error)})
+
+                # Slow (timeout) or failed: start the next provider
+                if remaining and (not done or not pending):
+                    name = remaining.pop(0)
+                    if done:
+                        self.failovers += 1
+                    else:
+                        self.hedges += 1
+                    pending.add(asyncio.create_task(self._call(name, prompt)))
+                    delay = self._hedge_delay(name)
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(
+        self, prompt: str, provider: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream from the first provider that produces a chunk; once text
+        has been sent, errors are passed on instead of switching providers.
+
+        The provider timeout applies to the first chunk and to every gap
+        between chunks, so a stalled stream fails like a stalled call.
+        """
+        last_error = None
+        for name in self._available(provider):
+            breaker = self.breaker(name)
+            if not breaker.allow():
+                continue
+            started = False
+            start = time.monotonic()
+            chunks = self.registry.get(name).stream(prompt)
+            try:
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(
+                            chunks.__anext__(), timeout=self._timeout(name)
+                        )
+                    except StopAsyncIteration:
+                        break
+                    if not started:
+                        started = True
+                        metrics.LLM_TIME_TO_FIRST_TOKEN.labels(name).observe(
+                            time.monotonic() - start
+                        )
+                    yield chunk
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.cancel_trial()
+                metrics.LLM_DURATION.labels(name, "cancelled").observe(
+                    time.monotonic() - start
+                )
+                raise
+            except Exception as e:
+                breaker.record_failure()
+                metrics.LLM_DURATION.labels(name, "error").observe(
+                    time.monotonic() - start
+                )
+                if started:
+                    raise
+                logger.warning(
+                    "Provider failed", extra={"provider": name, "error": repr(e)}
+                )
+                last_error = e
+                self.failovers += 1
+                continue
+            finally:
+                await chunks.aclose()
+            breaker.record_success()
+            metrics.LLM_DURATION.labels(name, "ok").observe(time.monotonic() - start)
+            return
+        raise last_error or NoProviderAvailable(
+            "Kein LLM-Anbieter verfügbar, alle Circuit Breaker sind offen."
+        )
@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import compression
+import settings
+import story
+
+_config = settings.get_settings()
+
+# mongo nutzt den Textindex der story_search-Collection, memory einen Index im
+# Prozess (für die In-Memory-Collections der Benchmarks)
+STORY_SEARCH_BACKEND = _config.story_search_backend
+STORY_SEARCH_SNIPPET_CHARS = _config.story_search_snippet_chars
+
+
+class StorySearchHit(story.StorySummary):
+    snippet: str = ""
+    score: float = 0
+
+
+def snippet(text: str, terms: List[str], size: int = STORY_SEARCH_SNIPPET_CHARS):
+    """A window of ``size`` characters around the first matching term"""
+    folded = text.casefold()
+    positions = [position for term in terms if (position := folded.find(term)) >= 0]
+    start = max(0, min(positions) - size // 3) if positions else 0
+    # Nicht mitten im Wort beginnen oder enden
+    if start > 0:
+        start = text.find(" ", start) + 1 or start
+    end = start + size
+    if end < len(text):
+        end = text.rfind(" ", start, end) if " " in text[start:end] else end
+    window = " ".join(text[start:end].split())
+    return ("…" if start > 0 else "") + window + ("…" if end < len(text) else "")
+
+
+def filter_query(
+    location: Optional[str] = None,
+    educational_topic: Optional[str] = None,
+    age_group: Optional[str] = None,
+    character: Optional[str] = None,
+) -> dict:
+    query = {}
+    if location:
+        query["request.location"] = location
+    if educational_topic:
+        query["request.educational_topic"] = educational_topic
+    if age_group:
+        query["request.age_group"] = age_group
+    if character:
+        query["$or"] = [
+            {"request.characters.name": character},
+            {"request.creatures.name": character},
+        ]
+    return query
+
+
+class StorySearch:
+    """Full-text search over stories, returning snippets instead of texts"""
+
+    async def search(
+        self, text: Optional[str], filters: dict, limit: int, offset: int = 0
+    ) -> Tuple[List[StorySearchHit], bool]:
+        """One page of hits and whether there are more.
+
+        ``filters`` holds the keyword arguments of ``filter_query``.
+        """
+        raise NotImplementedError
+
+    def add(self, new_story: story.Story):
+        pass
+
+    def remove(self, story_id: str):
+        pass
+
+
+def _hit(document: dict, terms: List[str], score: float) -> StorySearchHit:
+    text = compression.decompress_text(document.get("text") or "")
+    return StorySearchHit(
+        **story.summarize(document),
+        snippet=snippet(text, terms),
+        score=score,
+    )
+
+
+def search_filter_query(
+    location: Optional[str] = None,
+    educational_topic: Optional[str] = None,
+    age_group: Optional[str] = None,
+    character: Optional[str] = None,
+) -> dict:
+    """Like ``filter_query``, for the documents of ``Story.search_document``"""
+    query = {
+        "location": location,
+        "educational_topic": educational_topic,
+        "age_group": age_group,
+        "names": character,
+    }
+    return {key: value for key, value in query.items() if value}
+
+
+class MongoStorySearch(StorySearch):
+    """Uses the ``story_search`` text index created in ``mongodb.create_indexes``.
+
+    Text queries run against the small search documents and only the stories
+    of the page are read afterwards; filters alone query the stories.
+    """
+
+    async def search(self, text, filters, limit, offset=0):
+        terms = story.search_terms(text or "")
+        if not terms:
+            cursor = (
+                story.Story.collection()
+                .find(filter_query(**filters), story.STORY_PROJECTION)
+                .sort("_id", -1)
+                .skip(offset)
+                .limit(limit + 1)
+            )
+            documents = await cursor.to_list(length=limit + 1)
+            hits = [_hit(document, terms, 0) for document in documents[:limit]]
+            return hits, len(documents) > limit
+
+        query = search_filter_query(**filters)
+        query["$text"] = {"$search": " ".join(terms)}
+        score = {"$meta": "textScore"}
+        cursor = (
+            story.search_collection()
+            .find(query, {"_id": 0, "id": 1, "score": score})
+            .sort([("score", score), ("_id", -1)])
+            .skip(offset)
+            .limit(limit + 1)
+        )
+        matches = await cursor.to_list(length=limit + 1)
+        page = matches[:limit]
+        cursor = story.Story.collection().find(
+            {"id": {"$in": [match["id"] for match in page]}}, story.STORY_PROJECTION
+        )
+        documents = {document["id"]: document async for document in cursor}
+        hits = [
+            _hit(documents[match["id"]], terms, match["score"])
+            for match in page
+            if match["id"] in documents
+        ]
+        return hits, len(matches) > limit
+
+
+class MemoryStorySearch(StorySearch):
+    """Inverted index in the process, for collections without ``$text``.
+
+    Loaded with one scan on the first search, then kept current through
+    ``add`` and ``remove``. Scoring is a plain sum of the inverse document
+    frequencies of the matched terms.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+        self._terms: Dict[str, List[str]] = {}
+        self._documents: Dict[str, dict] = {}
+        self._order: Dict[str, int] = {}
+        self._sequence = itertools.count()
+        self._loaded = False
+        self._lock = asyncio.Lock()
+
+    def _index(self, document: dict, terms: List[str]):
+        story_id = document["id"]
+        self.remove(story_id)
+        request = document.get("request") or {}
+        names = [
+            c.get("name", "")
+            for c in (request.get("characters") or [])
+            + (request.get("creatures") or [])
+        ]
+        terms = list(
+            dict.fromkeys(
+                terms + story.search_terms(request.get("location") or "", *names)
+            )
+        )
+        self._documents[story_id] = {"id": story_id, "request": request}
+        self._terms[story_id] = terms
+        self._order[story_id] = next(self._sequence)
+        for term in terms:
+            self._postings[term].add(story_id)
+
+    async def _load(self):
+        async with self._lock:
+            if self._loaded:
+                return
+            cursor = story.Story.collection().find({}).sort("_id", 1)
+            async for document in cursor:
+                terms = document.get("search_terms") or story.search_terms(
+                    compression.decompress_text(document.get("text") or "")
+                )
+                self._index(document, terms)
+            self._loaded = True
+
+    def add(self, new_story: story.Story):
+        if self._loaded:
+            self._index(
+                new_story.model_dump(include={"id", "request"}),
+                story.search_terms(new_story.text),
+            )
+
+    def remove(self, story_id: str):
+        for term in self._terms.pop(story_id, []):
+            self._postings[term].discard(story_id)
+            if not self._postings[term]:
+                del self._postings[term]
+        self._documents.pop(story_id, None)
+        self._order.pop(story_id, None)
+
+    def _matches(self, document: dict, filters: dict) -> bool:
+        request = document["request"]
+        for key in ("location", "educational_topic", "age_group"):
+            if filters.get(key) and request.get(key) != filters[key]:
+                return False
+        if character := filters.get("character"):
+            names = [
+                c.get("name")
+                for c in (request.get("characters") or [])
+                + (request.get("creatures") or [])
+            ]
+            return character in names
+        return True
+
+    async def search(self, text, filters, limit, offset=0):
+        await self._load()
+        terms = story.search_terms(text or "")
+        if terms:
+            scores = defaultdict(float)
+            for term in terms:
+                story_ids = self._postings.get(term, ())
+                idf = math.log(1 + len(self._documents) / max(1, len(story_ids)))
+                for story_id in story_ids:
+                    scores[story_id] += idf
+        else:
+            scores = dict.fromkeys(self._documents, 0.0)
+
+        ranked = sorted(
+            (
+                story_id
+                for story_id in scores
+                if self._matches(self._documents[story_id], filters)
+            ),
+            key=lambda story_id: (-scores[story_id], -self._order[story_id]),
+        )
+        page = ranked[offset : offset + limit]
+
+        # Die Texte für die Ausschnitte kommen mit einer Abfrage aus Mongo
+        cursor = story.Story.collection().find({"id": {"$in": page}})
+        documents = {document["id"]: document async for document in cursor}
+        hits = [
+            _hit(documents[story_id], terms, scores[story_id])
+            for story_id in page
+            if story_id in documents
+        ]
+        return hits, len(ranked) > offset + limit
+
+
+def backend_from_environment() -> StorySearch:
+    if STORY_SEARCH_BACKEND == "memory":
+        return MemoryStorySearch()
+    return MongoStorySearch()
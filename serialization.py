@@ -0,0 +1,79 @@
+import functools
+import json
+import logging
+from typing import Any, List, Type
+
+import pydantic_core
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:  # optional, pydantic-core serializes on its own
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def _default(value: Any):
+    # Pydantic models, datetimes etc. inside plain dicts and lists
+    return pydantic_core.to_jsonable_python(value)
+
+
+def dumps(payload: Any) -> bytes:
+    """Serialize plain data and pydantic models to compact JSON in one pass"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_UTC_Z)
+    return pydantic_core.to_json(payload)
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(Response):
+    """JSON response that skips FastAPI's ``jsonable_encoder`` pass.
+
+    Endpoints return it directly, so the content is serialized exactly once,
+    by orjson (or pydantic-core) instead of being converted to dicts first.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@functools.lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    """``TypeAdapter(List[model])``, built once per model"""
+    return TypeAdapter(List[model])
+
+
+def validate_many(model: Type[BaseModel], documents: List[dict]) -> list:
+    """Validate all documents with one TypeAdapter call.
+
+    Only if that fails are they validated one by one, so a single broken
+    document is logged and skipped instead of failing the whole list.
+    """
+    try:
+        return list_adapter(model).validate_python(documents)
+    except ValidationError:
+        pass
+
+    items = []
+    for document in documents:
+        try:
+            items.append(model.model_validate(document))
+        except ValidationError as e:
+            logger.warning(
+                "Skipping invalid document",
+                extra={
+                    "model": model.__name__,
+                    "id": document.get("id"),
+                    "error": str(e),
+                },
+            )
+    return items
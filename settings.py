@@ -0,0 +1,133 @@
+import functools
+import os
+from typing import Literal, Mapping, Optional
+
+from pydantic import BaseModel, ConfigDict
+
+
+class Settings(BaseModel):
+    """Startup configuration of the whole service.
+
+    Modules keep their constants, e.g. ``routing.ROUTING_ORDER``, but take
+    the values from here. Every field is read from the environment variable
+    of the same name in upper case and validated once, so a typo like
+    ``MONGO_MAX_POOL_SIZE=ten`` fails at startup instead of at the first
+    request.
+    """
+
+    model_config = ConfigDict(frozen=True)
+
+    # Anbieter, der ohne provider-Parameter verwendet wird
+    story_provider: str = "google"
+    # Anbieter ohne API-Key werden nicht registriert
+    google_gemini_api_key: Optional[str] = None
+    nvidia_nemotron_api_key: Optional[str] = None
+    nvidia_base_url: str = "https://integrate.api.nvidia.com/v1"
+    provider_warm_up_timeout: float = 10
+    # Nur für Entwicklung und Benchmarks: liefert immer denselben Text
+    fake_provider_enabled: bool = False
+    fake_provider_latency: float = 0
+    fake_provider_jitter: float = 0
+    fake_provider_failure_rate: float = 0
+
+    mongo_db_url: Optional[str] = None
+    mongo_max_pool_size: int = 100
+    mongo_min_pool_size: int = 5
+    mongo_server_selection_timeout_ms: int = 5000
+    mongo_connect_timeout_ms: int = 5000
+    mongo_socket_timeout_ms: int = 30000
+    # zstd/snappy brauchen zusätzliche Pakete, zlib ist immer verfügbar
+    mongo_compressors: str = "zlib"
+
+    # Anfragen und Caches (main.py, entity_cache.py, story_cache.py)
+    metadata_cache_ttl_seconds: float = 5
+    story_body_cache_max_entries: int = 1024
+    entity_cache_max_entries: int = 1024
+    story_cache_enabled: bool = False
+    story_cache_ttl_seconds: float = 3600
+    story_cache_max_entries: int = 1024
+    story_cache_variants: int = 1
+    batch_max_size: int = 500
+    batch_concurrency: int = 4
+    batch_rate_per_second: float = 2
+    max_concurrent_generations: int = 8
+
+    # Ausfallsicherung zwischen den Anbietern (routing.py)
+    routing_order: str = "google,nvidia"
+    provider_timeout_seconds: float = 120
+    provider_timeouts: str = ""
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30
+    hedge_enabled: bool = False
+    hedge_default_delay_seconds: float = 30
+    hedge_min_samples: int = 20
+
+    # Generierungsaufträge (jobs.py)
+    job_queue_backend: Literal["memory", "mongo"] = "memory"
+    job_workers: int = 4
+    job_queue_max_pending: int = 100
+    job_max_attempts: int = 4
+    job_retry_base_seconds: float = 1
+    job_provider_concurrency: str = ""
+    job_lease_seconds: float = 300
+
+    # Kontingente pro Client (quotas.py)
+    quota_backend: Literal["memory", "mongo"] = "memory"
+    client_generations_per_minute: float = 10
+    client_generation_burst: float = 5
+    client_daily_token_budget: int = 0
+    client_daily_cost_budget: float = 0
+    provider_price_per_1k_tokens: str = ""
+    trust_forwarded_for: bool = False
+
+    # Speicherung und Auslieferung (compression.py, story.py, search.py)
+    story_text_compression: Literal["zlib", "zstd", "none"] = "zlib"
+    story_text_compression_min_bytes: int = 512
+    response_compression_min_bytes: int = 1024
+    response_gzip_level: int = 6
+    response_brotli_quality: int = 5
+    story_migration_batch_size: int = 500
+    story_search_backend: Literal["mongo", "memory"] = "mongo"
+    story_search_snippet_chars: int = 160
+
+    # Live-Feed (live_feed.py)
+    live_feed_queue_size: int = 100
+    live_feed_heartbeat_seconds: float = 15
+    live_feed_pre_images: bool = False
+
+    # Import und Export (bulk.py)
+    bulk_import_chunk_size: int = 500
+    bulk_export_batch_size: int = 500
+    bulk_import_max_errors: int = 1000
+
+    # Vorab generierte Geschichten (pregeneration.py)
+    pregeneration_enabled: bool = False
+    pregeneration_quota: int = 100
+    pregeneration_concurrency: int = 2
+    pregeneration_interval_seconds: float = 300
+    pregeneration_peak: str = "18:30-20:30"
+    pregeneration_timezone: str = ""
+    pregeneration_lease_seconds: float = 900
+    pregeneration_max_age_hours: float = 72
+    pregeneration_recent_stories: int = 200
+    pregeneration_age_group: str = "Kinder"
+
+    # Logging (logs.py)
+    log_level: str = "INFO"
+    log_format: Literal["json", "text"] = "json"
+
+    @classmethod
+    def from_environment(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        return cls(
+            **{
+                name: environ[name.upper()]
+                for name in cls.model_fields
+                if name.upper() in environ
+            }
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """The settings of this process, read on first use"""
+    return Settings.from_environment()
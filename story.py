@@ -1,59 +1,393 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Dict, List, Optional, Tuple
+import asyncio
 import datetime
+import logging
+import re
 
-import mongodb
-import uuid
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 import character
+import compression
 import creature
+import mongodb
+import serialization
+import settings
+from persistence import MongoDocument
 
 STORY_MONGO_DB_COLLECTION = "stories"
+# Suchbegriffe je Geschichte, getrennt von den Geschichten selbst
+STORY_SEARCH_MONGO_DB_COLLECTION = "story_search"
+_config = settings.get_settings()
+
+# Alte Geschichten, die die Migration mit einem Bulk-Write umschreibt
+STORY_MIGRATION_BATCH_SIZE = _config.story_migration_batch_size
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+# Häufige Wörter, die in jeder Geschichte vorkommen und nichts unterscheiden
+_STOP_WORDS = set(
+    "aber als auch auf aus bei das dass dem den der des die ein eine einem "
+    "einen einer eines für hatte ich ihr ihre ist mit nach nicht noch sich sie "
+    "sind und vor war waren was wie wir zum zur and the with".split()
+)
+
+
+def search_terms(*texts: str) -> List[str]:
+    """Distinct, case-folded words of the texts, as stored for text search"""
+    return list(
+        dict.fromkeys(
+            word
+            for text in texts
+            for word in _WORD.findall(text.casefold())
+            if len(word) > 2 and word not in _STOP_WORDS and not word.isdigit()
+        )
+    )
+
 
+class StoredStoryRequest(BaseModel):
+    """A story request as it is saved with a story.
 
-class StoryRequest(BaseModel):
-    characters: List[character.Character]
-    creatures: List[creature.Creature]
+    Stored stories are read back as they are, even imported ones without
+    any character; new requests are checked by ``StoryRequest``.
+    """
+
+    characters: List[character.Character] = []
+    creatures: List[creature.Creature] = []
+    # Gespeicherte Charaktere und Fabelwesen können auch per id referenziert
+    # werden; in der Geschichte bleibt zusätzlich ein knappes Abbild erhalten
+    character_ids: List[str] = []
+    creature_ids: List[str] = []
     location: str
     educational_topic: str
     age_group: str
 
+    def for_storage(self) -> "StoredStoryRequest":
+        """The request as it is saved with the story.
+
+        Characters and creatures referenced by id keep only what lists,
+        summaries and search show; their traits and interests are only
+        needed to render the prompt and stay in their own collections.
+        Inline ones are kept whole, nothing else refers to them.
+        """
+        character_ids = set(self.character_ids)
+        creature_ids = set(self.creature_ids)
+        compact = {"personality_traits": [], "interests": []}
+        return self.model_copy(
+            update={
+                "characters": [
+                    c.model_copy(update=compact) if c.id in character_ids else c
+                    for c in self.characters
+                ],
+                "creatures": [
+                    c.model_copy(update=compact) if c.id in creature_ids else c
+                    for c in self.creatures
+                ],
+            }
+        )
+
+
+class StoryRequest(StoredStoryRequest):
+    @model_validator(mode="after")
+    def _require_character(self):
+        # Ohne Charakter entstünde ein bezahlter Prompt über niemanden
+        if not self.characters and not self.character_ids:
+            raise ValueError(
+                "Mindestens ein Charakter ist nötig, direkt oder per character_ids."
+            )
+        return self
+
+
+class Story(MongoDocument):
+    mongo_db_collection = STORY_MONGO_DB_COLLECTION
+    # The story cache trusts prompt_hash, so clients must not choose it
+    server_fields = ("prompt_hash", "prompt_version")
 
-class Story(BaseModel):
-    id: Optional[str] = None
     created: Optional[datetime.datetime] = datetime.datetime(2024, 11, 2)
-    request: Optional[StoryRequest] = None
+    request: Optional[StoredStoryRequest] = None
     text: str
+    # Hash aus Anbieter und Prompt, unter dem die Geschichte im Story-Cache liegt
+    prompt_hash: Optional[str] = None
+    # Version der Prompt-Vorlage, mit der die Geschichte erzeugt wurde
+    prompt_version: Optional[str] = None
+
+    @field_validator("text", mode="before")
+    @classmethod
+    def _decompress_text(cls, text):
+        return compression.decompress_text(text)
+
+    def _prepare_create(self):
+        super()._prepare_create()
+        self.created = datetime.datetime.now(datetime.timezone.utc)
+
+    def to_document(self) -> dict:
+        document = super().to_document()
+        document["text"] = compression.compress_text(self.text)
+        # The search terms are written to their own collection, see search_document
+        document["search_indexed"] = True
+        return document
+
+    def search_document(self) -> dict:
+        """What the text index needs: the compressed text cannot be indexed,
+        and keeping these words in the story would outweigh the compression"""
+        request = self.request or StoredStoryRequest(
+            location="", educational_topic="", age_group=""
+        )
+        return {
+            "id": self.id,
+            "terms": " ".join(search_terms(self.text)),
+            "location": request.location,
+            "educational_topic": request.educational_topic,
+            "age_group": request.age_group,
+            "names": [c.name for c in request.characters + request.creatures],
+        }
 
     async def create(self):
+        await super().create()
+        await _index_for_search([self])
+        return self
+
+    @classmethod
+    async def insert_many(cls, documents: List["Story"]):
         try:
-            self.id = str(uuid.uuid4())
-            self.created = datetime.datetime.now(datetime.timezone.utc)
-            if await mongodb.stories.insert_one(self.model_dump()):
-                my_story = await mongodb.stories.find_one({"id": self.id})
-                print(my_story)
-                return Story(**my_story)
-            else:
-                raise Exception(
-                    f"Could not create new story in collection '{STORY_MONGO_DB_COLLECTION}'."
-                )
-        except Exception as e:
-            print(
-                f"Could not create new story in collection '{STORY_MONGO_DB_COLLECTION}'. Exception:\n{str(e)}"
+            await super().insert_many(documents)
+        except BulkWriteError as e:
+            failed = {error["index"] for error in e.details["writeErrors"]}
+            await _index_for_search(
+                [d for index, d in enumerate(documents) if index not in failed]
             )
-            raise e
+            raise
+        await _index_for_search(documents)
+        return documents
 
-    async def save(self):
-        try:
-            filter = {"id": self.id}
-
-            new_doc = ({"$set": self.model_dump()},)
-            if update_story := await mongodb.users.update_one(filter, new_doc):
-                return Story(**update_story)
-            else:
-                return None
-        except Exception as e:
-            print(
-                f"Could not update story in collection '{STORY_MONGO_DB_COLLECTION}'. Exception:\n{str(e)}"
+    @classmethod
+    async def delete(cls, id: str) -> bool:
+        deleted = await super().delete(id)
+        if deleted:
+            await search_collection().delete_one({"id": id})
+        return deleted
+
+    @classmethod
+    def from_document(cls, document: dict) -> "Story":
+        """Validate a stored story; stories that were saved before text
+        compression or search terms are rewritten in the background"""
+        my_story = cls.model_validate(document)
+        if my_story.id and _needs_migration(document):
+            _migrate_later(my_story, document["text"])
+        return my_story
+
+    @classmethod
+    def from_documents(cls, documents: List[dict]) -> List["Story"]:
+        """Like ``from_document`` for a whole page, validated in one call"""
+        stories = super().from_documents(documents)
+        outdated = {
+            document.get("id"): document.get("text")
+            for document in documents
+            if _needs_migration(document)
+        }
+        if outdated:
+            for my_story in stories:
+                if my_story.id in outdated:
+                    _migrate_later(my_story, outdated[my_story.id])
+        return stories
+
+
+def search_collection():
+    return mongodb.db_async[STORY_SEARCH_MONGO_DB_COLLECTION]
+
+
+async def _index_for_search(stories: List[Story]):
+    """Write the search documents of stored stories; the stories themselves
+    are saved either way, so a failure is only logged"""
+    if not stories:
+        return
+    try:
+        await search_collection().insert_many(
+            [my_story.search_document() for my_story in stories], ordered=False
+        )
+    except BulkWriteError as e:
+        # Schon vorhandene Suchdokumente sind in Ordnung
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            logger.exception("Could not index stories for search")
+    except Exception:
+        logger.exception("Could not index stories for search")
+
+
+def _needs_migration(document: dict) -> bool:
+    # Stories saved before the search collection have no marker; a story
+    # without any search terms has one too, so it is only migrated once
+    return (
+        compression.needs_migration(document.get("text"))
+        or "search_indexed" not in document
+    )
+
+
+# Stories saved before the search collection may still carry their terms
+STORY_PROJECTION = {"search_terms": 0}
+
+# Auf die Hintergrund-Migration wartende Geschichten samt gelesenem Text,
+# nach Story-id; ein einziger Task arbeitet sie ab
+_pending_migrations: Dict[str, Tuple[Story, object]] = {}
+_migration_task: Optional[asyncio.Task] = None
+
+
+async def _migrate(outdated: List[Tuple[Story, object]]):
+    """Write the search documents and compressed texts of outdated stories,
+    given with the text as it was read, with one bulk write per collection"""
+    await search_collection().bulk_write(
+        [
+            UpdateOne(
+                {"id": my_story.id}, {"$set": my_story.search_document()}, upsert=True
+            )
+            for my_story, _ in outdated
+        ],
+        ordered=False,
+    )
+    # Only rewrites a story if its text is still the one that was read
+    await Story.collection().bulk_write(
+        [
+            UpdateOne(
+                {"id": my_story.id, "text": stored_text},
+                {
+                    "$set": {
+                        "text": compression.compress_text(my_story.text),
+                        "search_indexed": True,
+                    },
+                    "$unset": {"search_terms": ""},
+                },
             )
-            raise e
+            for my_story, stored_text in outdated
+        ],
+        ordered=False,
+    )
+
+
+def _migrate_later(my_story: Story, stored_text):
+    """Queue a story for the background migration. One task drains the
+    queue in bulk writes, so a page full of outdated stories cannot flood
+    the connection pool with a task per story"""
+    global _migration_task
+    _pending_migrations.setdefault(my_story.id, (my_story, stored_text))
+    if _migration_task is None or _migration_task.done():
+        _migration_task = asyncio.get_running_loop().create_task(_migrate_pending())
+
+
+async def _migrate_pending():
+    while _pending_migrations:
+        ids = list(_pending_migrations)[:STORY_MIGRATION_BATCH_SIZE]
+        try:
+            await _migrate([_pending_migrations[id] for id in ids])
+        except Exception:
+            logger.exception("Could not migrate stories", extra={"ids": ids})
+        finally:
+            # Until here a story read again is not queued a second time
+            for id in ids:
+                _pending_migrations.pop(id, None)
+
+
+class StoryMigration:
+    """Migrates every outdated story once after startup.
+
+    Reads only migrate the stories they happen to load, so stories nobody
+    opens would stay out of the search collection. This pages through the
+    stories without ``search_indexed`` in ``_id`` order instead; several
+    workers may run it at once, the writes are idempotent.
+    """
+
+    def __init__(self, batch_size: int = STORY_MIGRATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.migrated = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self) -> int:
+        """Migrate until no outdated story is left; returns how many were"""
+        last_id = None
+        try:
+            while True:
+                query = {"search_indexed": {"$exists": False}}
+                if last_id is not None:
+                    query["_id"] = {"$gt": last_id}
+                documents = (
+                    await Story.collection()
+                    .find(query, STORY_PROJECTION)
+                    .sort("_id", 1)
+                    .limit(self.batch_size)
+                    .to_list(None)
+                )
+                if not documents:
+                    break
+                last_id = documents[-1]["_id"]
+                stored_texts = {d.get("id"): d.get("text") for d in documents}
+                outdated = [
+                    (my_story, stored_texts[my_story.id])
+                    for my_story in serialization.validate_many(Story, documents)
+                    if my_story.id
+                ]
+                if outdated:
+                    await _migrate(outdated)
+                    self.migrated += len(outdated)
+        except Exception:
+            # Lazy migration on reads still covers what is left
+            logger.exception("Could not migrate stories")
+        if self.migrated:
+            logger.info("Migrated stories", extra={"stories": self.migrated})
+        return self.migrated
+
+
+class StorySummary(BaseModel):
+    """Lightweight list view of a story without its text"""
+
+    id: Optional[str] = None
+    created: Optional[datetime.datetime] = None
+    location: Optional[str] = None
+    educational_topic: Optional[str] = None
+    age_group: Optional[str] = None
+    characters: List[str] = []
+    creatures: List[str] = []
+
+    @classmethod
+    def from_document(cls, document: dict):
+        return cls(**summarize(document))
+
+
+def summarize(document: dict) -> dict:
+    """The fields of a ``StorySummary`` as a plain dict.
+
+    Documents read with ``STORY_SUMMARY_PROJECTION`` come straight from our
+    own collection, so list endpoints return this dict without validating it.
+    """
+    request = document.get("request") or {}
+    return {
+        "id": document.get("id"),
+        "created": document.get("created"),
+        "location": request.get("location"),
+        "educational_topic": request.get("educational_topic"),
+        "age_group": request.get("age_group"),
+        "characters": [c.get("name") for c in request.get("characters") or []],
+        "creatures": [c.get("name") for c in request.get("creatures") or []],
+    }
+
+
+# Only the fields StorySummary needs, so Mongo never ships the story text
+STORY_SUMMARY_PROJECTION = {
+    "_id": 1,
+    "id": 1,
+    "created": 1,
+    "request.location": 1,
+    "request.educational_topic": 1,
+    "request.age_group": 1,
+    "request.characters.name": 1,
+    "request.creatures.name": 1,
+}
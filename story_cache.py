@@ -0,0 +1,104 @@
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+import mongodb
+import settings
+import story
+
+_config = settings.get_settings()
+
+STORY_CACHE_ENABLED = _config.story_cache_enabled
+STORY_CACHE_TTL_SECONDS = _config.story_cache_ttl_seconds
+STORY_CACHE_MAX_ENTRIES = _config.story_cache_max_entries
+# Anzahl unterschiedlicher Geschichten, die pro Prompt erzeugt werden, bevor
+# Anfragen aus dem Cache beantwortet werden
+STORY_CACHE_VARIANTS = _config.story_cache_variants
+
+
+class StoryCache:
+    """Content-addressed cache of generated stories.
+
+    Stories are keyed on a hash of the provider and the constructed prompt. The in-memory tier
+    is a TTL/LRU map of prompt hash to stored variants; on a miss it falls
+    back to the ``prompt_hash`` field of the ``stories`` collection. A key
+    only counts as a hit once ``variants`` different stories exist for it, so
+    with ``variants=K`` the first K requests generate and later ones get a
+    random pick out of those K.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = STORY_CACHE_ENABLED,
+        ttl_seconds: float = STORY_CACHE_TTL_SECONDS,
+        max_entries: int = STORY_CACHE_MAX_ENTRIES,
+        variants: int = STORY_CACHE_VARIANTS,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple[float, List[story.Story]]]" = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def key(prompt: str, provider: str) -> str:
+        """Hash of the provider and the prompt: the same prompt sent to
+        another provider is a different story"""
+        normalized = " ".join(prompt.split())
+        return hashlib.sha256(f"{provider}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, stories: List[story.Story]):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, stories)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def _variants(self, key: str) -> List[story.Story]:
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        cursor = (
+            mongodb.stories.find({"prompt_hash": key}, story.STORY_PROJECTION)
+            .sort("created", -1)
+            .limit(self.variants)
+        )
+        stories = [story.Story.from_document(my_story) async for my_story in cursor]
+        self._remember(key, stories)
+        return stories
+
+    async def get(self, key: str) -> Optional[story.Story]:
+        if not self.enabled:
+            return None
+
+        stories = await self._variants(key)
+        if len(stories) >= self.variants:
+            self.hits += 1
+            return random.choice(stories)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, new_story: story.Story):
+        if not self.enabled:
+            return
+
+        entry = self._entries.get(key)
+        if entry and entry[0] > time.monotonic():
+            self._remember(key, (entry[1] + [new_story])[-self.variants :])
+        else:
+            # The story is already in Mongo, the next lookup reloads it there
+            self._entries.pop(key, None)
+
+    def discard(self, story_id: str):
+        for key, (expires, stories) in list(self._entries.items()):
+            remaining = [s for s in stories if s.id != story_id]
+            if len(remaining) != len(stories):
+                self._entries[key] = (expires, remaining)